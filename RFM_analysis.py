@@ -1,7 +1,24 @@
 import streamlit as st
 from streamlit_lottie import st_lottie
-from helpers.funtions import (read_template, load_dataset, load_lottiefile, get_settings)
-from helpers.RFM_functions import (data_preprocessing, make_segmentation, print_results)
+from helpers import metrics
+from helpers.funtions import (read_template, load_dataset, load_dataset_head, load_lottiefile, get_settings,
+                              metrics_panel)
+from helpers.prefetch import prefetch
+from helpers.RFM_functions import (BREAK_METHOD_LABELS, MEMORY_BUDGET, data_preprocessing, data_preprocessing_streamed,
+                                   make_segmentation, null_counts, print_results)
+
+metrics.begin_run("RFM_analysis")
+# ---Load data---
+# Загружаем только колонки, которые используются в анализе; три датасета читаются параллельно,
+# пока выводится шапка страницы. При заданном бюджете памяти (DASHBOARD_MEMORY_BUDGET) таблицы
+# целиком не загружаются: пропуски и RFM-признаки считаются по частям датасетов
+DATASETS = {
+    "customers": ("olist_customers_dataset.csv", ['customer_id', 'customer_unique_id']),
+    "orders": ("olist_orders_dataset.csv", ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp']),
+    "items": ("olist_order_items_dataset.csv", ['order_id', 'order_item_id', 'product_id', 'price']),
+}
+if not MEMORY_BUDGET:
+    datasets = prefetch({name: (load_dataset, fname, columns) for name, (fname, columns) in DATASETS.items()})
 
 col1, col2 = st.columns([2, 5])
 with col1:
@@ -9,10 +26,6 @@ with col1:
     st_lottie(logo, speed=1.5, width=200, height=90)
 with col2:
     st.header("RFM анализ")
-# ---Load data---
-customers_df = load_dataset("olist_customers_dataset.csv")
-orders_df = load_dataset("olist_orders_dataset.csv")
-items_df = load_dataset("olist_order_items_dataset.csv")
 segments = get_settings("RFM/segments.json")
 
 with st.expander("Справка о RFM анализе"):
@@ -25,11 +38,11 @@ with st.expander("Описание таблиц и примеры исходны
     st.divider()
     st.markdown("### Примеры исходных данных")
     st.subheader("list_customers_dataset")
-    st.dataframe(data=customers_df.head(5))
+    st.dataframe(data=load_dataset_head("olist_customers_dataset.csv"))
     st.subheader("olist_orders_dataset")
-    st.dataframe(data=orders_df.head(5))
+    st.dataframe(data=load_dataset_head("olist_orders_dataset.csv"))
     st.subheader("olist_order_items_dataset")
-    st.dataframe(data=items_df.head(5))
+    st.dataframe(data=load_dataset_head("olist_order_items_dataset.csv"))
 
 # --- Section 1---
 st.subheader("1 Выбор колонок и проверка данных")
@@ -41,29 +54,40 @@ pd.DataFrame.isna().sum()
 """)
 
 # ---Filter data---
-customers_df = customers_df[['customer_id', 'customer_unique_id']]
-orders_df_ = orders_df[['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp']]
-items_df = items_df[['order_id', 'order_item_id', 'product_id', 'price']]
+if MEMORY_BUDGET:
+    nulls = {name: null_counts(fname, columns) for name, (fname, columns) in DATASETS.items()}
+else:
+    customers_df = datasets.result("customers")
+    orders_df = datasets.result("orders")
+    items_df = datasets.result("items")
+    customers_df = customers_df[['customer_id', 'customer_unique_id']]
+    orders_df_ = orders_df[['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp']]
+    items_df = items_df[['order_id', 'order_item_id', 'product_id', 'price']]
+    nulls = {"customers": customers_df.isna().sum().rename('NaN'), "orders": orders_df_.isna().sum().rename('NaN'),
+             "items": items_df.isna().sum().rename('NaN')}
 
 col1, col2, col3 = st.columns([4, 5, 4])
 with col1:
     st.markdown("**customers_df**")
     st.caption("olist_customers_dataset")
-    st.table(customers_df.isna().sum().rename('NaN'), )
+    st.table(nulls["customers"], )
 with col2:
     st.markdown("**orders_df**")
     st.caption("olist_orders_dataset")
-    st.table(orders_df_.isna().sum().rename('NaN'), )
+    st.table(nulls["orders"], )
 with col3:
     st.markdown("**items_df**")
     st.caption("olist_order_items_dataset")
-    st.table(items_df.isna().sum().rename('NaN'), )
+    st.table(nulls["items"], )
 # --- Section 2---
 st.subheader("2 Предобработка и объединение исходных таблиц")
 n_days = st.number_input("Выберем временой период в днях для анализа", min_value=30, max_value=None, value=365, step=1)
 with st.expander("Предобработка, фильтрация и объединение таблиц"):
     st.markdown(read_template("RFM/data_preproc.md") % (n_days, n_days))
-df = data_preprocessing(items_df, orders_df, customers_df, n_days)
+if MEMORY_BUDGET:
+    df = data_preprocessing_streamed(n_days)
+else:
+    df = data_preprocessing(items_df, orders_df, customers_df, n_days)
 st.markdown("#### Посмотрим на получившийся датафрейм")
 st.dataframe(df, height=210)
 
@@ -73,18 +97,22 @@ with st.expander("Стратегия разбивки на RFM группы"):
 st.subheader("3 Подбор границ диапазонов для разбивки клиентов на группы")
 st.markdown(
     "Используя слайдеры, подберем границы групп по каждому из RFM признаков, контролируя по графикам распределение значений по двум другим признакам в каждой из групп")
+suggest = st.selectbox("Начальные границы групп", tuple(BREAK_METHOD_LABELS), format_func=BREAK_METHOD_LABELS.get,
+                       key="suggest_bounds")
 # R
 make_segmentation(df, cut_col='days_since_last_order', x='orders_count', y='order_sum', segments=segments, log_y=True,
-                  text='Число дней с последней покупки', key='R')
+                  text='Число дней с последней покупки', key='R', suggest=suggest)
 # F
 make_segmentation(df, cut_col='orders_count', x='days_since_last_order', y='order_sum', segments=segments, log_y=True,
-                  text='Число покупок', key='F')
+                  text='Число покупок', key='F', suggest=suggest)
 # M
 make_segmentation(df, cut_col='order_sum', x='orders_count', y='days_since_last_order', segments=segments, log_y=False,
-                  text='Сумма покупок', key='M', exp_bins=True)
+                  text='Сумма покупок', key='M', exp_bins=True, suggest=suggest)
 # segmentation results
 print_results(df, segments)
 
 st.subheader("4 Анализ полученных результатов")
 with st.expander("Анализ полученных результатов и предлагаемые способы взаимодействия с клиентами"):
     st.markdown(read_template("RFM/conclusion.md"))
+
+metrics_panel()
@@ -0,0 +1,48 @@
+"""
+ABC-анализ на синтетической таблице apteka.sales: прежний abc.sql (запрос на каждое
+разбиение) против одного запроса abc_shares.sql и локальной классификации для всех разбиений.
+
+    python -m benchmarks.bench_abc --products 1000000 --rows 3000000
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.common import read_sql
+from benchmarks.synthetic import make_sales, make_sqlite_standin
+from helpers.abc_core import abc_classes
+from helpers.db import make_engine, run_query
+
+SPLITS = ((80, 15), (70, 20), (50, 30))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--rows', type=int, default=3_000_000)
+    parser.add_argument('--url', help='строка подключения к PostgreSQL с таблицей apteka.sales')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        engine = make_engine(args.url) if args.url else \
+            make_sqlite_standin(make_sales(args.rows, args.products), folder)
+
+        start = time.perf_counter()
+        for a, b in SPLITS:
+            run_query(engine, read_sql('abc.sql'), {'a': a, 'b': b})
+        before = time.perf_counter() - start
+        print(f"abc.sql, {len(SPLITS)} splits: {before:.2f} s")
+
+        start = time.perf_counter()
+        shares = run_query(engine, read_sql('abc_shares.sql'))
+        query = time.perf_counter() - start
+        start = time.perf_counter()
+        for a, b in SPLITS:
+            abc_classes(shares, a, b)
+        local = (time.perf_counter() - start) / len(SPLITS)
+        print(f"abc_shares.sql once: {query:.2f} s, classification per split: {local * 1000:.1f} ms")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
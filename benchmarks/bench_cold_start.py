@@ -0,0 +1,97 @@
+"""
+Холодный старт страниц и накладные расходы каждого перезапуска скрипта на статические файлы.
+
+time to first paint - от запуска процесса до готовности первого элемента страницы
+(импорт модулей страниц, анимация Lottie и первый шаблон), каждый замер в отдельном процессе:
+  eager  - st_aggrid и SQLAlchemy импортируются при загрузке модулей, файлы читаются и разбираются заново;
+  lazy   - отложенные импорты и кэш helpers/assets.py без пакета;
+  bundle - то же с заранее собранным пакетом файлов (python -m helpers.assets).
+rerun - чтение всех шаблонов, SQL, настроек и анимаций обеих страниц за один перезапуск:
+  legacy - open + read/json.load на каждом перезапуске; cached - helpers/assets.py (только os.stat).
+
+    python -m benchmarks.bench_cold_start --repeat 5 --reruns 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from helpers import assets
+
+_CHILD = """
+import time
+start = time.perf_counter()
+import json, sys
+import streamlit, pandas
+mode = sys.argv[1]
+if mode == 'eager':
+    import st_aggrid, sqlalchemy, helpers.db
+import helpers.funtions, helpers.RFM_functions, helpers.ABC_functions
+imported = time.perf_counter()
+if mode == 'eager':
+    with open('static/funnel.json', 'r') as f:
+        logo = json.load(f)
+    with open('data/templates/RFM/about_rfm.md', encoding='utf-8') as f:
+        text = f.read()
+else:
+    from helpers import assets
+    assets.BUNDLE_PATH = sys.argv[2]
+    logo = helpers.funtions.load_lottiefile('funnel.json')
+    text = helpers.funtions.read_template('RFM/about_rfm.md')
+painted = time.perf_counter()
+print(json.dumps({'imports': imported - start, 'first_paint': painted - start,
+                  'modules': len(sys.modules)}))
+"""
+
+
+def child(mode: str, bundle_path: str) -> dict:
+    out = subprocess.run([sys.executable, '-c', _CHILD, mode, bundle_path], capture_output=True, text=True,
+                         check=True, env={**os.environ, 'PYTHONPATH': os.getcwd()})
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def legacy_read(path: str, kind: str):
+    if kind == 'text':
+        with open(path, mode='r', encoding='utf-8') as f:
+            return f.read()
+    with open(path, mode='r', encoding=kind.split(':')[1]) as f:
+        return json.load(f)
+
+
+def rerun_seconds(read, files, reruns: int) -> float:
+    start = time.perf_counter()
+    for _ in range(reruns):
+        for path, kind in files:
+            read(path, kind)
+    return (time.perf_counter() - start) / reruns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='число запусков процесса на режим (берётся медиана)')
+    parser.add_argument('--reruns', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        bundle_path = os.path.join(folder, 'assets.bundle.json')
+        missing = os.path.join(folder, 'missing.bundle')
+        n_files = assets.build_bundle(bundle_path)
+        print(f"bundle: {n_files} files, {os.path.getsize(bundle_path) / 1024:.0f} KB")
+        print(f"{'mode':<8}{'imports, s':>12}{'first paint, s':>16}{'modules':>10}")
+        for mode, path in (('eager', missing), ('lazy', missing), ('bundle', bundle_path)):
+            runs = sorted((child(mode, path) for _ in range(args.repeat)), key=lambda r: r['first_paint'])
+            r = runs[len(runs) // 2]
+            print(f"{mode:<8}{r['imports']:>12.3f}{r['first_paint']:>16.3f}{r['modules']:>10}")
+
+    files = assets.asset_files()
+    assets.BUNDLE_PATH = os.devnull
+    legacy = rerun_seconds(legacy_read, files, args.reruns)
+    cached = rerun_seconds(assets.load, files, args.reruns)
+    print(f"rerun ({len(files)} files): legacy {legacy * 1000:.2f} ms, cached {cached * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Пиковое потребление памяти и время выгрузки сегментированных клиентов:
+прежний вариант (to_csv().encode() целиком в памяти) против записи частями
+в файл (helpers/export.py) в форматах CSV, CSV (gzip) и Parquet.
+
+    python -m benchmarks.bench_export --orders 3000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synthetic import make_olist
+from helpers.export import EXPORT_FORMATS, export_frame
+from helpers.rfm_core import aggregate_rfm
+
+
+def segmented(n_orders: int) -> pd.DataFrame:
+    data = make_olist(n_orders, categorical=True)
+    df = aggregate_rfm(data['items'], data['orders'], data['customers'], 730)
+    for key, col in zip("RFM", ('days_since_last_order', 'orders_count', 'order_sum')):
+        df[key] = pd.qcut(df[col].rank(method='first'), 3, labels=['low', 'mid', 'high'])
+    return df
+
+
+def measure(func):
+    """Время выполнения и пик памяти (в отдельных запусках, чтобы tracemalloc не искажал время)"""
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = segmented(args.orders)
+    folder = tempfile.mkdtemp()
+
+    def legacy():
+        return len(df.to_csv().encode("utf-8"))
+
+    def chunked(fmt):
+        def run():
+            path = export_frame(df, fmt, folder=folder)
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        return run
+
+    print(f"{len(df)} customers")
+    print(f"{'variant':<22}{'time, s':>10}{'peak, MB':>12}{'file, MB':>12}")
+    variants = [('to_csv().encode', legacy)] + [(f'chunked {fmt}', chunked(fmt)) for fmt in EXPORT_FORMATS]
+    for name, func in variants:
+        elapsed, peak, size = measure(func)
+        print(f"{name:<22}{elapsed:>10.2f}{peak / 2 ** 20:>12.1f}{size / 2 ** 20:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Объём данных, передаваемых в браузер таблицей get_grid, и время подготовки страницы
+в серверном режиме (helpers/grid_core) в зависимости от числа строк.
+Объём - размер таблицы в формате Arrow, в котором Streamlit передаёт DataFrame компоненту AgGrid:
+вместе с данными передаются словари категориальных колонок.
+
+    python -m benchmarks.bench_grid_payload --rows 10000 100000 1000000
+"""
+import argparse
+import time
+
+from streamlit.dataframe_util import convert_pandas_df_to_arrow_bytes
+
+from benchmarks.synthetic import make_olist
+from helpers.grid_core import GridResult, filter_rows, page_bounds, sort_positions
+from helpers.rfm_core import aggregate_rfm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--page-size', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'full, KB':>12}{'page, KB':>10}{'filter+sort+page, ms':>22}")
+    for n_rows in args.rows:
+        data = make_olist(n_rows, categorical=True)
+        df = aggregate_rfm(data['items'], data['orders'], data['customers'], 730)
+        full_kb = len(convert_pandas_df_to_arrow_bytes(df)) / 1024
+
+        start = time.perf_counter()
+        positions = filter_rows(df, 'u00000', {'orders_count': (1, None), 'order_sum': (10.0, 5000.0)})
+        result = GridResult(df, sort_positions(df, positions, 'order_sum', False))
+        page_start, page_stop, _ = page_bounds(len(result), 3, args.page_size)
+        page_df = result.page(page_start, page_stop)
+        elapsed = time.perf_counter() - start
+        page_kb = len(convert_pandas_df_to_arrow_bytes(page_df)) / 1024
+        print(f"{len(df):>10}{full_kb:>12.0f}{page_kb:>10.1f}{elapsed * 1000:>22.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Сравнение холодной загрузки датасетов: исходный CSV (gzip) против колоночной копии.
+
+Каждое измерение выполняется в отдельном процессе, чтобы пиковый RSS и время
+соответствовали холодному старту страницы. Обе стороны читают одни и те же колонки
+с одинаковыми типами (category и datetime64, как после apply_dtypes).
+
+    python -m benchmarks.bench_load_dataset
+"""
+import json
+import os
+import subprocess
+import sys
+
+from helpers.dataset_store import DATASETS_FOLDER, convert_all
+
+# Колонки, которые выбирает RFM_analysis.py
+RFM_COLUMNS = {
+    'olist_customers_dataset.csv': ['customer_id', 'customer_unique_id'],
+    'olist_orders_dataset.csv': ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp'],
+    'olist_order_items_dataset.csv': ['order_id', 'order_item_id', 'product_id', 'price'],
+}
+
+_CHILD = """
+import json, sys, time
+from benchmarks.common import peak_rss_mb
+from helpers.dataset_store import read_columnar, read_csv_dataset
+mode, fname, columns = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+rss_before = peak_rss_mb()
+start = time.perf_counter()
+if mode == 'csv':
+    df = read_csv_dataset('{folder}' + fname, columns)
+else:
+    df = read_columnar(fname, columns)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'rows': len(df), 'dtypes': df.dtypes.astype(str).tolist(),
+                   'peak_rss_mb': peak_rss_mb(), 'rss_before_mb': rss_before}}))
+"""
+
+
+def run(mode: str, fname: str, columns) -> dict:
+    out = subprocess.run(
+        [sys.executable, '-c', _CHILD.format(folder=DATASETS_FOLDER), mode, fname, json.dumps(columns)],
+        capture_output=True, text=True, check=True, env={**os.environ, 'PYTHONPATH': os.getcwd()})
+    return json.loads(out.stdout)
+
+
+def main():
+    convert_all()
+    print(f"{'dataset':<36}{'mode':<10}{'rows':>10}{'seconds':>10}{'peak RSS, MB':>14}{'growth, MB':>12}")
+    for fname in sorted(os.listdir(DATASETS_FOLDER)):
+        if fname not in RFM_COLUMNS:
+            continue
+        results = [(mode, run(mode, fname, RFM_COLUMNS[fname])) for mode in ('csv', 'columnar')]
+        for mode, r in results:
+            print(f"{fname:<36}{mode:<10}{r['rows']:>10}{r['seconds']:>10.3f}{r['peak_rss_mb']:>14.1f}"
+                  f"{r['peak_rss_mb'] - r['rss_before_mb']:>12.1f}")
+        if results[0][1]['dtypes'] != results[1][1]['dtypes']:
+            print(f"{fname}: dtypes differ {results[0][1]['dtypes']} != {results[1][1]['dtypes']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Загрузка данных страницы ABC/XYZ-анализа: последовательные запросы против параллельной
+предзагрузки (helpers/prefetch.py) на локальной замене БД (SQLite со схемой apteka).
+
+--latency добавляет к каждому запросу задержку сети до удалённой БД (ожидание без нагрузки на CPU,
+как у запроса к Supabase). При параллельной предзагрузке время загрузки страницы приближается
+к времени самого долгого запроса, при последовательной - равно сумме времён всех запросов.
+
+    python -m benchmarks.bench_prefetch --rows 300000 --latency 300
+"""
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from benchmarks.common import read_sql
+from benchmarks.synthetic import make_sales, make_sqlite_standin
+from helpers.ABC_functions import SAMPLE_SQL
+from helpers.db import run_query
+from helpers.prefetch import Prefetch
+
+# Третий независимый запрос страницы (XYZ) в диалекте SQLite: продажи товаров по месяцам
+XYZ_SQLITE = """
+select dr_ndrugs, sum(amount) as amount_sum, sum(amount * amount) as amount_sq_sum
+from (select dr_ndrugs, strftime('%Y-%m', dr_dat) as period, sum(dr_kol) as amount
+      from apteka.sales group by dr_ndrugs, period)
+group by dr_ndrugs
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=300_000)
+    parser.add_argument('--latency', type=float, default=300, help='задержка сети на запрос, мс')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    queries = {"sample": SAMPLE_SQL, "abc_shares": read_sql("abc_shares.sql"), "xyz_sums": XYZ_SQLITE}
+    with tempfile.TemporaryDirectory() as folder:
+        engine = make_sqlite_standin(make_sales(args.rows), folder)
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def network_latency(*_):
+            time.sleep(args.latency / 1000)
+
+        print(f"{'query':<14}{'seconds':>10}")
+        for name, sql in queries.items():
+            start = time.perf_counter()
+            run_query(engine, sql)
+            print(f"{name:<14}{time.perf_counter() - start:>10.3f}")
+
+        pool = ThreadPoolExecutor(max_workers=len(queries))
+        print(f"\n{'mode':<14}{'seconds':>10}")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for sql in queries.values():
+                run_query(engine, sql)
+            print(f"{'serial':<14}{time.perf_counter() - start:>10.3f}")
+
+            start = time.perf_counter()
+            tasks = Prefetch({name: (run_query, engine, sql) for name, sql in queries.items()}, pool)
+            for name in queries:
+                tasks.result(name)
+            print(f"{'prefetch':<14}{time.perf_counter() - start:>10.3f}")
+        pool.shutdown()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
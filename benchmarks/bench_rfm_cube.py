@@ -0,0 +1,63 @@
+"""
+Время применения новых границ RFM-сегментации: прежний путь (три pd.cut и pivot_table
+с lambda-агрегацией) против кодов int8 и куба из 27 ячеек (helpers/rfm_segments).
+Сводные таблицы обоих вариантов сравниваются.
+
+    python -m benchmarks.bench_rfm_cube --customers 5000000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import timed
+from helpers.rfm_segments import RFM_KEYS, SegmentCube, rfm_codes
+
+COLUMNS = ('days_since_last_order', 'orders_count', 'order_sum')
+SEGMENTS = {key: [f"{key}{n}" for n in range(3)] for key in RFM_KEYS}
+
+
+def make_rfm(n: int, seed=0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'customer_unique_id': pd.Categorical.from_codes(np.arange(n), np.arange(n).astype(str)),
+        'days_since_last_order': rng.integers(0, 730, n).astype(np.int32),
+        'orders_count': rng.geometric(0.9, n).astype(np.int32),
+        'order_sum': np.round(rng.lognormal(4.5, 1.0, n), 2),
+    })
+
+
+def legacy(df, boundaries):
+    df = df.copy()
+    for key, col in zip(RFM_KEYS, COLUMNS):
+        df[key] = pd.cut(df[col], [-1, *boundaries[key], df[col].max() + 2], right=False, labels=SEGMENTS[key])
+    return pd.pivot_table(data=df[["R", "F", "M"]], index=["R", "F"], columns="M",
+                          aggfunc=lambda x: f"{len(x)} \n\r {len(x) / len(df.customer_unique_id):.2%}",
+                          fill_value="0 \n\r 0.00%", observed=False)
+
+
+def cube(df, boundaries):
+    return SegmentCube(rfm_codes(df, COLUMNS, boundaries), df['order_sum'].to_numpy()).pivot(SEGMENTS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, nargs='+', default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    boundaries = {"R": (90, 365), "F": (2, 3), "M": (50.0, 300.0)}
+    print(f"{'customers':>10}{'legacy, ms':>12}{'cube, ms':>10}")
+    for n in args.customers:
+        df = make_rfm(n)
+        new, new_seconds = timed(cube, df, boundaries)
+        if args.skip_legacy:
+            print(f"{n:>10}{'-':>12}{new_seconds * 1000:>10.1f}")
+            continue
+        old, old_seconds = timed(legacy, df, boundaries)
+        assert (old.to_numpy() == new.to_numpy()).all(), "pivot tables differ"
+        print(f"{n:>10}{old_seconds * 1000:>12.1f}{new_seconds * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
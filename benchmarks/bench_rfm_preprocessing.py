@@ -0,0 +1,86 @@
+"""
+Сравнение прежней реализации data_preprocessing (merge + apply) с helpers/rfm_core.aggregate_rfm
+на синтетических данных в формате Olist.
+
+    python -m benchmarks.bench_rfm_preprocessing --orders 10000000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_olist
+from helpers.rfm_core import aggregate_rfm
+
+
+def legacy_data_preprocessing(items_df, orders_df, customers_df, ndays) -> pd.DataFrame:
+    """Реализация data_preprocessing до перехода на rfm_core (без st.cache_data)"""
+    items_df['order_sum'] = items_df['price'] * items_df['order_item_id']
+    items_df = items_df.groupby('order_id', observed=True).agg({'order_sum': 'sum'})
+    orders_df = orders_df[~orders_df.order_status.isin(['canceled', 'created', 'unavailable'])]
+    orders_df = orders_df[['order_id', 'customer_id', 'order_purchase_timestamp']]
+    orders_df['order_date'] = pd.to_datetime(orders_df['order_purchase_timestamp']).dt.date
+    orders_df['days_delta'] = (orders_df['order_date'].max() - orders_df['order_date']).apply(lambda x: x.days)
+    orders_df = orders_df[orders_df.days_delta <= ndays]
+    df = orders_df.merge(customers_df, on='customer_id', how='left')
+    df = df.merge(items_df, on='order_id', how='left')[['customer_unique_id', 'order_date', 'order_sum', 'days_delta']]
+    df = df.groupby("customer_unique_id", as_index=False, observed=True) \
+        .agg({"days_delta": ["min", "count"], "order_sum": "sum"})
+    df.columns = ["customer_unique_id", "days_since_last_order", "orders_count", "order_sum"]
+    return df
+
+
+def measure(func, *args, copy_first=False):
+    """
+    Время выполнения и пиковая память (по tracemalloc) вызова func.
+    Время и память меряются отдельными запусками: tracemalloc заметно замедляет аллокации.
+    """
+    def call():
+        return func(args[0].copy(), *args[1:]) if copy_first else func(*args)
+
+    start = time.perf_counter()
+    result = call()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def check_equal(legacy: pd.DataFrame, new: pd.DataFrame):
+    """Проверяет, что обе реализации дают одинаковый результат"""
+    assert len(legacy) == len(new), (len(legacy), len(new))
+    assert (legacy['customer_unique_id'].astype(str).to_numpy() == new['customer_unique_id'].astype(str).to_numpy()).all()
+    assert (legacy['days_since_last_order'].to_numpy() == new['days_since_last_order'].to_numpy()).all()
+    assert (legacy['orders_count'].to_numpy() == new['orders_count'].to_numpy()).all()
+    assert np.allclose(legacy['order_sum'].to_numpy(), new['order_sum'].to_numpy(), rtol=1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, nargs='+', default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument('--ndays', type=int, default=365)
+    parser.add_argument('--categorical', action='store_true',
+                        help='идентификаторы как category, как при чтении из колоночной копии')
+    parser.add_argument('--skip-legacy', action='store_true', help='не запускать прежнюю реализацию')
+    args = parser.parse_args()
+
+    print(f"{'orders':>12}{'implementation':>16}{'seconds':>10}{'peak MB':>10}")
+    for n in args.orders:
+        data = make_olist(n, categorical=args.categorical)
+        new, seconds, peak = measure(aggregate_rfm, data['items'], data['orders'], data['customers'], args.ndays)
+        print(f"{n:>12}{'rfm_core':>16}{seconds:>10.2f}{peak:>10.0f}")
+        if args.skip_legacy:
+            continue
+        # Прежняя реализация изменяет items_df, поэтому передаём ей копию
+        legacy, seconds, peak = measure(legacy_data_preprocessing, data['items'], data['orders'],
+                                        data['customers'], args.ndays, copy_first=True)
+        print(f"{n:>12}{'legacy':>16}{seconds:>10.2f}{peak:>10.0f}")
+        check_equal(legacy, new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+RFM-признаки по датасетам Olist: в памяти (read_dataset + rfm_core.aggregate_rfm) против чтения
+частями с промежуточными данными на диске (helpers/rfm_stream.py) при разных бюджетах памяти.
+
+Синтетические датасеты записываются во временную папку в виде колоночных копий (dataset_store.write_columnar).
+Каждый режим выполняется в отдельном процессе; выводятся время, пиковый RSS процесса и прирост
+пикового RSS над RSS после импорта модулей. Результаты режимов сравниваются побитово.
+
+    python -m benchmarks.bench_rfm_stream --orders 3000000 --budgets 64 256
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import peak_rss_mb
+from helpers.dataset_store import columnar_path, read_dataset, write_columnar
+from helpers.pipeline import RFM_DATASETS
+from helpers.rfm_core import aggregate_rfm
+from helpers.rfm_stream import rfm_from_datasets
+
+
+def run(folder: str, budget: int, ndays: int, out: str):
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if budget:
+        df = rfm_from_datasets(RFM_DATASETS, ndays, budget * 2 ** 20, datasets_folder=folder, columnar_folder=folder,
+                               spill_folder=folder)
+    else:
+        tables = {name: read_dataset(fname, columns, datasets_folder=folder, columnar_folder=folder)
+                  for name, (fname, columns) in RFM_DATASETS.items()}
+        df = aggregate_rfm(tables['items'], tables['orders'], tables['customers'], ndays)
+    elapsed = time.perf_counter() - start
+    label = f'stream {budget} MB' if budget else 'in memory'
+    print(f"{label:<18}{elapsed:>10.2f}{peak_rss_mb():>14.0f}{peak_rss_mb() - baseline:>14.0f}", flush=True)
+    df.to_parquet(out, index=False)
+
+
+def same(left: pd.DataFrame, right: pd.DataFrame) -> bool:
+    if len(left) != len(right):
+        return False
+    if not (left['customer_unique_id'].astype(str).to_numpy() == right['customer_unique_id'].astype(str).to_numpy()).all():
+        return False
+    return all(left[col].dtype == right[col].dtype and np.array_equal(left[col].to_numpy(), right[col].to_numpy())
+               for col in left.columns[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--budgets', type=int, nargs='+', default=[32, 128], help='бюджеты памяти, МБ')
+    parser.add_argument('--ndays', type=int, default=365)
+    parser.add_argument('--run', nargs=3, metavar=('FOLDER', 'BUDGET', 'OUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        folder, budget, out = args.run
+        run(folder, int(budget), args.ndays, out)
+        return
+
+    from benchmarks.synthetic import make_olist
+
+    with tempfile.TemporaryDirectory() as folder:
+        data = make_olist(args.orders, categorical=True)
+        for name, (fname, columns) in RFM_DATASETS.items():
+            write_columnar(data[name][columns], columnar_path(fname, folder))
+        del data
+
+        print(f"{'mode':<18}{'seconds':>10}{'peak RSS, MB':>14}{'growth, MB':>14}")
+        results = []
+        # Каждый режим - в отдельном процессе, чтобы пиковый RSS не зависел от предыдущего запуска
+        for budget in [0, *args.budgets]:
+            out = os.path.join(folder, f'result-{budget}.parquet')
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_rfm_stream', '--ndays', str(args.ndays),
+                            '--run', folder, str(budget), out],
+                           check=True, env={**os.environ, 'PYTHONPATH': os.getcwd()})
+            results.append(pd.read_parquet(out))
+        print('\nresults identical:', all(same(results[0], df) for df in results[1:]))
+
+
+if __name__ == '__main__':
+    main()
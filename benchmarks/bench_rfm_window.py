@@ -0,0 +1,46 @@
+"""
+Время пересчёта RFM-признаков при смене периода n_days: полный расчёт по заказам
+(helpers/rfm_core.aggregate_rfm) против свёртки таблицы дневных агрегатов (rfm_from_daily),
+а также время дополнения таблицы новыми заказами (append_daily_aggregates) против её построения заново.
+Таблица после дополнения сравнивается с построенной заново, признаки за период - с полным расчётом:
+ключи и счётчики должны совпадать точно, суммы - с точностью до порядка суммирования.
+
+    python -m benchmarks.bench_rfm_window --orders 10000000
+"""
+import argparse
+
+
+from benchmarks.common import difference, timed
+from benchmarks.synthetic import make_olist
+from helpers.rfm_core import aggregate_rfm, append_daily_aggregates, build_daily_aggregates, rfm_from_daily
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--ndays', type=int, nargs='+', default=[30, 90, 365, 730])
+    parser.add_argument('--new-share', type=float, default=0.01, help='доля заказов, добавляемых инкрементально')
+    args = parser.parse_args()
+
+    data = make_olist(args.orders, categorical=True)
+    items, orders, customers = data['items'], data['orders'], data['customers']
+
+    timestamps = orders['order_purchase_timestamp']
+    old_orders = orders[timestamps <= timestamps.quantile(1 - args.new_share)]
+    daily, seconds = timed(build_daily_aggregates, items, old_orders, customers)
+    print(f"build daily aggregates: {seconds * 1000:.0f} ms, {len(daily)} rows")
+    daily, seconds = timed(append_daily_aggregates, daily, items, orders, customers)
+    print(f"append {len(orders) - len(old_orders)} new orders: {seconds * 1000:.0f} ms")
+    rebuilt, seconds = timed(build_daily_aggregates, items, orders, customers)
+    print(f"rebuild daily aggregates: {seconds * 1000:.0f} ms, difference with append: {difference(daily, rebuilt)}")
+
+    print(f"{'n_days':>8}{'customers':>12}{'full, ms':>12}{'daily, ms':>12}{'difference':>12}")
+    for ndays in args.ndays:
+        full, full_seconds = timed(aggregate_rfm, items, orders, customers, ndays)
+        windowed, window_seconds = timed(rfm_from_daily, daily, ndays)
+        print(f"{ndays:>8}{len(windowed):>12}{full_seconds * 1000:>12.1f}{window_seconds * 1000:>12.1f}"
+              f"{difference(full, windowed):>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Задержка отрисовки графиков make_segmentation на одно движение слайдера:
+прежний путь (трейс на каждый бин + три seaborn JointGrid) против helpers/rfm_plots.
+Фигуры сериализуются так же, как их отправляет Streamlit (PNG для matplotlib, JSON для Plotly).
+
+    python -m benchmarks.bench_segmentation_render --orders 100000
+"""
+import argparse
+import io
+import time
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from benchmarks.synthetic import make_olist
+from helpers.rfm_core import aggregate_rfm
+from helpers.rfm_plots import histogram_bins, histogram_figure, joint_figure, segment_codes
+
+matplotlib.use('Agg')
+
+# (колонка сегментации, x, y, log_y, exp_bins), как в RFM_analysis.py
+COLUMNS = (
+    ('days_since_last_order', 'orders_count', 'order_sum', True, False),
+    ('orders_count', 'days_since_last_order', 'order_sum', True, False),
+    ('order_sum', 'orders_count', 'days_since_last_order', False, True),
+)
+LABELS = ('low', 'mid', 'high')
+
+
+def legacy_render(df, cut_col, x, y, boundaries, log_y, exp_bins):
+    """Прежняя отрисовка из make_segmentation"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    range_min, range_max = boundaries
+    groups = pd.cut(df[cut_col], [-1, range_min, range_max, df[cut_col].max() + 2], right=False, labels=LABELS)
+    hist_values, bin_edges = np.histogram(df[cut_col], bins=histogram_bins(df[cut_col].to_numpy(), exp_bins))
+    fig = go.Figure()
+    for i in range(len(hist_values)):
+        fig.add_trace(go.Bar(x=[(bin_edges[i] + bin_edges[i + 1]) / 2], y=[hist_values[i]],
+                             marker_color="green", width=(bin_edges[i + 1] - bin_edges[i]) * 0.9,
+                             hoverinfo="text", hovertext=f"{bin_edges[i]:.0f} - {bin_edges[i + 1]:.0f}"))
+    fig.to_json()
+    for n, gr in enumerate(LABELS):
+        data = df[groups == gr]
+        if data.size == 0:
+            continue
+        g = sns.JointGrid(data=data, x=x, y=y, marginal_ticks=True)
+        if log_y:
+            g.ax_joint.set(yscale="log")
+        cax = g.figure.add_axes([.72, .6, .02, .2])
+        g.plot_joint(sns.histplot, discrete=(True, False), cmap="light:green", pmax=.8, cbar=True, cbar_ax=cax)
+        g.plot_marginals(sns.histplot, element="step", color="green")
+        g.figure.savefig(io.BytesIO(), format='png')
+        plt.close(g.figure)
+
+
+def new_render(df, cut_col, x, y, boundaries, log_y, exp_bins):
+    values = df[cut_col].to_numpy()
+    histogram_figure(values, boundaries, cut_col, exp_bins).to_json()
+    joint_figure(df[x].to_numpy(), df[y].to_numpy(), segment_codes(values, boundaries), LABELS, x, y,
+                 log_y).to_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--events', type=int, default=5, help='число движений слайдера на колонку')
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    data = make_olist(args.orders, categorical=True)
+    df = aggregate_rfm(data['items'], data['orders'], data['customers'], 365)
+    df = df[df['order_sum'] > 0]
+
+    print(f"{'column':<24}{'renderer':<10}{'ms / event':>12}")
+    for cut_col, x, y, log_y, exp_bins in COLUMNS:
+        top = float(df[cut_col].max())
+        events = [(top * f, top * (f + 0.5)) for f in np.linspace(0.05, 0.4, args.events)]
+        renderers = (('new', new_render),) if args.skip_legacy else (('legacy', legacy_render), ('new', new_render))
+        for name, render in renderers:
+            start = time.perf_counter()
+            for boundaries in events:
+                render(df, cut_col, x, y, boundaries, log_y, exp_bins)
+            elapsed = (time.perf_counter() - start) / len(events)
+            print(f"{cut_col:<24}{name:<10}{elapsed * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Задержка запросов ABC-анализа на локальной замене БД (SQLite со схемой apteka):
+новый engine на каждый запрос против общего пула, текст с подставленными порогами
+против одного запроса с привязкой параметров.
+
+    python -m benchmarks.bench_select --rows 1000000
+"""
+import argparse
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+
+from benchmarks.common import read_sql
+from benchmarks.synthetic import make_sales, make_sqlite_standin
+from helpers.db import make_engine, run_query
+
+SPLITS = ((80, 15, 5), (70, 20, 10), (50, 30, 20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--url', help='строка подключения к локальной PostgreSQL с таблицей apteka.sales '
+                                      '(по умолчанию - синтетическая SQLite)')
+    args = parser.parse_args()
+
+    sql = read_sql('abc.sql')
+    with tempfile.TemporaryDirectory() as folder:
+        if args.url:
+            pooled = make_engine(args.url)
+        else:
+            pooled = make_sqlite_standin(make_sales(args.rows), folder)
+
+        def fresh_engine():
+            # Так работал прежний select: новый engine на каждый промах кэша
+            if args.url:
+                return create_engine(args.url)
+            engine = create_engine(pooled.url)
+            event.listen(engine, 'connect', lambda c, _: c.execute(f"ATTACH DATABASE '{folder}/apteka.db' AS apteka"))
+            return engine
+
+        print(f"{'mode':<28}{'split':>10}{'ms':>10}")
+        for _ in range(args.repeat):
+            for a, b, c in SPLITS:
+                literal = sql.replace('(:a + :b)', f'({a} + {b})').replace(':a', str(a))
+                start = time.perf_counter()
+                run_query(fresh_engine(), literal)
+                print(f"{'fresh engine, literal SQL':<28}{f'{a}-{b}-{c}':>10}{(time.perf_counter() - start) * 1000:>10.1f}")
+                start = time.perf_counter()
+                run_query(pooled, sql, {'a': a, 'b': b})
+                print(f"{'pooled engine, bound':<28}{f'{a}-{b}-{c}':>10}{(time.perf_counter() - start) * 1000:>10.1f}")
+        pooled.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Потребление памяти (RSS) процессом Streamlit при N одновременных сессиях страницы RFM-анализа.
+Сессии моделируются через streamlit.testing (AppTest) в одном процессе, как на сервере.
+
+legacy - каждая сессия хранит свою сегментированную копию таблицы клиентов
+(как st.session_state["df"] до перехода на общий кэш); shared - общая защищённая от записи
+таблица (rfm_base) и куб сегментов, а в сессии только границы.
+Выводится прирост RSS и объём живых объектов (tracemalloc) в МБ на каждую следующую сессию.
+
+    python -m benchmarks.bench_sessions_rss --sessions 1 10 30 --orders 1000000
+"""
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.common import rss_mb
+
+SCRIPT = """
+import streamlit as st
+import pandas as pd
+from benchmarks.synthetic import make_olist
+from helpers.RFM_functions import data_preprocessing, print_results
+
+@st.cache_resource
+def olist():
+    return make_olist({orders}, categorical=True)
+
+data = olist()
+segments = {{key: [key + str(n) for n in range(3)] for key in "RFM"}}
+df = data_preprocessing(data["items"], data["orders"], data["customers"], 365)
+n = st.session_state.setdefault("n", 0)
+st.session_state["R"] = (90 + n, 300)
+st.session_state["F"] = (2, 3)
+st.session_state["M"] = (50.0, 300.0)
+if "{mode}" == "legacy":
+    segmented = df.copy()
+    for key, col in zip("RFM", ("days_since_last_order", "orders_count", "order_sum")):
+        segmented[key] = pd.cut(segmented[col], [-1, *st.session_state[key], segmented[col].max() + 2],
+                                right=False, labels=segments[key])
+    st.session_state["df"] = segmented
+print_results(df, segments)
+"""
+
+
+def run(mode: str, sessions: list, orders: int):
+    from streamlit.testing.v1 import AppTest
+
+    # Таблица дневных агрегатов сохраняется по относительному пути: работаем во временной папке
+    os.chdir(tempfile.mkdtemp())
+    apps = []
+    baseline = traced_baseline = None
+    # Кроме RSS считаем память живых объектов Python и NumPy: RSS включает и освобождённую,
+    # но не возвращённую аллокатором память промежуточных массивов
+    tracemalloc.start()
+    for n in range(max(sessions)):
+        at = AppTest.from_string(SCRIPT.format(mode=mode, orders=orders), default_timeout=600)
+        # Каждая сессия выбирает свои границы сегмента R
+        at.session_state["n"] = n % 5
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception)
+        apps.append(at)
+        gc.collect()
+        traced = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        if baseline is None:
+            baseline, traced_baseline = rss_mb(), traced
+        if n + 1 in sessions:
+            growth = rss_mb() - baseline
+            retained = (traced - traced_baseline) / max(n, 1)
+            print(f"{mode:<8}{n + 1:>10}{rss_mb():>12.0f}{growth / max(n, 1):>16.1f}{retained:>16.2f}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 30])
+    parser.add_argument('--orders', type=int, default=300_000)
+    parser.add_argument('--mode', choices=['legacy', 'shared'])
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, sorted(args.sessions), args.orders)
+        return
+    print(f"{'mode':<8}{'sessions':>10}{'RSS, MB':>12}{'RSS/session':>16}{'objects/session':>16}")
+    # Каждый режим - в отдельном процессе, чтобы RSS не зависел от предыдущего запуска
+    for mode in ('legacy', 'shared'):
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_sessions_rss', '--mode', mode,
+                        '--orders', str(args.orders), '--sessions', *map(str, args.sessions)],
+                       check=True, env={**os.environ, 'PYTHONPATH': os.getcwd(),
+                            # Скрипт каждой сессии выполняется в своём потоке: без ограничения числа арен
+                            # glibc освобождённая память потоков остаётся в RSS и маскирует разницу
+                            'MALLOC_ARENA_MAX': '2'})
+
+
+if __name__ == '__main__':
+    main()
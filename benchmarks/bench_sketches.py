@@ -0,0 +1,62 @@
+"""
+Точность и время подбора границ RFM-сегментов по скетчам квантилей (helpers/sketches.py)
+в сравнении с точным np.quantile, в том числе для скетчей, объединённых по частям данных.
+Ошибка - отклонение ранга найденной границы от заданного уровня квантиля.
+
+    python -m benchmarks.bench_sketches --customers 10000000 --parts 8
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.common import timed
+from helpers.sketches import DEFAULT_K, KLLSketch, kmeans_breaks, merge_sketches
+
+LEVELS = np.array([1 / 3, 2 / 3])
+
+
+def features(n: int, seed=0) -> dict:
+    """Распределения, похожие на RFM-признаки Olist"""
+    rng = np.random.default_rng(seed)
+    return {
+        'days_since_last_order': rng.integers(0, 730, n).astype(np.float64),
+        'orders_count': rng.geometric(0.9, n).astype(np.float64),
+        'order_sum': np.round(rng.lognormal(4.5, 1.0, n), 2),
+    }
+
+
+def rank_error(sorted_values: np.ndarray, estimates: np.ndarray) -> float:
+    """Наибольшее отклонение доли значений меньше оценки от уровня квантиля"""
+    low = np.searchsorted(sorted_values, estimates, side='left') / len(sorted_values)
+    high = np.searchsorted(sorted_values, estimates, side='right') / len(sorted_values)
+    # Для повторяющихся значений подходит любой ранг из [low, high]
+    return float(np.max(np.maximum(0, np.maximum(low - LEVELS, LEVELS - high))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=1_000_000)
+    parser.add_argument('--parts', type=int, default=8)
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    print(f"{'feature':<24}{'exact, ms':>10}{'sketch, ms':>12}{'rank err':>10}{'merged err':>12}"
+          f"{'kmeans, ms':>12}{'items':>8}")
+    for name, values in features(args.customers).items():
+        exact, exact_seconds = timed(np.quantile, values, LEVELS)
+        sketch, sketch_seconds = timed(lambda: KLLSketch(args.k, seed=0).update(values))
+        parts = [{name: KLLSketch(args.k, seed=n).update(part)}
+                 for n, part in enumerate(np.array_split(values, args.parts))]
+        merged = merge_sketches(parts)[name]
+        _, kmeans_seconds = timed(kmeans_breaks, sketch)
+
+        sorted_values = np.sort(values)
+        error = rank_error(sorted_values, sketch.quantile(LEVELS))
+        merged_error = rank_error(sorted_values, merged.quantile(LEVELS))
+        assert rank_error(sorted_values, exact) < 1e-6
+        print(f"{name:<24}{exact_seconds * 1000:>10.1f}{sketch_seconds * 1000:>12.1f}{error:>10.4f}"
+              f"{merged_error:>12.4f}{kmeans_seconds * 1000:>12.2f}{sum(map(len, sketch.levels)):>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Общие функции бенчмарков: замер времени и памяти, чтение запросов data/SQL/ABC и сравнение результатов.
+"""
+import datetime
+import os
+import resource
+import time
+
+import numpy as np
+import pandas as pd
+
+SQL_FOLDER = 'data/SQL/ABC/'
+
+
+def timed(func, *args):
+    """Результат func(*args) и время вызова, с"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def read_sql(fname: str) -> str:
+    """Текст запроса страницы ABC/XYZ-анализа"""
+    with open(SQL_FOLDER + fname, encoding='utf-8') as f:
+        return f.read()
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def peak_rss_mb() -> float:
+    """
+    Пиковый RSS процесса. В Linux - VmHWM: ru_maxrss сохраняется при exec
+    и включал бы память родительского процесса с синтетическими данными.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 2 ** 10
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def as_text(values: pd.Series) -> pd.Series:
+    """Строковое представление; даты (date из PostgreSQL, datetime64 из DuckDB) - в виде ГГГГ-ММ-ДД"""
+    if pd.api.types.is_datetime64_any_dtype(values) or (len(values) and isinstance(values.iloc[0], datetime.date)):
+        return pd.to_datetime(values).dt.strftime('%Y-%m-%d')
+    return values.astype(str)
+
+
+def difference(left: pd.DataFrame, right: pd.DataFrame, ordered=True) -> str:
+    """
+    Расхождение таблиц: наибольшая разница вещественных колонок или 'differs',
+    если не совпадают размеры или остальные колонки (сравниваются как текст).
+    При ordered=False строки обеих таблиц предварительно сортируются по первой колонке.
+    """
+    if left.shape != right.shape:
+        return 'differs'
+    if not ordered:
+        left, right = (df.sort_values(list(df.columns[:1])).reset_index(drop=True) for df in (left, right))
+    largest = 0.0
+    for i in range(left.shape[1]):
+        a, b = left.iloc[:, i], right.iloc[:, i]
+        numeric = pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b)
+        if numeric and (pd.api.types.is_float_dtype(a) or pd.api.types.is_float_dtype(b)):
+            largest = max(largest, float(np.nanmax(np.abs(a.to_numpy(np.float64) - b.to_numpy(np.float64)),
+                                                   initial=0.0)))
+        elif not np.array_equal(as_text(a).to_numpy(), as_text(b).to_numpy()):
+            return 'differs'
+    return f'{largest:.1e}'
@@ -0,0 +1,291 @@
+"""
+Набор бенчмарков всех путей анализа на синтетических данных с порогами регрессии.
+
+Данные в формате Olist (customers, orders, items) и apteka.sales генерируются для выбранного
+уровня объёма: 10k, 1m или 10m строк (заказов и строк продаж). Этапы - те же функции, которые
+вызывают страницы и пакетный расчёт:
+
+    rfm.*   дневные агрегаты и признаки (data_preprocessing), расчёт по заказам (pipeline),
+            расчёт частями с диска (rfm_stream), разбиение признака на сегменты и графики
+            (make_segmentation), скетчи квантилей, куб сегментов, таблица клиентов (get_segmented_df)
+            и сводная таблица (print_results)
+    abc.*, xyz.*   ABC- и XYZ-классификация в pandas (abc_core)
+    sql.*   запросы data/SQL/ABC: в SQLite-замене БД (helpers/db.py) и в DuckDB по Parquet-снимку;
+            запросы XYZ написаны для PostgreSQL и в SQLite не выполняются
+
+Всё выполняется офлайн. Время этапа - лучшее из --repeat запусков, пиковая память - по tracemalloc
+(helpers/metrics.py) в предшествующем им прогревочном запуске: учитываются массивы NumPy и объекты
+Python, но не буферы Arrow, DuckDB и SQLite. Результаты сравниваются с базовыми значениями из файла --baselines;
+этап, который медленнее или требует больше памяти, чем базовое значение с допуском --tolerance,
+считается регрессией, и скрипт завершается с кодом 1. Базовые значения зависят от машины:
+--update записывает результаты текущего запуска как новые базовые.
+Уровень 1m выполняется несколько минут, 10m - десятки минут и требует нескольких гигабайт памяти.
+
+    python -m benchmarks.run --tier 10k --update
+    python -m benchmarks.run --tier 10k 1m --tolerance 0.2
+    python -m benchmarks.run --tier 1m --stages rfm. sql.duckdb
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_backends import QUERIES
+from benchmarks.common import read_sql
+from benchmarks.synthetic import make_olist, make_sales, make_sqlite_standin
+from helpers import metrics
+from helpers.abc_core import abc_classes, period_sums, product_shares, xyz_variability
+from helpers.backends import DuckDBBackend, PostgresBackend
+from helpers.dataset_store import columnar_path, write_columnar
+from helpers.pipeline import RFM_DATASETS, XYZ_SETTINGS_PATH, load_settings
+from helpers.rfm_core import aggregate_rfm, build_daily_aggregates, rfm_from_daily
+from helpers.rfm_plots import histogram_figure, joint_figure, segment_codes
+from helpers.rfm_segments import RFM_FEATURES, RFM_KEYS, SegmentCube, rfm_codes, segment_table
+from helpers.rfm_stream import rfm_from_datasets
+from helpers.sketches import build_sketches
+from helpers.snapshot import fetch_from_file, refresh_snapshot
+
+TIERS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+BASELINES_PATH = 'benchmarks/baselines.json'
+
+NDAYS = 365
+BOUNDARIES = {'R': (90, 365), 'F': (2, 3), 'M': (50.0, 300.0)}
+SEGMENTS = {key: [f'{key}{n}' for n in range(3)] for key in RFM_KEYS}
+STREAM_BUDGET = 64 * 2 ** 20
+ABC_SPLIT = (80, 15)
+XYZ_GRAIN = 'month'
+
+
+def rfm_setup(rows: int, folder: str) -> dict:
+    data = make_olist(rows, categorical=True)
+    # Колоночные копии для расчёта частями с диска
+    for name, (fname, columns) in RFM_DATASETS.items():
+        write_columnar(data[name][columns], columnar_path(fname, folder))
+    return {**data, 'folder': folder}
+
+
+def segmentation_binning(df: pd.DataFrame) -> list:
+    """Распределение клиентов по сегментам каждого признака, как в make_segmentation"""
+    return [np.bincount(segment_codes(df[col].to_numpy(), BOUNDARIES[key]), minlength=3)
+            for key, col in zip(RFM_KEYS, RFM_FEATURES)]
+
+
+def segmentation_figures(df: pd.DataFrame) -> tuple:
+    """Графики подбора границ M, как в RFM_functions.segmentation_figures"""
+    values = df['order_sum'].to_numpy()
+    codes = segment_codes(values, BOUNDARIES['M'])
+    return (histogram_figure(values, BOUNDARIES['M'], 'order_sum', exp_bins=True),
+            joint_figure(df['days_since_last_order'].to_numpy(), df['orders_count'].to_numpy(), codes,
+                         SEGMENTS['M'], 'days_since_last_order', 'orders_count', False))
+
+
+RFM_STAGES = [
+    ('rfm.daily_aggregates', 'daily', lambda c: build_daily_aggregates(c['items'], c['orders'], c['customers'])),
+    ('rfm.features', 'rfm', lambda c: rfm_from_daily(c['daily'], NDAYS)),
+    ('rfm.aggregate', None, lambda c: aggregate_rfm(c['items'], c['orders'], c['customers'], NDAYS)),
+    ('rfm.stream', None, lambda c: rfm_from_datasets(RFM_DATASETS, NDAYS, STREAM_BUDGET, datasets_folder=c['folder'],
+                                                     columnar_folder=c['folder'], spill_folder=c['folder'])),
+    ('rfm.binning', None, lambda c: segmentation_binning(c['rfm'])),
+    ('rfm.figures', None, lambda c: segmentation_figures(c['rfm'])),
+    ('rfm.sketches', None, lambda c: build_sketches(c['rfm'], RFM_FEATURES)),
+    ('rfm.segment_cube', 'cube', lambda c: SegmentCube(rfm_codes(c['rfm'], RFM_FEATURES, BOUNDARIES),
+                                                       c['rfm']['order_sum'].to_numpy())),
+    ('rfm.segment_table', None, lambda c: segment_table(c['rfm'], c['cube'], SEGMENTS)),
+    ('rfm.pivot', None, lambda c: c['cube'].pivot(SEGMENTS)),
+]
+
+
+def abc_setup(rows: int, folder: str) -> dict:
+    sales = make_sales(rows)
+    engine = make_sqlite_standin(sales, folder)
+    sales.to_parquet(os.path.join(folder, 'sales.parquet'))
+    refresh_snapshot(fetch_from_file(os.path.join(folder, 'sales.parquet')), os.path.join(folder, 'snapshot'),
+                     full=True)
+    holidays = load_settings(XYZ_SETTINGS_PATH).get('holidays', []) if os.path.exists(XYZ_SETTINGS_PATH) else []
+    return {'sales': sales, 'engine': engine, 'holidays': holidays,
+            'sqlite': PostgresBackend(lambda: engine),
+            'duckdb': DuckDBBackend(os.path.join(folder, 'snapshot'))}
+
+
+def abc_teardown(context: dict):
+    context['engine'].dispose()
+
+
+def _query_stages(backend: str, postgres_only=()):
+    stages = []
+    for fname, params in QUERIES:
+        if fname in postgres_only:
+            continue
+        name = f"sql.{backend}.{fname[:-4]}" + (f".{params['grain']}" if params and 'grain' in params else '')
+        stages.append((name, None, lambda c, sql=read_sql(fname), params=params: c[backend].query(sql, params)))
+    return stages
+
+
+ABC_STAGES = [
+    ('abc.product_shares', 'shares', lambda c: product_shares(c['sales'])),
+    ('abc.classes', None, lambda c: abc_classes(c['shares'], *ABC_SPLIT)),
+    ('xyz.period_sums', 'sums', lambda c: period_sums(c['sales'], XYZ_GRAIN, c['holidays'])),
+    ('xyz.variability', None, lambda c: xyz_variability(c['sums'], XYZ_GRAIN, c['holidays'])),
+    *_query_stages('sqlite', postgres_only=('xyz_sums.sql', 'xyz.sql', 'xyz_week.sql')),
+    *_query_stages('duckdb'),
+]
+
+SUITES = [
+    (rfm_setup, RFM_STAGES, None),
+    (abc_setup, ABC_STAGES, abc_teardown),
+]
+
+
+def measure(name: str, func, context: dict, repeat: int, memory: bool):
+    """
+    Результат этапа, лучшее время из repeat запусков и пик памяти (МБ).
+    Первый запуск - прогревочный (импорты, кэши); при замере памяти он же замеряет пик по tracemalloc.
+    """
+    run = metrics.begin_run('benchmark')
+    peak_mb = None
+    metrics.set_trace_memory(memory)
+    try:
+        with metrics.stage(name):
+            func(context)
+    finally:
+        metrics.set_trace_memory(False)
+    if memory:
+        peak_mb = run.stages[-1]['peak_bytes'] / 2 ** 20
+    for _ in range(repeat):
+        with metrics.stage(name):
+            result = func(context)
+    timings = [record['seconds'] for record in run.stages if record['stage'] == name and record['depth'] == 0]
+    seconds = min(timings[1:])
+    metrics.end_run()
+    return result, seconds, peak_mb
+
+
+def run_tier(tier: str, stage_filter, repeat: int, memory: bool) -> dict:
+    results = {}
+    for setup, stages, teardown in SUITES:
+        selected = [stage for stage in stages if not stage_filter or stage[0].startswith(tuple(stage_filter))]
+        if not selected:
+            continue
+        with tempfile.TemporaryDirectory() as folder:
+            start = time.perf_counter()
+            context = setup(TIERS[tier], folder)
+            print(f"[{tier}] {setup.__name__}: {time.perf_counter() - start:.1f} s", flush=True)
+            try:
+                # Этапы выполняются по порядку: результаты одних (key) - входные данные других
+                for name, key, func in stages:
+                    if (name, key, func) not in selected and not key:
+                        continue
+                    result, seconds, peak_mb = measure(name, func, context, repeat, memory)
+                    if key:
+                        context[key] = result
+                    if (name, key, func) in selected:
+                        results[name] = {'seconds': round(seconds, 6),
+                                         'peak_mb': None if peak_mb is None else round(peak_mb, 3)}
+            finally:
+                if teardown:
+                    teardown(context)
+    return results
+
+
+def machine() -> dict:
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__}
+
+
+def load_baselines(path: str) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def compare(result: dict, baseline: dict, tolerance: float, min_seconds: float, min_mb: float) -> list:
+    """Регрессии этапа: [(метрика, значение, базовое значение)]"""
+    if not baseline:
+        return []
+    regressions = []
+    for metric, floor in (('seconds', min_seconds), ('peak_mb', min_mb)):
+        value, base = result.get(metric), baseline.get(metric)
+        # Абсолютный порог отсекает шум на этапах в единицы миллисекунд и мегабайт
+        if value is not None and base is not None and value > base * (1 + tolerance) and value - base > floor:
+            regressions.append((metric, value, base))
+    return regressions
+
+
+def report(tier: str, results: dict, baselines: dict, args) -> list:
+    print(f"\n{'stage (' + tier + ')':<32}{'seconds':>10}{'baseline':>10}{'peak, MB':>10}{'baseline':>10}  status")
+    failed = []
+    for name, result in results.items():
+        baseline = baselines.get(name, {})
+        regressions = compare(result, baseline, args.tolerance, args.min_seconds, args.min_mb)
+        status = 'new' if not baseline else ('REGRESSION ' + ', '.join(m for m, *_ in regressions)
+                                             if regressions else 'ok')
+
+        def cell(value, fmt):
+            return '-' if value is None else format(value, fmt)
+        print(f"{name:<32}{cell(result['seconds'], '.4f'):>10}{cell(baseline.get('seconds'), '.4f'):>10}"
+              f"{cell(result['peak_mb'], '.1f'):>10}{cell(baseline.get('peak_mb'), '.1f'):>10}  {status}")
+        failed += [f"{tier} {name}: {metric} {value:.4g} > {base:.4g} (+{args.tolerance:.0%})"
+                   for metric, value, base in regressions]
+    return failed
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'ожидается целое число не меньше 1: {value}')
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tier', choices=list(TIERS), nargs='+', default=['10k'])
+    parser.add_argument('--stages', nargs='*', help='префиксы имён этапов (по умолчанию - все)')
+    parser.add_argument('--repeat', type=positive_int, default=3, help='число замеров времени (не меньше 1)')
+    parser.add_argument('--no-memory', action='store_true', help='не замерять пиковую память')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимый относительный рост')
+    parser.add_argument('--min-seconds', type=float, default=0.02, help='минимальный рост времени для регрессии')
+    parser.add_argument('--min-mb', type=float, default=1.0, help='минимальный рост памяти для регрессии')
+    parser.add_argument('--baselines', default=BASELINES_PATH)
+    parser.add_argument('--update', action='store_true', help='записать результаты как базовые значения')
+    parser.add_argument('--output', help='сохранить результаты запуска в JSON')
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines(args.baselines)
+    runs, failed = {}, []
+    for tier in args.tier:
+        results = run_tier(tier, args.stages, args.repeat, not args.no_memory)
+        stored = baselines.get(tier, {})
+        if stored.get('machine') and stored['machine'] != machine():
+            print(f"[{tier}] baselines were recorded on another machine: {stored['machine']}")
+        failed += report(tier, results, stored.get('stages', {}), args)
+        runs[tier] = {'machine': machine(), 'recorded': time.strftime('%Y-%m-%d %H:%M:%S'), 'stages': results}
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(runs, f, indent=2)
+    if args.update:
+        for tier, run in runs.items():
+            # Этапы, не вошедшие в запуск (--stages), сохраняют прежние базовые значения
+            run['stages'] = {**baselines.get(tier, {}).get('stages', {}), **run['stages']}
+            baselines[tier] = run
+        os.makedirs(os.path.dirname(args.baselines) or '.', exist_ok=True)
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2)
+        print(f"\nbaselines saved: {args.baselines}")
+        return 0
+    if failed:
+        print('\nregressions:\n  ' + '\n  '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
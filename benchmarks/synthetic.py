@@ -0,0 +1,119 @@
+"""
+Генераторы синтетических данных в формате датасетов Olist для бенчмарков.
+"""
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from helpers.db import make_engine
+
+# Примерное распределение статусов заказов в исходном датасете Olist
+ORDER_STATUSES = {
+    'delivered': 0.970, 'shipped': 0.011, 'canceled': 0.006, 'unavailable': 0.006,
+    'invoiced': 0.003, 'processing': 0.003, 'created': 0.0005, 'approved': 0.0005,
+}
+
+
+def _ids(prefix: str, n: int) -> np.ndarray:
+    """Строковые идентификаторы вида '<prefix>00000001'"""
+    return np.char.add(prefix, np.char.zfill(np.arange(n).astype(str), 9)).astype(object)
+
+
+def make_olist(n_orders: int, seed: int = 0, repeat_share: float = 0.03, start='2016-09-01', days=730,
+               categorical=False) -> dict:
+    """
+    Генерирует таблицы customers, orders и items в формате Olist.
+    Args:
+        n_orders (int): Число заказов
+        repeat_share (float): Доля заказов, сделанных повторными покупателями
+        categorical (bool): Хранить идентификаторы как category, как в колоночной копии датасетов
+    Returns:
+        dict: {'customers': DataFrame, 'orders': DataFrame, 'items': DataFrame}
+    """
+    rng = np.random.default_rng(seed)
+
+    # Как и в Olist, у каждого заказа свой customer_id, а постоянного клиента определяет customer_unique_id
+    n_unique = max(1, int(n_orders * (1 - repeat_share)))
+    unique_idx = np.concatenate([np.arange(n_unique), rng.integers(0, n_unique, n_orders - n_unique)])
+    rng.shuffle(unique_idx)
+    customer_ids = _ids('c', n_orders)
+    customers = pd.DataFrame({'customer_id': customer_ids, 'customer_unique_id': _ids('u', n_unique)[unique_idx]})
+
+    seconds = rng.integers(0, days * 86400, n_orders)
+    orders = pd.DataFrame({
+        'order_id': _ids('o', n_orders),
+        'customer_id': customer_ids,
+        'order_status': rng.choice(list(ORDER_STATUSES), n_orders, p=np.array(list(ORDER_STATUSES.values())) /
+                                   sum(ORDER_STATUSES.values())),
+        'order_purchase_timestamp': pd.Timestamp(start) + pd.to_timedelta(seconds, unit='s'),
+    })
+
+    items_per_order = rng.geometric(0.87, n_orders)
+    order_idx = np.repeat(np.arange(n_orders), items_per_order)
+    item_no = np.arange(len(order_idx)) - np.repeat(np.cumsum(items_per_order) - items_per_order, items_per_order) + 1
+    items = pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy()[order_idx],
+        'order_item_id': item_no,
+        'product_id': _ids('p', max(1, n_orders // 3))[rng.integers(0, max(1, n_orders // 3), len(order_idx))],
+        'price': np.round(rng.lognormal(4.2, 1.0, len(order_idx)), 2),
+    })
+
+    if categorical:
+        for df in (customers, orders, items):
+            for col in df.columns:
+                if col.endswith('_id') and col != 'order_item_id' or col == 'order_status':
+                    df[col] = df[col].astype('category')
+    return {'customers': customers, 'orders': orders, 'items': items}
+
+
+def make_sales(n_rows: int, n_products: int = None, seed: int = 0, start='2022-01-01', days=180) -> pd.DataFrame:
+    """
+    Генерирует продажи в формате таблицы apteka.sales.
+    Args:
+        n_rows (int): Число строк продаж
+        n_products (int): Число товарных позиций (по умолчанию n_rows // 20)
+    Returns:
+        pd.DataFrame: dr_dat, dr_ndrugs, dr_kol, dr_croz, dr_czak, dr_sdisc
+    """
+    rng = np.random.default_rng(seed)
+    n_products = n_products or max(1, n_rows // 20)
+    # Популярность товаров распределена по Ципфу, как и в реальных продажах
+    weights = 1 / np.arange(1, n_products + 1) ** 0.9
+    product = rng.choice(n_products, n_rows, p=weights / weights.sum())
+    purchase_price = np.round(rng.lognormal(5, 1, n_products), 2)
+    price = purchase_price[product] * np.round(rng.uniform(1.05, 1.5, n_rows), 2)
+    quantity = rng.geometric(0.6, n_rows)
+    return pd.DataFrame({
+        'dr_dat': (pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n_rows), unit='D')).date,
+        'dr_ndrugs': _ids('Товар ', n_products)[product],
+        'dr_kol': quantity,
+        'dr_croz': np.round(price, 2),
+        'dr_czak': purchase_price[product],
+        'dr_sdisc': np.round(np.where(rng.random(n_rows) < 0.2, price * quantity * 0.05, 0), 2),
+    })
+
+
+def make_sqlite_standin(sales: pd.DataFrame, folder: str):
+    """
+    Локальная замена БД: SQLite-файл с таблицей sales, подключённый как схема apteka,
+    чтобы запросы из data/SQL/ABC обращались к apteka.sales без изменений.
+    Returns:
+        Engine: Engine с пулом соединений (helpers/db.make_engine)
+    """
+    os.makedirs(folder, exist_ok=True)
+    sales_db = os.path.join(folder, 'apteka.db')
+    with sqlite3.connect(sales_db) as connection:
+        sales.assign(dr_dat=pd.to_datetime(sales['dr_dat']).dt.strftime('%Y-%m-%d')) \
+            .to_sql('sales', connection, if_exists='replace', index=False)
+        connection.execute('CREATE INDEX IF NOT EXISTS sales_ndrugs ON sales (dr_ndrugs)')
+
+    engine = make_engine('sqlite:///' + os.path.join(folder, 'main.db'))
+
+    @event.listens_for(engine, 'connect')
+    def attach_schema(dbapi_connection, _):
+        dbapi_connection.execute(f"ATTACH DATABASE '{sales_db}' AS apteka")
+
+    return engine
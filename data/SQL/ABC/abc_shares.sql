@@ -0,0 +1,16 @@
+with product_grouped as (
+select
+  dr_ndrugs, sum(dr_kol) as amounts, -- число продаж товара
+  sum((dr_croz - dr_czak) * dr_kol - dr_sdisc) as pdofit_sum, -- прибыль с товарной позиции с учетом дисконта
+  sum(dr_croz * dr_kol - dr_sdisc) as revenue_sum -- выручка с товарной позиции с учетом дисконта
+from
+  apteka.sales
+group by dr_ndrugs
+)
+-- Накопленные доли по каждому признаку за один проход по apteka.sales;
+-- границы групп A-B-C применяются уже к результату (helpers/abc_core.py)
+select product_grouped.dr_ndrugs as "Наименование товарной позиции",
+  sum(amounts) over (order by amounts desc) * 1.0 / nullif(sum(amounts) over (), 0) as amount_share,
+  sum(pdofit_sum) over (order by pdofit_sum desc) * 1.0 / nullif(sum(pdofit_sum) over (), 0) as profit_share,
+  sum(revenue_sum) over (order by revenue_sum desc) * 1.0 / nullif(sum(revenue_sum) over (), 0) as revenue_share
+from product_grouped
@@ -0,0 +1,21 @@
+-- Продажи товара по периодам (день, неделя, месяц) без декартова произведения товаров и дат:
+-- периоды без продаж не материализуются, они учитываются через общее число периодов.
+-- Продажи в нерабочие дни не суммируются, но товар остаётся в результате (с нулевыми суммами,
+-- если он продавался только в нерабочие дни), как в запросе с полной таблицей дат xyz.sql
+with period_sales as (
+select
+  dr_ndrugs,
+  date_trunc(:grain, dr_dat)::date as period,
+  coalesce(sum(dr_kol) filter (where dr_dat <> all(cast(:holidays as date[]))), 0) as amount -- без нерабочих дней
+from
+  apteka.sales
+group by dr_ndrugs, date_trunc(:grain, dr_dat)
+)
+select
+  dr_ndrugs as "Наименование товарной позиции",
+  sum(amount) as amount_sum, -- сумма продаж за все периоды
+  sum(amount * amount) as amount_sq_sum, -- сумма квадратов продаж по периодам
+  (select min(dr_dat) from apteka.sales) as first_date,
+  (select max(dr_dat) from apteka.sales) as last_date
+from period_sales
+group by dr_ndrugs
@@ -1,52 +1,140 @@
+import os
+
 import streamlit as st
 import pandas as pd
 
-from sqlalchemy import create_engine, text
-from helpers.funtions import get_grid, read_sql
+from helpers import metrics
+from helpers.abc_core import abc_classes, parse_split, xyz_variability
+from helpers.disk_cache import DiskCache, cache_key
+from helpers.funtions import get_grid, get_settings, read_sql
+from helpers.prefetch import prefetch
 
+XYZ_GRAIN_LABELS = {"day": "По дням", "week": "По неделям", "month": "По месяцам"}
+SAMPLE_SQL = "SELECT dr_dat, dr_ndrugs, dr_kol, dr_croz, dr_czak, dr_sdisc FROM apteka.sales LIMIT 5"
 
-@st.cache_data
-def select(sql: str) -> pd.DataFrame:
+
+@st.cache_resource
+def get_engine():
+    """Engine с пулом соединений, общий для всех сессий процесса.
+    Параметры пула задаются секцией [SUPABASE_POOL] в secrets.toml (см. helpers/db.py).
+    """
+    supabase_connection_string = st.secrets.get("SUPABASE")
+    if not supabase_connection_string:
+        raise ValueError("SUPABASE environment variable is not set")
+    # SQLAlchemy загружается только при первом обращении к БД: при попадании в дисковый кэш он не нужен
+    from helpers.db import make_engine
+
+    return make_engine(supabase_connection_string, **dict(st.secrets.get("SUPABASE_POOL", {})))
+
+
+@st.cache_resource
+def get_backend():
+    """Бэкенд запросов (helpers/backends.py): PostgreSQL (Supabase) или DuckDB по локальному снимку apteka.sales.
+    Выбирается переменной окружения DASHBOARD_ABC_BACKEND или ключом kind секции [ABC_BACKEND] в secrets.toml
+    (по умолчанию postgres); остальные ключи секции - параметры DuckDBBackend (folder, threads, memory_limit).
+    """
+    try:
+        settings = dict(st.secrets.get("ABC_BACKEND", {}))
+    except FileNotFoundError:
+        settings = {}
+    kind = settings.pop("kind", "postgres")
+    kind = os.environ.get("DASHBOARD_ABC_BACKEND", kind)
+    from helpers.backends import make_backend
+
+    return make_backend(kind, get_engine, **settings)
+
+
+@st.cache_resource
+def get_result_cache() -> DiskCache:
+    """Дисковый кэш результатов запросов, общий для процессов и перезапусков сервера.
+    Параметры (folder, ttl, max_bytes) задаются секцией [RESULT_CACHE] в secrets.toml.
+    """
+    try:
+        settings = dict(st.secrets.get("RESULT_CACHE", {}))
+    except FileNotFoundError:
+        settings = {}
+    return DiskCache(**settings)
+
+
+def select(sql: str, params: dict = None) -> pd.DataFrame:
     """Выполняет SQL-запрос и возвращает результат в виде DataFrame.
+    Ключ кэша в памяти включает версию бэкенда: после обновления снимка (refresh_snapshot)
+    запрос выполняется заново, а не берётся из кэша прежнего снимка.
     Args:
-        sql (str): SQL-запрос
+        sql (str): SQL-запрос, параметры указываются как :name
+        params (dict): Значения параметров запроса
     Returns:
         pd.DataFrame: Результат запроса
     """
-    supabase_connection_string = st.secrets.get("SUPABASE")
-    if not supabase_connection_string:
-        raise ValueError("SUPABASE environment variable is not set")
+    return _select(sql, params, get_backend().version)
+
 
-    engine = create_engine(supabase_connection_string)
-    sql = text(sql)
+@metrics.cached("select")
+@st.cache_data
+def _select(sql: str, params: dict, version: str) -> pd.DataFrame:
+    """Кэшируемая часть select для версии снимка version.
+    Сначала ищет результат в дисковом кэше, к БД обращается только при его отсутствии.
+    Запрос выполняется в бэкенде get_backend; ключ дискового кэша учитывает бэкенд и версию снимка.
+    """
+    metrics.cache_miss()
+    cache = get_result_cache()
+    backend = get_backend()
+    key = cache_key("select", backend.name, version, sql, params)
+    df = cache.get(key)
+    metrics.count(f"cache.disk_cache.{'miss' if df is None else 'hit'}")
+    if df is None:
+        df = backend.query(sql, params)
+        try:
+            cache.put(key, df)
+        except Exception as e:
+            metrics.report_error("disk_cache", e)
+    return df
+
+def xyz_sums_query(grain: str):
+    """Запрос сумм продаж по периодам для XYZ-анализа: (sql, params)"""
+    holidays = (get_settings("ABC/xyz_settings.json") or {}).get("holidays", [])
+    return read_sql("ABC/xyz_sums.sql"), {"grain": grain, "holidays": holidays}
+
+
+def prefetch_queries():
+    """
+    Запускает независимые запросы страницы параллельно (helpers/prefetch.py):
+    пример данных, накопленные доли ABC и суммы XYZ для выбранной детализации.
+    Фрагменты вызывают select с теми же аргументами и получают результат из кэша.
+    """
+    grain = st.session_state.get("selected_option_xyz", next(iter(XYZ_GRAIN_LABELS)))
+    return prefetch({
+        "sample": (select, SAMPLE_SQL),
+        "abc_shares": (select, read_sql("ABC/abc_shares.sql")),
+        "xyz_sums": (select, *xyz_sums_query(grain)),
+    })
 
-    return pd.read_sql(sql, engine)
 
 @st.fragment
 def print_abc_results():
     """Выводит результаты классификации товаров"""
-
-    def change():
-        option = dict(zip(['A', 'B', 'C'], map(int, st.session_state["selected_option"].split("-"))))
-        st.session_state["data"] = select(read_sql("ABC/abc.sql").format(**option))
-
-
-    if "data" not in st.session_state:
-        option = dict(zip(['A', 'B', 'C'], map(int, st.session_state.get("selected_option", "80-15-5").split("-"))))
-        st.session_state["data"] = select(read_sql("ABC/abc.sql").format(**option))
+    # Накопленные доли считаются одним запросом, границы групп применяются локально,
+    # поэтому смена разбиения не обращается к БД
+    shares = select(read_sql("ABC/abc_shares.sql"))
 
     col1, col2 = st.columns([1, 1])
     with col1:
         st.markdown("#### Результат классификации товаров:")
     with col2:
-        st.selectbox(
+        option = st.selectbox(
             "H",
-            ("80-15-5", "70-20-10", "50-30-20"),
+            ("80-15-5", "70-20-10", "50-30-20", "Свои границы"),
             label_visibility="collapsed",
-            on_change=change, key="selected_option")
+            key="selected_option")
+
+    if option == "Свои границы":
+        bound_a, bound_b = st.slider("Накопленная доля, до которой товар относится к группам A и B, %",
+                                     1, 99, (80, 95), key="abc_bounds")
+        a, b = bound_a, bound_b - bound_a
+    else:
+        a, b, _ = parse_split(option)
 
-    # Берем данные из session_state
-    abc_greed = get_grid(st.session_state["data"], height=200)
+    abc_greed = get_grid(abc_classes(shares, a, b), key="abc_grid", height=200)
     st.markdown("#### Сводная таблица для оценки количества товаров в каждой группе")
     st.table(pd.pivot_table(
         data=abc_greed.data[["По числу проданных позиций", "По прибыли с позиции", "По выручке с позиции"]],
@@ -74,29 +162,21 @@ def print_xyz_results():
             }
         ]
     }
-    # def change():
-    #     if st.session_state["selected_option_xyz"] == "day":
-    #         st.session_state["xyz_data"] = select(read_sql("ABC/xyz.sql"))
-    #     else:
-    #         st.session_state["xyz_data"] = select(read_sql("ABC/xyz_week.sql"))
-
-    if "xyz_data" not in st.session_state:
-        st.session_state["xyz_data"] = select(read_sql("ABC/xyz.sql"))
 
     col1, col2 = st.columns([1, 1])
     with col1:
         st.markdown("#### Результат классификации товаров:")
-    # with col2:
-    #     st.selectbox(
-    #         "H",
-    #         ("day", "week"),
-    #         label_visibility="collapsed",
-    #         on_change=change, key="selected_option_xyz")
-
-    # Берем данные из session_state
-    xyz_grid = get_grid(st.session_state["xyz_data"],  **params, height=200)
-    return xyz_grid
-
-
-
+    with col2:
+        grain = st.selectbox(
+            "H",
+            tuple(XYZ_GRAIN_LABELS),
+            format_func=XYZ_GRAIN_LABELS.get,
+            label_visibility="collapsed",
+            key="selected_option_xyz")
 
+    # Из БД получаем только суммы и суммы квадратов продаж по товарам, вариативность считаем локально
+    sql, query_params = xyz_sums_query(grain)
+    sums = select(sql, query_params)
+    xyz_grid = get_grid(xyz_variability(sums, grain, query_params["holidays"]), key="xyz_grid", **params,
+                        height=200)
+    return xyz_grid
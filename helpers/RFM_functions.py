@@ -1,157 +1,220 @@
+import os
+
 import pandas as pd
 import streamlit as st
-import seaborn as sns
 import numpy as np
-import plotly.graph_objects as go
 import json
-from helpers.funtions import get_grid
+from helpers import metrics
+from helpers.dataset_store import dataset_version, iter_dataset
+from helpers.disk_cache import fingerprint
+from helpers.funtions import download_widget, get_grid
+from helpers.rfm_core import (build_daily_aggregates, load_daily_aggregates, read_only, rfm_from_daily,
+                              source_fingerprint)
+from helpers.rfm_plots import histogram_figure, joint_figure, segment_codes
+from helpers.rfm_segments import N_CELLS, RFM_FEATURES, RFM_KEYS, SegmentCube, rfm_codes, segment_table
+from helpers.sketches import build_sketches, suggest_boundaries
+
+# Сохранённая таблица дневных агрегатов, дополняемая новыми заказами
+DAILY_AGGREGATES_PATH = 'data/columnar/rfm_daily.parquet'
+# Бюджет памяти расчёта RFM, МБ (переменная окружения DASHBOARD_MEMORY_BUDGET). Если он задан, страница
+# не загружает таблицы целиком, а считает признаки по частям датасетов (helpers/rfm_stream.py)
+MEMORY_BUDGET = int(os.environ.get("DASHBOARD_MEMORY_BUDGET") or 0)
+
+
+@metrics.cached("daily_aggregates")
+@st.cache_resource
+def daily_aggregates(_items_df, _orders_df, _customers_df, source: str) -> pd.DataFrame:
+    """
+    Таблица дневных агрегатов по клиентам (см. helpers/rfm_core.py).
+    Строится один раз на процесс и сохраняется на диск; при появлении новых заказов сохранённая таблица
+    дополняется, а не пересчитывается. Ключ кэша - версия исходных таблиц source (source_fingerprint):
+    хеш самих таблиц с категориями-идентификаторами считался бы при каждом перезапуске скрипта.
+    """
+    metrics.cache_miss()
+    try:
+        return load_daily_aggregates(DAILY_AGGREGATES_PATH, _items_df, _orders_df, _customers_df, source)
+    except OSError as e:
+        metrics.report_error("daily_aggregates", e)
+        return build_daily_aggregates(_items_df, _orders_df, _customers_df)
 
-@st.cache_data
+
+@metrics.cached("rfm_base")
+@st.cache_resource(max_entries=8)
+def rfm_base(_daily: pd.DataFrame, version: str, n_rows: int, ndays: int) -> pd.DataFrame:
+    """
+    RFM-признаки клиентов за ndays дней - одна защищённая от записи таблица на процесс,
+    общая для всех сессий. Сессии хранят только границы сегментов (см. print_results).
+    """
+    metrics.cache_miss()
+    df = read_only(rfm_from_daily(_daily, ndays))
+    # Версия данных для кэша графиков и сегментов (см. segmentation_figures, segment_cube)
+    df.attrs["data_key"] = f"{version}:{n_rows}:{ndays}"
+    return df
+
+
+@metrics.stage("data_preprocessing")
 def data_preprocessing(items_df, orders_df, customers_df, ndays) -> pd.DataFrame:
     """
     Обрабатывает данные о заказах и клиентах, формируя агрегированную таблицу.
+    Смена периода ndays не пересчитывает исходные заказы: признаки берутся из дневных агрегатов.
     """
-    # Рассчитываем сумму заказа
-    items_df['order_sum'] = items_df['price'] * items_df['order_item_id']
-    items_df = items_df.groupby('order_id').agg({'order_sum': 'sum'})
+    # Версия исходных датасетов - по attrs['source'] таблиц, без хеширования их содержимого
+    source = source_fingerprint(items_df, orders_df, customers_df)
+    daily = daily_aggregates(items_df, orders_df, customers_df, source)
+    return rfm_base(daily, source, len(daily), ndays)
 
-    # Фильтруем невыполненные заказы
-    orders_df = orders_df[~orders_df.order_status.isin(['canceled', 'created', 'unavailable'])]
-    orders_df = orders_df[['order_id', 'customer_id', 'order_purchase_timestamp']]
 
-    # Преобразуем дату покупки и считаем дни с последнего заказа
-    orders_df['order_date'] = pd.to_datetime(orders_df['order_purchase_timestamp']).dt.date
-    orders_df['days_delta'] = (orders_df['order_date'].max() - orders_df['order_date']).apply(lambda x: x.days)
+def datasets_version(datasets: dict) -> str:
+    """Версия файлов датасетов {имя: (файл, колонки)} без их чтения (см. dataset_store.dataset_version)"""
+    return "|".join(dataset_version(fname) for fname, _ in datasets.values())
 
-    # Фильтруем заказы старше ndays
-    orders_df = orders_df[orders_df.days_delta <= ndays]
 
-    # Объединяем таблицы
-    df = orders_df.merge(customers_df, on='customer_id', how='left')
-    df = df.merge(items_df, on='order_id', how='left')[['customer_unique_id', 'order_date', 'order_sum', 'days_delta']]
-
-    # Агрегируем по клиенту
-    df = df.groupby("customer_unique_id", as_index=False).agg({"days_delta": ["min", "count"], "order_sum": "sum"})
-    df.columns = ["customer_unique_id", "days_since_last_order", "orders_count", "order_sum"]
+@metrics.cached("rfm_streamed")
+@st.cache_resource(max_entries=8)
+def rfm_streamed(version: str, ndays: int) -> pd.DataFrame:
+    """
+    RFM-признаки клиентов за ndays дней, посчитанные по частям датасетов в пределах MEMORY_BUDGET.
+    Одна защищённая от записи таблица на процесс, как у rfm_base; version - версия файлов датасетов.
+    """
+    metrics.cache_miss()
+    from helpers.rfm_stream import RFM_DATASETS, rfm_from_datasets
 
+    df = read_only(rfm_from_datasets(RFM_DATASETS, ndays, MEMORY_BUDGET * 2 ** 20))
+    df.attrs["data_key"] = f"{version}:{ndays}"
     return df
 
 
+@metrics.stage("data_preprocessing")
+def data_preprocessing_streamed(ndays) -> pd.DataFrame:
+    """То же, что data_preprocessing, без загрузки таблиц в память целиком (при заданном MEMORY_BUDGET)"""
+    from helpers.rfm_stream import RFM_DATASETS
+
+    return rfm_streamed(datasets_version(RFM_DATASETS), ndays)
+
+
+@metrics.cached("null_counts")
+@st.cache_data(max_entries=16)
+def _null_counts(fname: str, columns: list, version: str) -> pd.Series:
+    metrics.cache_miss()
+    from helpers.rfm_stream import batch_rows
+
+    counts = pd.Series(0, index=columns)
+    for chunk in iter_dataset(fname, columns, batch_rows(MEMORY_BUDGET * 2 ** 20)):
+        counts += chunk.isna().sum()
+    return counts.rename("NaN")
+
+
+def null_counts(fname: str, columns: list) -> pd.Series:
+    """Число пропусков в колонках датасета, посчитанное по частям файла (для страницы при заданном MEMORY_BUDGET)"""
+    return _null_counts(fname, columns, dataset_version(fname))
+
+
+def data_key(df: pd.DataFrame, columns) -> str:
+    """Версия данных для ключей кэша: из attrs['data_key'], иначе хеш содержимого колонок"""
+    return df.attrs.get("data_key") or fingerprint(df[list(columns)])
+
+
+@metrics.cached("segmentation_figures")
+@st.cache_data(max_entries=64)
+def segmentation_figures(_df: pd.DataFrame, key: str, cut_col: str, x: str, y: str, boundaries: tuple,
+                         segments: tuple, text: str, log_y: bool, exp_bins: bool):
+    """
+    Гистограмма признака и совместные распределения по сегментам.
+    Кэшируются по (версия данных, колонка, границы): сам DataFrame не хешируется.
+    """
+    metrics.cache_miss()
+    values = _df[cut_col].to_numpy()
+    codes = segment_codes(values, boundaries)
+    return (histogram_figure(values, boundaries, text, exp_bins),
+            joint_figure(_df[x].to_numpy(), _df[y].to_numpy(), codes, segments, x, y, log_y))
+
+
+# Способы начальной расстановки границ слайдеров make_segmentation
+BREAK_METHOD_LABELS = {
+    None: "Вручную",
+    "quantile": "Квантили: группы равной численности",
+    "kmeans": "Естественные разрывы (k-means)",
+}
+
+
+@metrics.cached("feature_sketches")
+@st.cache_resource(max_entries=8)
+def feature_sketches(_df: pd.DataFrame, key: str) -> dict:
+    """Скетчи квантилей RFM-признаков (helpers/sketches.py) для версии данных key"""
+    metrics.cache_miss()
+    return build_sketches(_df, RFM_FEATURES)
+
+
 @st.fragment
 def make_segmentation(df: pd.DataFrame, cut_col: str, x: str, y: str, segments: dict, text: str, key,
-                      log_y: bool = False, exp_bins=False):
+                      log_y: bool = False, exp_bins=False, suggest=None):
     segments = segments.get(key)
-
-    def plt_joint(df: pd.DataFrame, x: str, y: str, segments: list, c=['green', 'gray', 'red']):
-        cols = st.columns([1, 1, 1])
-        for n, gr in enumerate(segments):
-            data = df[df["groups"] == gr]
-            if data.size == 0: continue
-            g = sns.JointGrid(data=data, x=x, y=y, marginal_ticks=True)
-            g.figure.suptitle(segments[n])
-            if log_y:
-                g.ax_joint.set(yscale="log")
-
-            cax = g.figure.add_axes([.72, .6, .02, .2])
-            g.plot_joint(
-                sns.histplot, discrete=(True, False),
-                cmap=f"light:{c[n]}", pmax=.8, cbar=True, cbar_ax=cax)
-            g.plot_marginals(sns.histplot, element="step", color=c[n])
-            # g.ax_marg_y.set_xscale("log")  # Логарифмическая шкала по X
-            if log_y:
-                g.ax_marg_x.set_yscale("log")  # Логарифмическая шкала по Y
-            with cols[n]:
-                st.pyplot(g.figure)
+    integer = pd.api.types.is_integer_dtype(df[cut_col])
+    top = int(df[cut_col].max()) + 1 if integer else float(df[cut_col].max()) + 1
+
+    # Начальные границы: подобранные по скетчу квантилей или доли от максимума
+    if suggest:
+        sketch = feature_sketches(df, data_key(df, RFM_FEATURES))[cut_col]
+        low, high = suggest_boundaries(sketch, suggest, integer=integer, log=exp_bins)
+        default = (min(max(low, 0), top), min(max(high, 0), top))
+    elif integer:
+        default = (int(df[cut_col].max() * 0.2), int(df[cut_col].max() * 0.9))
+    else:
+        default = (df[cut_col].max() * 0.1, df[cut_col].max() * 0.9)
 
     # Создаём слайдер для выбора диапазона
-    if df[cut_col].dtype == int:
-        range_min, range_max = st.slider(f"Выберете границы сегментации клиентов по параметру: '{text.lower()}'",
-                                         0, df[cut_col].max() + 1,
-                                         (int(df[cut_col].max() * 0.2),
-                                          int(df[cut_col].max() * 0.9)))
-    else:
-        range_min, range_max = st.slider(f"Выберете границы сегментации клиентов по параметру: '{text.lower()}'",
-                                         0.0, df[cut_col].max() + 1,
-                                         (df[cut_col].max() * 0.1,
-                                          df[cut_col].max() * 0.9))
-
-    df["groups"] = pd.cut(df[cut_col],
-                          [-1, range_min, range_max, df[cut_col].max() + 2], right=False, retbins=False,
-                          include_lowest=True,
-                          labels=segments)
-    df_grouped = df.groupby("groups", observed=True)[cut_col].agg(
-        ["count", lambda x: f"{len(x) / df.shape[0]:.1%}"]).reset_index()
-
-    if exp_bins:
-        bins = np.exp(np.histogram_bin_edges(df['order_sum'].apply('log'), 4 * int((df[cut_col].max()) ** (1.0 / 3))))
-    else:
-        bins = np.histogram_bin_edges(df[cut_col],
-                                      bins=4 * int((df[cut_col].max()) ** (1.0 / 3)))
-
-    # Вычисляем гистограмму
-    hist_values, bin_edges = np.histogram(df[cut_col], bins=bins)
-
-    # Определяем цвета бинов
-    colors = [
-        "green" if left_edge < range_min else "red" if left_edge >= range_max else "gray"
-        for left_edge in bin_edges[:-1]
-    ]
-
-    # Создаём фигуру в Plotly
-    fig = go.Figure()
-
-    # Добавляем столбцы гистограммы с кастомными hover
-    for i in range(len(hist_values)):
-        fig.add_trace(
-            go.Bar(
-                x=[(bin_edges[i] + bin_edges[i + 1]) / 2],  # Центр бин-а
-                y=[hist_values[i]],
-                marker_color=colors[i],
-                width=(bin_edges[i + 1] - bin_edges[i]) * 0.9,  # Ширина столбца
-                # name=f"{bin_edges[i]:.0f} - {bin_edges[i + 1]:.0f} дней",
-                hoverinfo="text",
-                hovertext=f"{text}: {bin_edges[i]:.0f} - {bin_edges[i + 1]:.0f}<br>Число клиентов: {hist_values[i]}"
-            )
-        )
-
-    # Настраиваем макет
-    fig.update_layout(
-        xaxis_title=text,
-        yaxis_title="Число клиентов",
-        showlegend=False,
-        margin=dict(l=0, r=0, t=0, b=0),
-        height=200
-
-    )
-    col1, col2 = st.columns([1, 1])
-    with col1:
-        st.markdown("**Распределение клиентов по группам**")
-        st.table(df_grouped.set_index("groups").T.reset_index(drop=True))
-    with col2:
-        st.plotly_chart(fig)
-    plt_joint(df,
-              x=x,
-              y=y,
-              segments=segments)
+    range_min, range_max = st.slider(f"Выберете границы сегментации клиентов по параметру: '{text.lower()}'",
+                                     0 if integer else 0.0, top,
+                                     tuple(int(v) for v in default) if integer else tuple(float(v) for v in default))
+
+    # Распределение клиентов по группам: коды сегментов и один bincount вместо pd.cut + groupby
+    counts = np.bincount(segment_codes(df[cut_col].to_numpy(), (range_min, range_max)), minlength=3)
+    present = counts > 0
+    df_grouped = pd.DataFrame({
+        "groups": np.array(segments)[present],
+        "count": counts[present],
+        "share": [f"{count / df.shape[0]:.1%}" for count in counts[present]],
+    })
+
+    hist_fig, joint_fig = segmentation_figures(
+        df, data_key(df, [cut_col, x, y]), cut_col, x, y, (range_min, range_max), tuple(segments), text,
+        log_y, exp_bins)
+
+    with metrics.stage("render.segmentation", key=key):
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            st.markdown("**Распределение клиентов по группам**")
+            st.table(df_grouped.set_index("groups").T.reset_index(drop=True))
+        with col2:
+            st.plotly_chart(hist_fig)
+        st.plotly_chart(joint_fig)
     st.session_state[key] = (range_min, range_max)
 
 
-def get_segmented_df(df: pd.DataFrame, segments: dict, r_col, f_col, m_col) -> pd.DataFrame:
-    """
-        Применяет сегментацию к данным по заданным параметрам RFM.
-        """
-    df = df.drop(columns=["groups"], errors='ignore')  # Удаляем столбец groups, если он есть
+def current_boundaries(df: pd.DataFrame, columns=RFM_FEATURES) -> dict:
+    """Границы сегментов из слайдеров make_segmentation; без слайдера - все клиенты в одном сегменте"""
+    return {key: tuple(st.session_state.get(key, (df[col].max() + 2,) * 2)) for key, col in zip(RFM_KEYS, columns)}
 
-    for key, col in zip(["R", "F", "M"], [r_col, f_col, m_col]):
-        df[key] = pd.cut(
-            df[col],
-            [-1, *st.session_state.get(key, []), df[col].max() + 2],
-            right=False,
-            labels=segments.get(key, [])
-        )
 
-    return df
+@metrics.cached("segment_cube")
+@st.cache_resource(max_entries=16)
+def segment_cube(_df: pd.DataFrame, key: str, boundaries: tuple, columns=RFM_FEATURES) -> SegmentCube:
+    """
+    Куб сегментов для версии данных key и границ boundaries.
+    Кэшируется без копирования (cache_resource): куб после построения не изменяется.
+    """
+    metrics.cache_miss()
+    return SegmentCube(rfm_codes(_df, columns, dict(boundaries)), _df[columns[2]].to_numpy())
+
 
+def get_segmented_df(df: pd.DataFrame, segments: dict, r_col, f_col, m_col, boundaries=None) -> pd.DataFrame:
+    """
+        Применяет сегментацию к данным по заданным параметрам RFM.
+        """
+    columns = (r_col, f_col, m_col)
+    boundaries = boundaries or current_boundaries(df, columns)
+    cube = segment_cube(df, data_key(df, columns), tuple(boundaries.items()), columns)
+    return segment_table(df, cube, segments)
 
 
 @st.fragment
@@ -160,32 +223,39 @@ def print_results(df: pd.DataFrame, segments: dict):
     Выводит результаты сегментации клиентов и визуализирует распределение данных.
     """
 
-    def change(df, segments):
-        st.session_state["df"] = get_segmented_df(df, segments, 'days_since_last_order', 'orders_count', 'order_sum')
+    def change(df):
+        st.session_state["rfm_applied"] = current_boundaries(df)
 
-    st.button("Применить настройки сегментации", on_click=change, args=(df, segments))
+    st.button("Применить настройки сегментации", on_click=change, args=(df,))
     st.subheader("Результаты сегментации клиентов")
     st.markdown("Сводная таблица с количеством клиентов в каждой категории")
-    df = get_segmented_df(df, segments, 'days_since_last_order', 'orders_count', 'order_sum')
 
-    # Получаем сегментированные данные
-    data = st.session_state.get('df', df)
+    # Сегментация по применённым границам (до первого применения - по текущим положениям слайдеров)
+    boundaries = st.session_state.get("rfm_applied") or current_boundaries(df)
+    key = data_key(df, RFM_FEATURES)
+    cube = segment_cube(df, key, tuple(boundaries.items()))
 
-    # Строим сводную таблицу RFM
-    pivot_table = pd.pivot_table(
-        data=data[["R", "F", "M"]],
-        index=["R", "F"],
-        columns="M",
-        aggfunc=lambda x: f"{len(x)} \n\r {len(x) / len(df.customer_unique_id):.2%}",
-        fill_value="0 \n\r 0.00%"
-    )
-    st.table(pivot_table)
+    # Сводная таблица RFM строится по 27 ячейкам куба
+    st.table(cube.pivot(segments))
 
     st.markdown("#### Детальные данные сегментации")
-    download_data = get_grid(data)
-    st.download_button(
-        "Скачать данные",
-        data=download_data.get("data").to_csv().encode("utf-8"),
-        mime="text/csv"
-    )
-    return st.session_state.get('df', df)
+    cells = [cell for cell in range(N_CELLS) if cube.counts[cell]]
+    cell = st.selectbox(
+        "Сегмент", [None] + cells, key="rfm_cell",
+        format_func=lambda c: "Все клиенты" if c is None else
+        " / ".join(segments[k][code] for k, code in zip(RFM_KEYS, np.unravel_index(c, (3, 3, 3)))) +
+        f" ({cube.counts[c]})")
+    data = segment_table(df, cube, segments)
+    if cell is not None:
+        stats = cube.cell_stats(cell)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Клиентов", f"{stats['count']}")
+        col2.metric("Сумма покупок", f"{stats['sum']:,.0f}")
+        col3.metric("Средняя сумма покупок", f"{stats['mean']:,.2f}")
+        data = data.iloc[cube.positions(cell)]
+
+    download_data = get_grid(data, key="rfm_grid")
+    # Файл формируется только по кнопке и заново - при смене сегментации, сегмента или фильтров таблицы
+    signature = (key, tuple(boundaries.items()), cell, getattr(download_data, "state", None))
+    download_widget(download_data, "rfm_export", signature, file_name="rfm_segments")
+    return data
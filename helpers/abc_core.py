@@ -0,0 +1,160 @@
+"""
+ABC-классификация товаров без зависимостей от Streamlit.
+
+Накопленные доли товаров по каждому признаку считаются один раз (data/SQL/ABC/abc_shares.sql),
+а границы групп применяются к ним локально, поэтому смена разбиения не требует запроса к БД.
+"""
+import numpy as np
+import pandas as pd
+
+NAME_COLUMN = "Наименование товарной позиции"
+
+# Колонки накопленных долей и соответствующие им колонки результата
+ABC_FEATURES = {
+    "amount_share": "По числу проданных позиций",
+    "profit_share": "По прибыли с позиции",
+    "revenue_share": "По выручке с позиции",
+}
+
+ABC_LABELS = np.array(["A", "B", "C"])
+
+
+def parse_split(option: str) -> tuple:
+    """Разбирает разбиение вида '80-15-5' в кортеж процентов (80, 15, 5)"""
+    return tuple(map(int, option.split("-")))
+
+
+def classify(shares: np.ndarray, a: float, b: float) -> np.ndarray:
+    """
+    Относит товары к группам по накопленной доле признака.
+    Args:
+        shares (np.ndarray): Накопленные доли товаров (от 0 до 1)
+        a (float): Доля группы A, %
+        b (float): Доля группы B, %
+    Returns:
+        np.ndarray: Коды групп 0 (A), 1 (B), 2 (C)
+    """
+    # Товар попадает в A, если доля <= a, в B - если a < доля <= a + b, иначе в C
+    return np.searchsorted(np.array([a, a + b]) / 100, shares, side="left").astype(np.int8)
+
+
+def _cumulative_share(values: pd.Series) -> np.ndarray:
+    """
+    Накопленная доля значения при упорядочении по убыванию, как
+    sum(x) over (order by x desc) / sum(x) over () в SQL: равные значения получают общую долю.
+    """
+    x = values.to_numpy(np.float64)
+    total = x.sum()
+    if total == 0:
+        return np.full(len(x), np.nan)
+    order = np.argsort(-x, kind="stable")
+    cumulative = np.cumsum(x[order])
+    # Для группы равных значений берём накопленную сумму на её последнем элементе
+    sorted_x = x[order]
+    last_of_run = np.append(sorted_x[1:] != sorted_x[:-1], True)
+    run_end = np.flatnonzero(last_of_run)
+    cumulative = cumulative[run_end[np.searchsorted(run_end, np.arange(len(x)))]]
+    shares = np.empty(len(x))
+    shares[order] = cumulative / total
+    return shares
+
+
+def product_shares(sales_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    То же, что data/SQL/ABC/abc_shares.sql, для продаж, загруженных в DataFrame.
+    Returns:
+        pd.DataFrame: Наименование товарной позиции, amount_share, profit_share, revenue_share
+    """
+    quantity = sales_df["dr_kol"]
+    grouped = pd.DataFrame({
+        "amounts": quantity,
+        "profit_sum": (sales_df["dr_croz"] - sales_df["dr_czak"]) * quantity - sales_df["dr_sdisc"],
+        "revenue_sum": sales_df["dr_croz"] * quantity - sales_df["dr_sdisc"],
+    }).groupby(sales_df["dr_ndrugs"], observed=True, sort=False).sum()
+    # В БД суммы денежных колонок точные (numeric): убираем погрешность float, чтобы равные суммы
+    # оставались равными и получали общую накопленную долю
+    grouped = grouped.round(6)
+    return pd.DataFrame({
+        NAME_COLUMN: grouped.index.to_numpy(),
+        "amount_share": _cumulative_share(grouped["amounts"]),
+        "profit_share": _cumulative_share(grouped["profit_sum"]),
+        "revenue_share": _cumulative_share(grouped["revenue_sum"]),
+    })
+
+
+def abc_classes(shares_df: pd.DataFrame, a: float, b: float) -> pd.DataFrame:
+    """
+    Строит таблицу ABC-классов товаров для произвольного разбиения.
+    Args:
+        shares_df (pd.DataFrame): Результат abc_shares.sql
+        a (float): Доля группы A, %
+        b (float): Доля группы B, %
+    Returns:
+        pd.DataFrame: Наименование товарной позиции и группа по каждому из признаков
+    """
+    result = {NAME_COLUMN: shares_df[NAME_COLUMN].to_numpy()}
+    for share_col, label_col in ABC_FEATURES.items():
+        # Пропуски (нулевой итог по признаку) относим к группе C
+        shares = shares_df[share_col].to_numpy(np.float64, na_value=np.inf)
+        result[label_col] = pd.Categorical.from_codes(classify(shares, a, b), categories=ABC_LABELS)
+    return pd.DataFrame(result)
+
+
+# Гранулярность XYZ-анализа: частота pandas, совпадающая с date_trunc в PostgreSQL
+# (неделя начинается с понедельника)
+XYZ_GRAINS = {"day": "D", "week": "W-SUN", "month": "M"}
+
+
+def count_periods(first_date, last_date, grain: str, holidays=()) -> int:
+    """
+    Число периодов анализа между первой и последней датой продаж.
+    Период не учитывается, если все его дни нерабочие.
+    """
+    days = pd.date_range(first_date, last_date, freq="D")
+    days = days[~days.isin(pd.to_datetime(list(holidays)))]
+    return days.to_period(XYZ_GRAINS[grain]).nunique()
+
+
+def period_sums(sales_df: pd.DataFrame, grain: str, holidays=()) -> pd.DataFrame:
+    """
+    То же, что data/SQL/ABC/xyz_sums.sql, для продаж, загруженных в DataFrame.
+    Returns:
+        pd.DataFrame: Наименование товарной позиции, amount_sum, amount_sq_sum, first_date, last_date
+    """
+    dates = pd.to_datetime(sales_df["dr_dat"])
+    # Продажи в нерабочие дни обнуляются, а не отбрасываются: товар, который продавался
+    # только в нерабочие дни, остаётся в результате с нулевыми суммами (вариативность 0)
+    holiday = dates.isin(pd.to_datetime(list(holidays)))
+    periods = dates.dt.to_period(XYZ_GRAINS[grain])
+    amounts = sales_df["dr_kol"].mask(holiday, 0).groupby([sales_df["dr_ndrugs"], periods], observed=True).sum()
+    sums = (amounts.to_frame("amount_sum").assign(amount_sq_sum=amounts ** 2)
+            .groupby(level=0, observed=True).sum())
+    return sums.rename_axis(NAME_COLUMN).reset_index().assign(first_date=dates.min(), last_date=dates.max())
+
+
+def xyz_variability(sums_df: pd.DataFrame, grain: str, holidays=()) -> pd.DataFrame:
+    """
+    Коэффициент вариации продаж товара по периодам, включая периоды без продаж.
+    Среднее и выборочное стандартное отклонение восстанавливаются из суммы, суммы квадратов
+    и общего числа периодов n: нулевые периоды не меняют суммы, но входят в n.
+    Args:
+        sums_df (pd.DataFrame): Результат xyz_sums.sql или period_sums
+        grain (str): Гранулярность: day, week или month
+        holidays: Нерабочие дни, исключённые из анализа
+    Returns:
+        pd.DataFrame: Наименование товарной позиции, Вариативность (по возрастанию)
+    """
+    if len(sums_df) == 0:
+        return pd.DataFrame({NAME_COLUMN: [], "Вариативность": []})
+    n = count_periods(sums_df["first_date"].iloc[0], sums_df["last_date"].iloc[0], grain, holidays)
+    total = sums_df["amount_sum"].to_numpy(np.float64)
+    squares = sums_df["amount_sq_sum"].to_numpy(np.float64)
+
+    mean = total / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = np.maximum(squares - total * mean, 0) / (n - 1)
+        cv = np.sqrt(variance) / mean
+    # Как COALESCE(STDDEV / NULLIF(AVG, 0), 0) в исходном запросе
+    cv = np.where(np.isfinite(cv), cv, 0.0)
+    return pd.DataFrame({NAME_COLUMN: sums_df[NAME_COLUMN].to_numpy(), "Вариативность": cv}) \
+        .sort_values("Вариативность", kind="stable", ignore_index=True)
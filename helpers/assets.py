@@ -0,0 +1,126 @@
+"""
+Кэш статических файлов приложения: шаблоны markdown, SQL-скрипты, JSON-настройки и Lottie-анимации.
+
+Файл читается и разбирается один раз на процесс; при следующих обращениях проверяются только
+время изменения и размер файла (os.stat), поэтому правка шаблона видна без перезапуска сервера.
+Все файлы можно заранее собрать в один пакет (JSON) - тогда холодный старт процесса читает один файл
+вместо десятков, а изменённые после сборки файлы по-прежнему читаются с диска.
+
+Сборка пакета:
+    python -m helpers.assets
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+
+# Пакет хранится в JSON: в нём только тексты, разобранный JSON и mtime, а папка .cache доступна на запись
+BUNDLE_PATH = '.cache/assets.bundle.json'
+# Папки, файлы которых попадают в пакет, и способ их разбора
+ASSET_FOLDERS = {
+    'data/templates/': {'.md': 'text', '.json': 'json:cp1251'},
+    'data/SQL/': {'.sql': 'text'},
+    'static/': {'.json': 'json:utf-8'},
+}
+
+# (путь, способ разбора) -> (mtime_ns, размер, разобранное содержимое)
+_entries = {}
+_lock = threading.Lock()
+_bundle_loaded = False
+
+
+def _parse(path: str, kind: str):
+    if kind == 'text':
+        with open(path, mode='r', encoding='utf-8') as f:
+            return f.read()
+    _, encoding = kind.split(':')
+    with open(path, mode='r', encoding=encoding) as f:
+        return json.load(f)
+
+
+def _load_bundle(bundle_path=None):
+    """Добавляет в кэш записи пакета (один раз на процесс)"""
+    global _bundle_loaded
+    with _lock:
+        if _bundle_loaded:
+            return
+        _bundle_loaded = True
+        try:
+            with open(bundle_path or BUNDLE_PATH, encoding='utf-8') as f:
+                bundle = json.load(f)
+            entries = {(item['path'], item['kind']): (int(item['mtime_ns']), int(item['size']), item['value'])
+                       for item in bundle['files']}
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        for key, entry in entries.items():
+            _entries.setdefault(key, entry)
+
+
+def load(path: str, kind='text'):
+    """
+    Содержимое файла из кэша процесса.
+    Разобранные объекты общие для всех сессий, изменять их нельзя.
+    Args:
+        path (str): Путь к файлу
+        kind (str): 'text' или 'json:<кодировка>'
+    Raises:
+        OSError, ValueError: Файл не найден или не разбирается
+    """
+    if not _bundle_loaded:
+        _load_bundle()
+    path = os.path.normpath(path)
+    stat = os.stat(path)
+    entry = _entries.get((path, kind))
+    if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+        return entry[2]
+    value = _parse(path, kind)
+    _entries[(path, kind)] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def clear():
+    global _bundle_loaded
+    with _lock:
+        _entries.clear()
+        _bundle_loaded = False
+
+
+def asset_files(folders=None):
+    """Файлы папок ASSET_FOLDERS: [(путь, способ разбора), ...]"""
+    files = []
+    for folder, kinds in (folders or ASSET_FOLDERS).items():
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                kind = kinds.get(os.path.splitext(name)[1])
+                if kind:
+                    files.append((os.path.normpath(os.path.join(root, name)), kind))
+    return files
+
+
+def build_bundle(bundle_path=BUNDLE_PATH, folders=None) -> int:
+    """
+    Собирает разобранные файлы в один пакет (атомарная запись).
+    Returns:
+        int: Число файлов в пакете
+    """
+    files = []
+    for path, kind in asset_files(folders):
+        stat = os.stat(path)
+        files.append({'path': path, 'kind': kind, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                      'value': _parse(path, kind)})
+    os.makedirs(os.path.dirname(bundle_path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(bundle_path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'files': files}, f, ensure_ascii=False)
+        os.replace(tmp_path, bundle_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return len(files)
+
+
+if __name__ == '__main__':
+    bundle_path = sys.argv[1] if len(sys.argv) > 1 else BUNDLE_PATH
+    print(f'bundled {build_bundle(bundle_path)} files: {bundle_path}')
@@ -0,0 +1,149 @@
+"""
+Бэкенды запросов страницы ABC/XYZ-анализа.
+
+PostgresBackend выполняет запросы в удалённой БД (Supabase) через пул соединений helpers/db.py.
+DuckDBBackend выполняет те же запросы во встроенной колоночной СУБД DuckDB по локальному
+Parquet-снимку apteka.sales (helpers/snapshot.py): без сети и без доступа к БД.
+Тексты запросов из data/SQL/ABC написаны для PostgreSQL и приводятся к диалекту DuckDB функцией
+to_duckdb. SQLAlchemy и DuckDB импортируются при первом запросе.
+"""
+import os
+import re
+import threading
+import time
+
+from helpers import metrics
+from helpers.snapshot import SNAPSHOT_FOLDER, month_files, read_state
+
+BACKENDS = ("postgres", "duckdb")
+
+# Параметр :name (но не приведение типа ::type)
+_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+_GENERATE_SERIES = re.compile(r"\bgenerate_series\s*\(", re.IGNORECASE)
+_TABLE_CONTEXT = re.compile(r"\b(from|join)\s*$", re.IGNORECASE)
+
+
+def _closing_paren(sql: str, start: int) -> int:
+    """Позиция скобки, закрывающей скобку sql[start]"""
+    depth = 0
+    for pos in range(start, len(sql)):
+        if sql[pos] == "(":
+            depth += 1
+        elif sql[pos] == ")":
+            depth -= 1
+            if depth == 0:
+                return pos
+    raise ValueError("unbalanced parentheses in SQL")
+
+
+def to_duckdb(sql: str) -> str:
+    """
+    Приводит запрос PostgreSQL к диалекту DuckDB:
+    параметры :name заменяются на $name, а generate_series в списке выборки, который в PostgreSQL
+    возвращает строки, а в DuckDB - список, разворачивается через unnest.
+    DATE_TRUNC, приведения ::date/::interval и сравнение с массивом (<> all(...)) DuckDB понимает без изменений.
+    """
+    sql = _PARAM.sub(r"$\1", sql)
+    parts, pos = [], 0
+    for match in _GENERATE_SERIES.finditer(sql):
+        if match.start() < pos or _TABLE_CONTEXT.search(sql, 0, match.start()):
+            continue
+        end = _closing_paren(sql, match.end() - 1)
+        parts += [sql[pos:match.start()], "unnest(", sql[match.start():end + 1], ")"]
+        pos = end + 1
+    return "".join(parts) + sql[pos:]
+
+
+class PostgresBackend:
+    """
+    Запросы в PostgreSQL.
+    Args:
+        engine_factory: Функция, возвращающая Engine (вызывается при первом запросе)
+    """
+    name = "postgres"
+
+    def __init__(self, engine_factory):
+        self._engine_factory = engine_factory
+
+    @property
+    def version(self) -> str:
+        return ""
+
+    def query(self, sql: str, params: dict = None):
+        from helpers.db import run_query
+        return run_query(self._engine_factory(), sql, params)
+
+
+class DuckDBBackend:
+    """
+    Запросы в DuckDB по снимку apteka.sales.
+    Args:
+        folder (str): Папка снимка (helpers/snapshot.py)
+        threads (int): Число потоков DuckDB (по умолчанию - число ядер)
+        memory_limit (str): Ограничение памяти DuckDB, например '1GB'
+    """
+    name = "duckdb"
+
+    def __init__(self, folder=SNAPSHOT_FOLDER, threads=None, memory_limit=None):
+        import duckdb
+
+        self.folder = folder
+        # Деление целых как в PostgreSQL (abc.sql делит целые суммы на 100)
+        config = {"integer_division": True}
+        if threads:
+            config["threads"] = int(threads)
+        if memory_limit:
+            config["memory_limit"] = memory_limit
+        self._connection = duckdb.connect(config=config)
+        self._connection.execute("CREATE SCHEMA apteka")
+        self._lock = threading.Lock()
+        self._view_version = None
+
+    @property
+    def version(self) -> str:
+        """Версия снимка для ключей кэша: время последнего обновления"""
+        return str(read_state(self.folder).get("refreshed", ""))
+
+    def _ensure_view(self):
+        # Представление привязывается к списку файлов при создании, поэтому пересоздаётся после обновления снимка
+        version = self.version
+        with self._lock:
+            if self._view_version == version:
+                return
+            if not month_files(self.folder):
+                raise FileNotFoundError(f"snapshot of apteka.sales not found in {self.folder} "
+                                        f"(python -m helpers.snapshot)")
+            pattern = os.path.join(self.folder, "*.parquet").replace("'", "''")
+            self._connection.execute(f"CREATE OR REPLACE VIEW apteka.sales AS SELECT * FROM read_parquet('{pattern}')")
+            self._view_version = version
+
+    def query(self, sql: str, params: dict = None):
+        from helpers.db import log_query, query_label
+
+        self._ensure_view()
+        label = query_label(sql)
+        start = time.perf_counter()
+        # Соединение DuckDB не разделяется между потоками: у каждого запроса свой курсор
+        cursor = self._connection.cursor()
+        try:
+            with metrics.stage("sql", query=label, backend=self.name):
+                df = cursor.execute(to_duckdb(sql), params or {}).df()
+        finally:
+            cursor.close()
+        log_query(label, time.perf_counter() - start, len(df))
+        return df
+
+
+def make_backend(kind: str, engine_factory=None, **settings):
+    """
+    Бэкенд по настройкам.
+    Args:
+        kind (str): 'postgres' или 'duckdb'
+        engine_factory: Функция, возвращающая Engine PostgreSQL
+        settings: Параметры DuckDBBackend
+    """
+    if kind == "duckdb":
+        return DuckDBBackend(**settings)
+    if kind == "postgres":
+        return PostgresBackend(engine_factory)
+    raise ValueError(f"unknown backend: {kind} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,223 @@
+"""
+Колоночное хранилище датасетов Olist.
+
+Исходные таблицы лежат в data/datasets/ в виде CSV, сжатых gzip. Разбор такого файла
+занимает основную часть холодного старта страницы, поэтому один раз конвертируем их
+в типизированные Parquet-файлы и дальше читаем только нужные колонки.
+
+Конвертация:
+    python -m helpers.dataset_store
+"""
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATASETS_FOLDER = 'data/datasets/'
+COLUMNAR_FOLDER = 'data/columnar/'
+
+# Колонки с небольшим числом уникальных значений, которые храним как категории
+CATEGORICAL_COLUMNS = ('order_status',)
+# Колонки с датой и временем
+DATETIME_SUFFIXES = ('_timestamp', '_date', '_at')
+
+_SOURCE_MTIME_KEY = b'source_mtime_ns'
+_SOURCE_SIZE_KEY = b'source_size'
+# Версия формата копии: копии прежнего формата конвертируются заново (см. write_columnar)
+_LAYOUT_KEY = b'layout'
+LAYOUT_VERSION = b'2'
+
+
+def columnar_path(fname: str, columnar_folder=COLUMNAR_FOLDER) -> str:
+    """Путь к колоночной копии датасета: olist_orders_dataset.csv -> olist_orders_dataset.parquet"""
+    return os.path.join(columnar_folder, os.path.splitext(fname)[0] + '.parquet')
+
+
+def apply_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Приводит колонки Olist-таблиц к компактным типам:
+    идентификаторы и order_status - category, даты - datetime64.
+    """
+    for col in df.columns:
+        if df[col].dtype.name == 'category':
+            continue
+        if col in CATEGORICAL_COLUMNS or (col.endswith('_id') and not pd.api.types.is_numeric_dtype(df[col])):
+            df[col] = df[col].astype('category')
+        elif col.endswith(DATETIME_SUFFIXES) and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+def read_csv_dataset(path: str, columns=None) -> pd.DataFrame:
+    """Читает исходный CSV (gzip) и приводит типы так же, как в колоночной копии"""
+    df = pd.read_csv(path, compression='gzip', usecols=columns)
+    if columns is not None:
+        df = df[list(columns)]
+    return apply_dtypes(df)
+
+
+def is_stale(fname: str, datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER) -> bool:
+    """
+    Проверяет, устарела ли колоночная копия датасета.
+    Копия считается устаревшей, если её нет или исходный CSV изменился после конвертации.
+    """
+    parquet_file = columnar_path(fname, columnar_folder)
+    if not os.path.exists(parquet_file):
+        return True
+    csv_file = os.path.join(datasets_folder, fname)
+    if not os.path.exists(csv_file):
+        # Исходника нет - колоночная копия единственный источник данных
+        return False
+    stat = os.stat(csv_file)
+    metadata = pq.read_schema(parquet_file).metadata or {}
+    return (metadata.get(_SOURCE_MTIME_KEY) != str(stat.st_mtime_ns).encode()
+            or metadata.get(_SOURCE_SIZE_KEY) != str(stat.st_size).encode()
+            or metadata.get(_LAYOUT_KEY) != LAYOUT_VERSION)
+
+
+def convert_dataset(fname: str, datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER,
+                    row_group_size=256_000) -> str:
+    """
+    Конвертирует CSV (gzip) в типизированный Parquet.
+    В метаданные файла записываются mtime и размер исходника для проверки актуальности.
+    Returns:
+        str: Путь к созданному Parquet-файлу
+    """
+    csv_file = os.path.join(datasets_folder, fname)
+    parquet_file = columnar_path(fname, columnar_folder)
+    os.makedirs(columnar_folder, exist_ok=True)
+
+    stat = os.stat(csv_file)
+    # Пишем во временный файл и подменяем атомарно, чтобы читатели не увидели половину файла
+    tmp_file = parquet_file + '.tmp'
+    write_columnar(read_csv_dataset(csv_file), tmp_file, row_group_size, metadata={
+        _SOURCE_MTIME_KEY: str(stat.st_mtime_ns).encode(),
+        _SOURCE_SIZE_KEY: str(stat.st_size).encode(),
+        _LAYOUT_KEY: LAYOUT_VERSION,
+    })
+    os.replace(tmp_file, parquet_file)
+    return parquet_file
+
+
+def write_columnar(df: pd.DataFrame, path: str, row_group_size=256_000, metadata=None):
+    """
+    Записывает таблицу в Parquet так, чтобы группы строк читались независимо.
+    pyarrow записывает словарь category-колонки целиком в каждую группу строк, и чтение любой части
+    файла разбирает все уникальные идентификаторы таблицы; здесь словарь каждой группы - только её значения.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Индексы словарей одной ширины: у групп строк разное число значений, а схема файла общая
+    schema = pa.schema([pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+                        if pa.types.is_dictionary(field.type) else field for field in table.schema],
+                       metadata={**(table.schema.metadata or {}), **(metadata or {})})
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for start in range(0, max(len(table), 1), row_group_size):
+            part = table.slice(start, row_group_size)
+            columns = [pc.dictionary_encode(part[field.name].cast(field.type.value_type)).cast(field.type)
+                       if pa.types.is_dictionary(field.type) else part[field.name] for field in schema]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema), row_group_size=row_group_size)
+
+
+def convert_all(datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER, force=False) -> list:
+    """Конвертирует все CSV из папки датасетов, пропуская актуальные копии"""
+    converted = []
+    for fname in sorted(os.listdir(datasets_folder)):
+        if not fname.endswith('.csv'):
+            continue
+        if force or is_stale(fname, datasets_folder, columnar_folder):
+            converted.append(convert_dataset(fname, datasets_folder, columnar_folder))
+    return converted
+
+
+def read_columnar(fname: str, columns=None, columnar_folder=COLUMNAR_FOLDER, memory_map=True) -> pd.DataFrame:
+    """Читает колоночную копию датасета, загружая только запрошенные колонки"""
+    table = pq.read_table(columnar_path(fname, columnar_folder), columns=columns, memory_map=memory_map)
+    return table.to_pandas()
+
+
+def read_dataset(fname: str, columns=None, datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER,
+                 memory_map=True) -> pd.DataFrame:
+    """
+    Читает датасет из колоночной копии, если она актуальна, иначе из исходного CSV.
+    Args:
+        fname (str): Имя исходного файла, например 'olist_orders_dataset.csv'
+        columns (list): Колонки, которые нужно загрузить (None - все)
+        memory_map (bool): Отображать Parquet-файл в память вместо чтения
+    Returns:
+        pd.DataFrame: Датасет с приведёнными типами; в attrs['source'] - версия прочитанного файла
+    """
+    if not is_stale(fname, datasets_folder, columnar_folder):
+        path = columnar_path(fname, columnar_folder)
+        df = read_columnar(fname, columns, columnar_folder, memory_map)
+    else:
+        path = os.path.join(datasets_folder, fname)
+        df = read_csv_dataset(path, columns)
+    df.attrs['source'] = source_signature(path)
+    return df
+
+
+def dataset_version(fname: str, datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER) -> str:
+    """Версия файла, из которого read_dataset прочитает датасет (см. source_signature)"""
+    if not is_stale(fname, datasets_folder, columnar_folder):
+        return source_signature(columnar_path(fname, columnar_folder))
+    return source_signature(os.path.join(datasets_folder, fname))
+
+
+def source_signature(path: str) -> str:
+    """Версия файла-источника: путь, mtime и размер. Сохраняется в attrs['source'] прочитанной таблицы"""
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def _plain_dataset(path: str) -> ds.Dataset:
+    """Parquet-файл как набор данных, в котором category-колонки читаются строками"""
+    schema = pa.schema([pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type)
+                        else field for field in pq.read_schema(path)])
+    return ds.dataset(path, schema=schema, format='parquet')
+
+
+def iter_dataset(fname: str, columns=None, batch_rows=256_000, datasets_folder=DATASETS_FOLDER,
+                 columnar_folder=COLUMNAR_FOLDER):
+    """
+    Читает датасет частями по batch_rows строк: из колоночной копии, если она актуальна, иначе из исходного CSV.
+    Типы частей приводятся так же, как в read_dataset, но категории у каждой части свои.
+    """
+    if not is_stale(fname, datasets_folder, columnar_folder):
+        # category-колонки читаем строками: иначе каждая часть несёт словарь всей группы строк файла,
+        # а категории части строит apply_dtypes только по её значениям
+        batches = _plain_dataset(columnar_path(fname, columnar_folder)).to_batches(
+            columns=columns, batch_size=batch_rows, batch_readahead=0, fragment_readahead=0)
+        for batch in batches:
+            yield apply_dtypes(batch.to_pandas())
+        return
+    chunks = pd.read_csv(os.path.join(datasets_folder, fname), compression='gzip', usecols=columns,
+                         chunksize=batch_rows)
+    for chunk in chunks:
+        yield apply_dtypes(chunk[list(columns)] if columns is not None else chunk)
+
+
+def dataset_rows(fname: str, datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER):
+    """Число строк датасета по метаданным колоночной копии; None, если копия устарела (CSV без чтения не посчитать)"""
+    if is_stale(fname, datasets_folder, columnar_folder):
+        return None
+    return pq.ParquetFile(columnar_path(fname, columnar_folder)).metadata.num_rows
+
+
+def read_dataset_head(fname: str, n=5, datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER) -> pd.DataFrame:
+    """
+    Читает первые n строк датасета со всеми колонками, не загружая файл целиком.
+    Категории строятся только по прочитанным строкам: словарь группы строк в превью не попадает.
+    """
+    if not is_stale(fname, datasets_folder, columnar_folder):
+        return apply_dtypes(_plain_dataset(columnar_path(fname, columnar_folder)).head(n).to_pandas())
+    return apply_dtypes(pd.read_csv(os.path.join(datasets_folder, fname), compression='gzip', nrows=n))
+
+
+if __name__ == '__main__':
+    force = '--force' in sys.argv[1:]
+    for path in convert_all(force=force):
+        print(f'converted: {path}')
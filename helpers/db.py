@@ -0,0 +1,84 @@
+"""
+Подключение к БД: пул соединений и выполнение запросов с привязкой параметров.
+Модуль не зависит от Streamlit, поэтому используется и страницами, и бенчмарками.
+"""
+import logging
+import time
+from collections import deque
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
+
+from helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+# Параметры пула по умолчанию; переопределяются секцией [SUPABASE_POOL] в secrets.toml
+POOL_DEFAULTS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    "statement_timeout_ms": 60_000,
+}
+
+# Последние выполненные запросы: (начало текста запроса, время в секундах, число строк)
+query_latencies = deque(maxlen=200)
+
+
+def make_engine(connection_string: str, **settings) -> Engine:
+    """
+    Создаёт engine с пулом соединений.
+    Args:
+        connection_string (str): Строка подключения SQLAlchemy
+        settings: pool_size, max_overflow, pool_recycle, pool_pre_ping, statement_timeout_ms
+    Returns:
+        Engine: Engine, который следует переиспользовать для всех запросов процесса
+    """
+    settings = {**POOL_DEFAULTS, **settings}
+    url = make_url(connection_string)
+    kwargs = {"pool_pre_ping": settings["pool_pre_ping"]}
+    if url.get_backend_name() == "postgresql":
+        kwargs.update(
+            pool_size=settings["pool_size"],
+            max_overflow=settings["max_overflow"],
+            pool_recycle=settings["pool_recycle"],
+            # Ограничение времени выполнения запроса на стороне сервера
+            connect_args={"options": f"-c statement_timeout={int(settings['statement_timeout_ms'])}"},
+        )
+    elif url.get_backend_name() == "sqlite":
+        # Локальная замена БД для тестов и бенчмарков: таймаут ожидания блокировки в секундах
+        kwargs["connect_args"] = {"timeout": settings["statement_timeout_ms"] / 1000}
+    return create_engine(url, **kwargs)
+
+
+def run_query(engine: Engine, sql: str, params: dict = None) -> pd.DataFrame:
+    """
+    Выполняет SQL-запрос с привязкой параметров (:name) и замеряет время выполнения.
+    Текст запроса не зависит от значений параметров, поэтому СУБД может переиспользовать план.
+    Args:
+        engine (Engine): Engine с пулом соединений
+        sql (str): SQL-запрос
+        params (dict): Значения параметров запроса
+    Returns:
+        pd.DataFrame: Результат запроса
+    """
+    label = query_label(sql)
+    start = time.perf_counter()
+    with metrics.stage("sql", query=label), engine.connect() as connection:
+        df = pd.read_sql(text(sql), connection, params=params or {})
+    log_query(label, time.perf_counter() - start, len(df))
+    return df
+
+
+def query_label(sql: str) -> str:
+    """Начало текста запроса в одну строку (для журнала и отладочной панели)"""
+    return " ".join(sql.split())[:80]
+
+
+def log_query(label: str, elapsed: float, rows: int):
+    """Сохраняет время выполнения запроса в query_latencies, счётчики и журнал"""
+    metrics.count("payload.sql_rows", rows)
+    query_latencies.append((label, elapsed, rows))
+    logger.info("query %.3fs, %d rows: %s", elapsed, rows, label)
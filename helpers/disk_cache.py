@@ -0,0 +1,139 @@
+"""
+Дисковый кэш результатов (DataFrame) в Parquet-файлах.
+
+В отличие от st.cache_data кэш переживает перезапуск сервера и общий для всех процессов,
+работающих с одной папкой. Запись атомарна (временный файл + os.replace), устаревшие
+записи удаляются по TTL, а при превышении размера папки - в порядке давности использования.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+CACHE_FOLDER = '.cache/results/'
+
+
+def fingerprint(value) -> str:
+    """
+    Стабильное строковое представление аргумента для ключа кэша.
+    Для DataFrame и Series используется хеш содержимого.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        content = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        columns = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        return 'frame:' + hashlib.sha256(content.tobytes() + repr((columns, value.shape)).encode()).hexdigest()
+    return json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def cache_key(*parts) -> str:
+    """Ключ кэша: sha256 от представлений всех частей"""
+    return hashlib.sha256('\x1f'.join(fingerprint(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Кэш DataFrame на диске.
+    Args:
+        folder (str): Папка кэша
+        ttl (float): Время жизни записи в секундах (None - без ограничения)
+        max_bytes (int): Максимальный суммарный размер файлов кэша
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, ttl=24 * 3600, max_bytes=512 * 2 ** 20):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Счётчики текущего процесса
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + '.parquet')
+
+    def get(self, key: str):
+        """Возвращает DataFrame из кэша или None, если записи нет или она устарела"""
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+                # Устаревшую запись удаляет evict: здесь файл мог только что заменить другой процесс
+                self.stats["misses"] += 1
+                return None
+            df = pd.read_parquet(path)
+            # Время последнего использования храним в atime: по нему вытесняются записи
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (OSError, ValueError):
+            # Записи нет, её удалил другой процесс или файл повреждён
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        """Атомарно записывает DataFrame в кэш и вытесняет старые записи при переполнении"""
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                df.to_parquet(f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+        self.stats["writes"] += 1
+        self.evict()
+
+    def evict(self):
+        """Удаляет устаревшие записи и самые давно использованные, пока кэш больше max_bytes"""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.parquet'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if self.ttl is not None and now - stat.st_mtime > self.ttl:
+                if self._remove_unchanged(entry.path, stat):
+                    self.stats["evictions"] += 1
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path, stat))
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, path, stat in sorted(entries, key=lambda entry: entry[:3]):
+            if total <= self.max_bytes:
+                break
+            if self._remove_unchanged(path, stat):
+                self.stats["evictions"] += 1
+            total -= size
+
+    def clear(self):
+        """Удаляет все записи кэша"""
+        if os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                self._remove(entry.path)
+
+    @classmethod
+    def _remove_unchanged(cls, path: str, stat: os.stat_result) -> bool:
+        """
+        Удаляет запись, только если файл тот же, что был прочитан stat: другой процесс мог заменить его
+        свежей записью (os.replace создаёт новый файл с другим inode).
+        """
+        try:
+            current = os.stat(path)
+        except OSError:
+            return False
+        if (current.st_ino, current.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+            return False
+        cls._remove(path)
+        return True
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
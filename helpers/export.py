@@ -0,0 +1,96 @@
+"""
+Выгрузка таблиц в файлы для скачивания.
+
+Файл пишется во временную папку частями по chunk_rows строк, поэтому пиковое потребление
+памяти не зависит от числа строк таблицы. Поддерживаются CSV, CSV со сжатием gzip и Parquet.
+"""
+import gzip
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_FOLDER = '.cache/exports/'
+CHUNK_ROWS = 100_000
+
+# Формат: (название, расширение файла, MIME-тип)
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def _chunks(df: pd.DataFrame, chunk_rows: int):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df: pd.DataFrame, f, chunk_rows=CHUNK_ROWS, index=True):
+    """Пишет CSV в открытый текстовый файл частями; заголовок - только у первой части"""
+    if len(df) == 0:
+        df.to_csv(f, index=index)
+    for n, chunk in enumerate(_chunks(df, chunk_rows)):
+        chunk.to_csv(f, header=n == 0, index=index)
+
+
+def write_parquet(df: pd.DataFrame, path: str, chunk_rows=CHUNK_ROWS):
+    """Пишет Parquet по одной группе строк на часть таблицы"""
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def export_frame(df: pd.DataFrame, fmt="csv", folder=EXPORT_FOLDER, chunk_rows=CHUNK_ROWS, index=True) -> str:
+    """
+    Выгружает DataFrame во временный файл.
+    Args:
+        df (pd.DataFrame): Данные
+        fmt (str): Ключ EXPORT_FORMATS
+        folder (str): Папка для файлов выгрузки
+        chunk_rows (int): Число строк, сериализуемых за один раз
+        index (bool): Записывать индекс в CSV
+    Returns:
+        str: Путь к файлу; удаляется вызывающей стороной или remove_stale_exports
+    """
+    _, suffix, _ = EXPORT_FORMATS[fmt]
+    os.makedirs(folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=folder, suffix=suffix)
+    try:
+        if fmt == "parquet":
+            os.close(fd)
+            write_parquet(df, path, chunk_rows)
+        elif fmt == "csv.gz":
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8', newline='') as f:
+                write_csv(df, f, chunk_rows, index)
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                write_csv(df, f, chunk_rows, index)
+    except Exception:
+        remove_export(path)
+        raise
+    return path
+
+
+def remove_export(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_stale_exports(folder=EXPORT_FOLDER, max_age=3600):
+    """Удаляет файлы выгрузки старше max_age секунд (например, оставшиеся от закрытых сессий)"""
+    if not os.path.isdir(folder):
+        return
+    now = time.time()
+    for entry in os.scandir(folder):
+        try:
+            if now - entry.stat().st_mtime > max_age:
+                remove_export(entry.path)
+        except OSError:
+            continue
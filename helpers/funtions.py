@@ -1,77 +1,301 @@
+import copy
 import pandas as pd
 import streamlit as st
-import json
-from st_aggrid import GridOptionsBuilder, AgGrid, DataReturnMode
+import os
+from helpers import assets, metrics
+from helpers.dataset_store import dataset_version, read_dataset, read_dataset_head
+from helpers.export import EXPORT_FORMATS, export_frame, remove_export, remove_stale_exports
+from helpers.grid_core import PAGE_SIZES, GridResult, compact_categories, filter_rows, page_bounds, sort_positions
+from helpers.rfm_core import read_only
 # install streamlit-aggrid-bugfix==0.3.4.post4
+# st_aggrid и helpers.db импортируются при первом использовании: они не нужны до вывода первой таблицы
 
 
 def read_template(fname: str, template_folder='data/templates/') -> str:
     fname = template_folder + fname
     template_text = "Данные не загружены"
     try:
-        with open(fname, mode="r", encoding="utf-8") as f:
-            template_text = f.read()
+        template_text = assets.load(fname)
     except Exception as e:
-        print(e)
+        metrics.report_error("read_template", e)
     return template_text
 
 
+def load_dataset(fname: str, columns=None, datasets_folder='data/datasets/') -> pd.DataFrame:
+    """
+    Загружает датасет из колоночной копии (см. helpers/dataset_store.py),
+    если она актуальна, иначе из исходного CSV.
+    Таблица одна на процесс и общая для всех сессий (защищена от записи), пока не изменится файл датасета.
+    Args:
+        fname (str): Имя файла датасета
+        columns (list): Колонки, которые нужно загрузить (None - все)
+    Returns:
+        pd.DataFrame: Датасет
+    """
+    try:
+        version = dataset_version(fname, datasets_folder=datasets_folder)
+    except OSError as e:
+        metrics.report_error("load_dataset", e)
+        return pd.DataFrame()
+    return _load_dataset(fname, columns, datasets_folder, version)
+
+
+@metrics.cached("load_dataset")
+@st.cache_resource(max_entries=16)
+def _load_dataset(fname: str, columns, datasets_folder: str, version: str) -> pd.DataFrame:
+    """
+    Общая для сессий копия датасета: st.cache_data отдавал бы каждому перезапуску скрипта свою копию таблицы.
+    version (путь, mtime и размер файла) входит в ключ кэша, чтобы изменённый датасет прочитался заново.
+    """
+    metrics.cache_miss()
+    df = pd.DataFrame()
+    try:
+        df = read_only(read_dataset(fname, columns, datasets_folder=datasets_folder))
+    except Exception as e:
+        metrics.report_error("load_dataset", e)
+    metrics.count("payload.load_dataset_bytes", metrics.frame_bytes(df))
+    return df
+
+
+@metrics.cached("load_dataset_head")
 @st.cache_data
-def load_dataset(fname: str, datasets_folder='data/datasets/') -> pd.DataFrame:
-    fname = datasets_folder + fname
+def load_dataset_head(fname: str, n=5, datasets_folder='data/datasets/') -> pd.DataFrame:
+    """Загружает первые n строк датасета для примеров данных"""
+    metrics.cache_miss()
     df = pd.DataFrame()
     try:
-        df = pd.read_csv(fname, compression='gzip')
+        df = read_dataset_head(fname, n, datasets_folder=datasets_folder)
     except Exception as e:
-        print(e)
+        metrics.report_error("load_dataset_head", e)
     return df
 
 
 def load_lottiefile(fname, pth='./static/'):
+    """Анимация Lottie; разбирается один раз на процесс (helpers/assets.py), объект не изменять"""
     fname = pth + fname
-    with open(fname, 'r') as f:
-        try:
-            return json.load(f)
-        except Exception as e:
-            print(e)
-            return None
+    try:
+        return assets.load(fname, 'json:utf-8')
+    except ValueError as e:
+        metrics.report_error("load_lottiefile", e)
+        return None
 
 def read_sql(fname: str, params=None, sql_folder='data/SQL/') -> str:
     fname = sql_folder + fname
     sql_text = "SELECT 'Sql script not found'"
     try:
-        with open(fname, mode="r", encoding="utf-8") as f:
-            sql_text = f.read()
+        sql_text = assets.load(fname)
     except Exception as e:
-        print(e)
+        metrics.report_error("read_sql", e)
     if params:
         sql_text = sql_text.format(**params)
     return sql_text
 
 
-def get_grid(df: pd.DataFrame, **params):
+# Таблицы больше этого числа строк сортируются, фильтруются и листаются на сервере
+SERVER_SIDE_ROWS = 1000
+
+
+def get_grid(df: pd.DataFrame, key=None, server_side=None, **params):
     """
     Создаёт интерактивную таблицу с возможностью сортировки и фильтрации.
+    Args:
+        df (pd.DataFrame): Данные таблицы
+        key (str): Уникальный ключ таблицы на странице (нужен для серверного режима)
+        server_side (bool): Серверный режим; по умолчанию включается для таблиц больше SERVER_SIDE_ROWS строк
+        params: Дополнительные параметры gridOptions
+    Returns:
+        Ответ AgGrid или GridResult; в обоих случаях отфильтрованные данные доступны через .data и ["data"]
     """
+    if server_side is None:
+        server_side = len(df) > SERVER_SIDE_ROWS
+    if server_side:
+        with metrics.stage("grid", key=key, server_side=True):
+            return _get_server_side_grid(df, key or "grid", **params)
+
+    from st_aggrid import AgGrid, DataReturnMode, GridOptionsBuilder
+    # Подвыборка большой таблицы (например, клиенты сегмента) иначе передаёт в браузер все её категории
+    df = compact_categories(df)
     gb = GridOptionsBuilder.from_dataframe(df)
     gb.configure_pagination(paginationAutoPageSize=True)
     grid_options = gb.build()
     if params:
         grid_options.update(**params)
-    grid_response = AgGrid(
-        df,
+    metrics.count("payload.grid_rows", len(df))
+    metrics.count("payload.grid_bytes", metrics.frame_bytes(df))
+    with metrics.stage("grid", key=key, server_side=False):
+        grid_response = AgGrid(
+            df,
+            gridOptions=grid_options,
+            width="100%",
+            fit_columns_on_grid_load=True,
+            data_return_mode=DataReturnMode.FILTERED_AND_SORTED,
+            key=key
+        )
+    return grid_response
+
+
+def _column_filter(values: pd.Series, key: str):
+    """
+    Условие фильтра колонки для grid_core.column_mask, как фильтры колонок AgGrid:
+    диапазон для чисел и дат, подстрока для остальных колонок.
+    """
+    name = str(values.name)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        col_low, col_high = st.columns(2)
+        low = col_low.number_input(f"{name}: от", value=None, key=f"{key}_low")
+        high = col_high.number_input(f"{name}: до", value=None, key=f"{key}_high")
+        return low, high
+    if pd.api.types.is_datetime64_any_dtype(values):
+        col_low, col_high = st.columns(2)
+        low = col_low.date_input(f"{name}: с", value=None, key=f"{key}_low")
+        high = col_high.date_input(f"{name}: по", value=None, key=f"{key}_high")
+        # Верхняя граница - конец выбранного дня
+        return low, None if high is None else pd.Timestamp(high) + pd.Timedelta(days=1) - pd.Timedelta(1)
+    return st.text_input(f"{name}: содержит", key=f"{key}_text")
+
+
+def _get_server_side_grid(df: pd.DataFrame, key: str, **params) -> GridResult:
+    """
+    Таблица, которая сортируется, фильтруется и листается средствами pandas на сервере.
+    В браузер передаётся только текущая страница, обратно AgGrid данные не возвращает.
+    """
+    from st_aggrid import AgGrid, DataReturnMode, GridOptionsBuilder, GridUpdateMode
+    col_search, col_sort, col_order, col_size = st.columns([3, 2, 1, 1])
+    with col_search:
+        query = st.text_input("Поиск", key=f"{key}_query", placeholder="Поиск по текстовым колонкам")
+    with col_sort:
+        sort_by = st.selectbox("Сортировка", [None] + list(df.columns), key=f"{key}_sort_by",
+                               format_func=lambda col: "Без сортировки" if col is None else str(col))
+    with col_order:
+        ascending = st.selectbox("Порядок", (True, False), key=f"{key}_ascending",
+                                 format_func=lambda asc: "По возрастанию" if asc else "По убыванию")
+    with col_size:
+        page_size = st.selectbox("Строк на странице", PAGE_SIZES, key=f"{key}_page_size")
+
+    with st.expander("Фильтры по колонкам"):
+        column_filters = {col: _column_filter(df[col], f"{key}_filter_{col}")
+                          for col in st.multiselect("Колонки", list(df.columns), key=f"{key}_filter_columns")}
+
+    state = (query, tuple(column_filters.items()), sort_by, ascending)
+    result = GridResult(df, sort_positions(df, filter_rows(df, query, column_filters), sort_by, ascending), state)
+    _, _, n_pages = page_bounds(len(result), 1, page_size)
+    page = st.number_input("Страница", min_value=1, max_value=n_pages, value=1, step=1, key=f"{key}_page")
+    start, stop, _ = page_bounds(len(result), page, page_size)
+
+    page_df = result.page(start, stop)
+    metrics.count("payload.grid_rows", len(page_df))
+    metrics.count("payload.grid_bytes", metrics.frame_bytes(page_df))
+    gb = GridOptionsBuilder.from_dataframe(page_df)
+    # Сортировка и фильтры в браузере видят только текущую страницу, поэтому отключены
+    gb.configure_default_column(sortable=False, filter=False)
+    grid_options = gb.build()
+    if params:
+        grid_options.update(**params)
+    AgGrid(
+        page_df,
         gridOptions=grid_options,
         width="100%",
         fit_columns_on_grid_load=True,
-        data_return_mode=DataReturnMode.FILTERED_AND_SORTED
+        update_mode=GridUpdateMode.NO_UPDATE,
+        data_return_mode=DataReturnMode.AS_INPUT,
+        key=f"{key}_page_grid"
     )
-    return grid_response
+    st.caption(f"Строки {start + 1 if stop else 0}–{stop} из {len(result)} (страница {page} из {n_pages})")
+    return result
+
+def download_widget(source, key: str, signature=None, file_name="data"):
+    """
+    Кнопка скачивания, которая формирует файл только по запросу пользователя.
+    Файл пишется на диск частями (helpers/export.py) и используется, пока не изменится signature.
+    Args:
+        source: DataFrame или ответ get_grid (данные берутся из ["data"] только при подготовке файла)
+        key (str): Уникальный ключ на странице
+        signature: Версия данных (например, параметры сегментации и фильтры таблицы)
+        file_name (str): Имя файла без расширения
+    """
+    col_format, col_button = st.columns([1, 3])
+    with col_format:
+        fmt = st.selectbox("Формат", tuple(EXPORT_FORMATS), format_func=lambda f: EXPORT_FORMATS[f][0],
+                           label_visibility="collapsed", key=f"{key}_format")
+    signature = (signature, fmt)
+    state = st.session_state.get(f"{key}_export")
+    if state is not None and state["signature"] != signature:
+        # Данные или формат изменились: подготовленный файл больше не соответствует таблице
+        remove_export(state["path"])
+        state = st.session_state[f"{key}_export"] = None
+
+    with col_button:
+        if state is None and st.button("Подготовить файл", key=f"{key}_prepare"):
+            remove_stale_exports()
+            try:
+                df = source if isinstance(source, pd.DataFrame) else source.get("data")
+                with metrics.stage("export", key=key, fmt=fmt, rows=len(df)):
+                    state = {"path": export_frame(df, fmt), "signature": signature}
+                metrics.count("payload.export_bytes", os.path.getsize(state["path"]))
+                st.session_state[f"{key}_export"] = state
+            except Exception as e:
+                metrics.report_error("export", e)
+                st.error("Не удалось подготовить файл")
+        if state is not None:
+            _, suffix, mime = EXPORT_FORMATS[fmt]
+            try:
+                # Отмечаем использование, чтобы файл не удалил remove_stale_exports
+                os.utime(state["path"])
+                with open(state["path"], "rb") as f:
+                    st.download_button("Скачать данные", data=f, file_name=file_name + suffix, mime=mime,
+                                       key=f"{key}_download")
+            except OSError as e:
+                metrics.report_error("export", e)
+                st.session_state[f"{key}_export"] = None
+
 
 def get_settings(fname: str, template_folder='data/templates/', encoding='cp1251'):
     fname = template_folder + fname
     try:
-        with open(fname, 'r', encoding=encoding) as f:
-            j = json.load(f)
-            return j
+        # Копия: настройки из кэша общие для всех сессий
+        return copy.deepcopy(assets.load(fname, f'json:{encoding}'))
     except Exception as e:
-        print(e)
\ No newline at end of file
+        metrics.report_error("get_settings", e)
+
+
+def debug_enabled() -> bool:
+    """Отладочная панель включается параметром ?debug=1 в адресе страницы или переменной DASHBOARD_DEBUG=1"""
+    return st.query_params.get("debug") == "1" or os.environ.get("DASHBOARD_DEBUG") == "1"
+
+
+def metrics_panel(result_cache=None):
+    """
+    Завершает замеры прогона страницы (helpers/metrics.py) и, если включена отладка,
+    показывает их: этапы с временем и пиком памяти, счётчики кэшей и объёмов данных, ошибки,
+    последние запросы к БД и прогоны страниц. Вызывается в конце скрипта страницы.
+    Args:
+        result_cache (DiskCache): Дисковый кэш результатов запросов, статистику которого нужно показать
+    """
+    run = metrics.end_run()
+    if not debug_enabled():
+        return
+    from helpers.db import query_latencies
+    with st.expander("Замеры производительности", expanded=True):
+        # tracemalloc замедляет все сессии процесса, поэтому из интерфейса не включается
+        if not metrics.TRACE_MEMORY:
+            st.caption("Пик памяти этапов замеряется при запуске с переменной окружения DASHBOARD_TRACE_MEMORY=1")
+        if run is not None:
+            st.markdown(f"**Прогон страницы:** {run.seconds:.3f} с")
+            if run.stages:
+                st.dataframe(pd.DataFrame(run.stages), hide_index=True)
+            if run.errors:
+                st.markdown("**Ошибки**")
+                st.dataframe(pd.DataFrame(run.errors), hide_index=True)
+        counters = dict(metrics.totals)
+        if result_cache is not None:
+            counters.update({f"disk_cache.{name}": value for name, value in result_cache.stats.items()})
+        if counters:
+            st.markdown("**Счётчики процесса**")
+            st.dataframe(pd.Series(counters, name="value").sort_index(), height=240)
+        if query_latencies:
+            st.markdown("**Последние запросы к БД**")
+            st.dataframe(pd.DataFrame(list(query_latencies), columns=["query", "seconds", "rows"]), hide_index=True)
+        if metrics.recent_runs:
+            st.markdown("**Последние прогоны страниц**")
+            st.dataframe(pd.DataFrame([{"page": r.page, "seconds": r.seconds, "stages": len(r.stages),
+                                        "errors": len(r.errors)} for r in metrics.recent_runs]), hide_index=True)
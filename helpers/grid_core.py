@@ -0,0 +1,134 @@
+"""
+Серверная фильтрация, сортировка и постраничная выдача таблиц для get_grid.
+Модуль не зависит от Streamlit: в браузер передаётся только текущая страница,
+а полный отфильтрованный результат собирается на сервере по требованию.
+"""
+import math
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+PAGE_SIZES = (20, 50, 100, 500)
+
+
+def filter_positions(df: pd.DataFrame, query: str, as_mask=False) -> np.ndarray:
+    """
+    Номера строк (или маска строк при as_mask), в текстовых колонках которых встречается подстрока query
+    (без учёта регистра). Для категориальных колонок поиск выполняется по категориям, а не по каждой строке.
+    """
+    if not query:
+        return np.ones(len(df), dtype=bool) if as_mask else np.arange(len(df))
+    query = query.lower()
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            matched = values.cat.categories.astype(str).str.lower().str.contains(query, regex=False)
+            codes = values.cat.codes.to_numpy()
+            mask |= (codes >= 0) & np.append(matched, False)[codes]
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            mask |= values.astype(str).str.lower().str.contains(query, regex=False).to_numpy()
+    return mask if as_mask else np.flatnonzero(mask)
+
+
+def column_mask(values: pd.Series, condition) -> np.ndarray:
+    """
+    Условие фильтра одной колонки, как фильтры колонок AgGrid:
+    для чисел и дат - диапазон (от, до), границы включаются, None - без границы;
+    для остальных колонок - подстрока (без учёта регистра).
+    """
+    if isinstance(condition, tuple):
+        low, high = condition
+        if pd.api.types.is_datetime64_any_dtype(values):
+            low, high = (None if bound is None else pd.Timestamp(bound) for bound in (low, high))
+        mask = values.notna().to_numpy().copy()
+        if low is not None:
+            mask &= (values >= low).to_numpy()
+        if high is not None:
+            mask &= (values <= high).to_numpy()
+        return mask
+    return filter_positions(values.to_frame(), str(condition), as_mask=True)
+
+
+def filter_rows(df: pd.DataFrame, query: str, column_filters=None) -> np.ndarray:
+    """
+    Номера строк, подходящих под поиск query (см. filter_positions) и все фильтры колонок
+    column_filters: {колонка: условие} (см. column_mask).
+    """
+    mask = filter_positions(df, query, as_mask=True)
+    for column, condition in (column_filters or {}).items():
+        mask &= column_mask(df[column], condition)
+    return np.flatnonzero(mask)
+
+
+def sort_positions(df: pd.DataFrame, positions: np.ndarray, column=None, ascending=True) -> np.ndarray:
+    """Упорядочивает номера строк по значению колонки (устойчивая сортировка, пропуски в конце)"""
+    if column is None or len(positions) == 0:
+        return positions
+    order = df[column].iloc[positions].reset_index(drop=True) \
+        .sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+
+def page_bounds(n_rows: int, page: int, page_size: int):
+    """Границы строк страницы (нумерация страниц с 1) и число страниц"""
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    page = min(max(1, page), n_pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, n_rows), n_pages
+
+
+def compact_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Таблица, в категориальных колонках которой оставлены только встречающиеся значения.
+    AgGrid передаёт таблицу в браузер в формате Arrow вместе со словарём категорий,
+    поэтому срез большой таблицы иначе несёт все её категории.
+    """
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df
+    df = df.copy(deep=False)
+    for col in categorical:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+class GridResult:
+    """
+    Результат get_grid в серверном режиме.
+    Полный отфильтрованный и отсортированный DataFrame собирается только при обращении к data,
+    а текущая страница - срез по номерам строк.
+    """
+
+    def __init__(self, df: pd.DataFrame, positions: np.ndarray, state=None):
+        self.source = df
+        self.positions = positions
+        # Поиск, фильтры колонок и сортировка, по которым получены строки (для ключей кэша и выгрузки)
+        self.state = state
+
+    def __len__(self):
+        return len(self.positions)
+
+    @cached_property
+    def data(self) -> pd.DataFrame:
+        if len(self.positions) == len(self.source) and \
+                np.array_equal(self.positions, np.arange(len(self.source))):
+            return self.source
+        return self.source.iloc[self.positions]
+
+    def page(self, start: int, stop: int) -> pd.DataFrame:
+        """Строки страницы; категории - только встречающиеся на странице (см. compact_categories)"""
+        return compact_categories(self.source.iloc[self.positions[start:stop]])
+
+    # Совместимость с ответом AgGrid: grid_response["data"], grid_response.get("data")
+    def __getitem__(self, key):
+        if key == "data":
+            return self.data
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
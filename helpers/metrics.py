@@ -0,0 +1,204 @@
+"""
+Замеры времени и памяти этапов расчёта, счётчики кэшей и объёмов данных.
+
+Этап оборачивается в stage (контекстный менеджер или декоратор). Замеры одного прогона
+страницы собираются между begin_run и end_run, показываются в отладочной панели
+(helpers/funtions.metrics_panel) и, если задана переменная окружения DASHBOARD_METRICS_LOG,
+дописываются строкой JSON в файл журнала. Модуль не зависит от Streamlit.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# Файл журнала метрик (JSON lines); без переменной окружения журнал не пишется
+METRICS_LOG = os.environ.get("DASHBOARD_METRICS_LOG")
+# При превышении размера журнал переименовывается в <имя>.1
+METRICS_LOG_MAX_BYTES = 10 * 2 ** 20
+# Замер пиковой памяти через tracemalloc. Замедляет расчёты всего процесса, а пик общий для процесса:
+# при одновременных прогонах пики этапов смешиваются. Поэтому включается только переменной окружения
+# (для профилирования одной сессии) или из скриптов (benchmarks/run.py), но не из интерфейса
+TRACE_MEMORY = os.environ.get("DASHBOARD_TRACE_MEMORY") == "1"
+
+# Последние прогоны страниц в текущем процессе
+recent_runs = deque(maxlen=50)
+# Счётчики процесса: попадания и промахи кэшей, число ошибок, объёмы переданных данных
+totals = Counter()
+
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+_stack = contextvars.ContextVar("metrics_stack", default=())
+_log_lock = threading.Lock()
+
+
+class Run:
+    """Замеры одного прогона страницы"""
+
+    def __init__(self, page: str):
+        self.page = page
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.stages = []
+        self.counters = Counter()
+        self.errors = []
+
+    def to_dict(self) -> dict:
+        return {"ts": self.started, "page": self.page, "seconds": self.seconds, "stages": self.stages,
+                "counters": dict(self.counters), "errors": self.errors}
+
+
+def begin_run(page: str) -> Run:
+    """Начинает сбор замеров прогона страницы (вызывается в начале скрипта страницы)"""
+    run = Run(page)
+    _current_run.set(run)
+    _stack.set(())
+    return run
+
+
+def current_run():
+    return _current_run.get()
+
+
+def end_run():
+    """Завершает прогон: сохраняет его в recent_runs и журнал"""
+    run = _current_run.get()
+    if run is None:
+        return None
+    run.seconds = time.perf_counter() - run.start
+    recent_runs.append(run)
+    _write_log(run.to_dict())
+    _current_run.set(None)
+    return run
+
+
+def _write_log(record: dict):
+    if not METRICS_LOG:
+        return
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(METRICS_LOG) or ".", exist_ok=True)
+            if os.path.exists(METRICS_LOG) and os.path.getsize(METRICS_LOG) > METRICS_LOG_MAX_BYTES:
+                os.replace(METRICS_LOG, METRICS_LOG + ".1")
+            with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logger.warning("metrics log is not written: %s", e)
+
+
+def set_trace_memory(enabled: bool):
+    """Включает или выключает замер пиковой памяти для всех последующих этапов процесса (только для скриптов)"""
+    global TRACE_MEMORY
+    TRACE_MEMORY = enabled
+    if not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def count(name: str, value=1):
+    """Увеличивает счётчик прогона и процесса"""
+    totals[name] += value
+    run = _current_run.get()
+    if run is not None:
+        run.counters[name] += value
+
+
+def report_error(name: str, error: Exception):
+    """Регистрирует перехваченную ошибку: журнал с трассировкой, счётчик и список ошибок прогона"""
+    logger.error("%s failed: %s", name, error, exc_info=error)
+    count(f"errors.{name}")
+    run = _current_run.get()
+    if run is not None:
+        run.errors.append({"stage": name, "error": repr(error)})
+
+
+class stage:
+    """
+    Замер этапа: время выполнения и, при TRACE_MEMORY, пик памяти внутри этапа.
+    Используется как контекстный менеджер (with stage("load", fname=...)) или декоратор (@stage("load")).
+    """
+
+    def __init__(self, name: str, **tags):
+        self.name = name
+        self.tags = tags
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(self.name, **self.tags):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self._token = _stack.set(_stack.get() + (self,))
+        self._child_peak = 0
+        self._trace = TRACE_MEMORY
+        if self._trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        record = {"stage": self.name, "seconds": round(seconds, 6), "depth": len(_stack.get()) - 1, **self.tags}
+        if self._trace and tracemalloc.is_tracing():
+            # Вложенный этап сбрасывает пик, поэтому учитываем и пики вложенных этапов
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            record["peak_bytes"] = peak - self._memory_start
+            parents = _stack.get()[:-1]
+            if parents and getattr(parents[-1], "_trace", False):
+                parents[-1]._child_peak = max(parents[-1]._child_peak, peak)
+        if exc is not None:
+            record["error"] = repr(exc)
+        _stack.reset(self._token)
+
+        totals[f"seconds.{self.name}"] += seconds
+        run = _current_run.get()
+        if run is not None:
+            run.stages.append(record)
+        elif record["depth"] == 0:
+            # Этап вне прогона страницы (например, перезапуск фрагмента) пишется в журнал отдельно
+            _write_log({"ts": time.time(), "page": None, "stages": [record]})
+        logger.debug("stage %s", record)
+        return False
+
+
+def cached(name: str, **tags):
+    """
+    Декоратор функции с st.cache_data/st.cache_resource (ставится над декоратором кэша):
+    замеряет вызов как этап name и считает попадания и промахи кэша.
+    Тело кэшируемой функции отмечает промах вызовом cache_miss().
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, cache="hit", **tags) as timer:
+                result = func(*args, **kwargs)
+            count(f"cache.{name}.{timer.tags['cache']}")
+            return result
+        # Сохраняем clear() кэширующей обёртки Streamlit
+        if hasattr(func, "clear"):
+            wrapper.clear = func.clear
+        return wrapper
+    return decorator
+
+
+def cache_miss():
+    """Отмечает промах кэша для ближайшего этапа, созданного декоратором cached"""
+    for timer in reversed(_stack.get()):
+        if "cache" in timer.tags:
+            timer.tags["cache"] = "miss"
+            return
+
+
+def frame_bytes(df) -> int:
+    """Объём DataFrame в памяти без учёта строковых объектов (быстрая оценка объёма передаваемых данных)"""
+    return int(df.memory_usage(index=True, deep=False).sum())
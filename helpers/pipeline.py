@@ -0,0 +1,218 @@
+"""
+Пакетный расчёт RFM-сегментации и ABC/XYZ-классификации без Streamlit.
+
+Использует те же модули, что и страницы приложения (rfm_core, rfm_segments, abc_core),
+поэтому результат совпадает с интерактивным анализом. Клиенты распределяются по
+процессам по хешу customer_unique_id: все заказы клиента попадают в одну часть,
+и части агрегируются независимо.
+
+    python -m helpers.pipeline rfm --ndays 365 --R 90 365 --F 2 3 --M 100 1000 --workers 4 --out data/output/
+    python -m helpers.pipeline rfm --ndays 365 --auto-bounds quantile
+    python -m helpers.pipeline rfm --ndays 365 --memory-budget 256    # таблицы читаются частями
+    python -m helpers.pipeline abc --sales sales.parquet --split 80-15-5 --grain month --out data/output/
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from helpers.abc_core import NAME_COLUMN, abc_classes, parse_split, period_sums, product_shares, xyz_variability
+from helpers.dataset_store import DATASETS_FOLDER, read_dataset
+from helpers.export import EXPORT_FORMATS, export_frame
+from helpers.rfm_core import _codes, _lookup, aggregate_rfm, completed_orders, customer_codes, order_days
+from helpers.rfm_segments import RFM_FEATURES, RFM_KEYS, SegmentCube, rfm_codes, segment_table
+from helpers.rfm_stream import RFM_DATASETS, rfm_from_datasets
+from helpers.sketches import BREAK_METHODS, build_sketches, merge_sketches, suggest_boundaries
+
+SEGMENTS_PATH = 'data/templates/RFM/segments.json'
+XYZ_SETTINGS_PATH = 'data/templates/ABC/xyz_settings.json'
+
+def load_settings(path: str, encoding='cp1251') -> dict:
+    """Читает JSON-настройки (в той же кодировке, что и helpers/funtions.get_settings)"""
+    with open(path, 'r', encoding=encoding) as f:
+        return json.load(f)
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Удаляет неиспользуемые категории, чтобы часть таблицы не передавала в процесс все ключи"""
+    columns = {col: df[col].cat.remove_unused_categories().array if isinstance(df[col].dtype, pd.CategoricalDtype)
+               else df[col].array for col in df.columns}
+    return pd.DataFrame(columns)
+
+
+def partition_customers(items_df: pd.DataFrame, orders_df: pd.DataFrame, customers_df: pd.DataFrame,
+                        n_parts: int) -> list:
+    """
+    Делит таблицы на n_parts частей по хешу customer_unique_id.
+    Заказы и позиции заказов попадают в часть своего клиента.
+    Returns:
+        list: [(items, orders, customers), ...]
+    """
+    uid, uid_keys = customer_codes(orders_df, customers_df)
+    key_part = (pd.util.hash_array(uid_keys.to_numpy()) % n_parts).astype(np.int64)
+    order_part = np.where(uid >= 0, key_part[np.maximum(uid, 0)], -1)
+
+    order_codes, order_keys = _codes(orders_df['order_id'])
+    part_by_order = np.full(len(order_keys), -1, dtype=np.int64)
+    valid = order_codes >= 0
+    part_by_order[order_codes[valid]] = order_part[valid]
+    item_pos = _lookup(items_df['order_id'], order_keys)
+    item_part = np.where(item_pos >= 0, part_by_order[item_pos], -1)
+
+    customer_uid = _lookup(customers_df['customer_unique_id'], uid_keys)
+    customer_part = np.where(customer_uid >= 0, key_part[customer_uid], -1)
+
+    return [(_compact(items_df[item_part == part]), _compact(orders_df[order_part == part]),
+             _compact(customers_df[customer_part == part]))
+            for part in range(n_parts)]
+
+
+def _aggregate_part(args):
+    """RFM-признаки части клиентов и скетчи квантилей признаков этой части"""
+    items_df, orders_df, customers_df, ndays, reference_day = args
+    df = aggregate_rfm(items_df, orders_df, customers_df, ndays, reference_day=reference_day)
+    return df, build_sketches(df, RFM_FEATURES)
+
+
+def rfm_partitioned(items_df: pd.DataFrame, orders_df: pd.DataFrame, customers_df: pd.DataFrame, ndays: int,
+                    workers: int = 1):
+    """
+    То же, что rfm_core.aggregate_rfm, с агрегацией частей клиентов в пуле процессов.
+    День отсчёта общий для всех частей: день последнего выполненного заказа во всех данных.
+    Разбиение и передача частей в процессы сами требуют прохода по строковым ключам,
+    поэтому пул окупается только на многоядерной машине и больших таблицах.
+    Returns:
+        tuple: (RFM-признаки клиентов, скетчи квантилей признаков, объединённые по частям)
+    """
+    completed = completed_orders(orders_df)
+    days = order_days(orders_df['order_purchase_timestamp'])
+    reference_day = int(days[completed].max()) if completed.any() else 0
+    if workers <= 1:
+        return _aggregate_part((items_df, orders_df, customers_df, ndays, reference_day))
+
+    parts = partition_customers(items_df, orders_df, customers_df, workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_aggregate_part, [(*part, ndays, reference_day) for part in parts]))
+
+    sketches = merge_sketches(part_sketches for _, part_sketches in results)
+    results = [df for df, _ in results if len(df)]
+    if not results:
+        return aggregate_rfm(items_df.iloc[:0], orders_df.iloc[:0], customers_df.iloc[:0], ndays), sketches
+    uid = pd.api.types.union_categoricals([df['customer_unique_id'] for df in results], sort_categories=True)
+    df = pd.DataFrame({
+        'customer_unique_id': uid,
+        **{col: np.concatenate([part[col].to_numpy() for part in results]) for col in RFM_FEATURES},
+    })
+    # Порядок строк как у aggregate_rfm: по customer_unique_id
+    return df.iloc[np.argsort(uid.codes, kind='stable')].reset_index(drop=True), sketches
+
+
+def segment_rfm(df: pd.DataFrame, boundaries: dict, segments: dict):
+    """
+    Сегментирует клиентов по границам R, F, M.
+    Returns:
+        tuple: (таблица клиентов с колонками R, F, M; показатели по ячейкам R×F×M)
+    """
+    cube = SegmentCube(rfm_codes(df, RFM_FEATURES, boundaries), df['order_sum'].to_numpy())
+    return segment_table(df, cube, segments), cube.summary(segments)
+
+
+def abc_xyz(sales_df: pd.DataFrame, split: str, grain: str, holidays=()) -> dict:
+    """ABC- и XYZ-классификация товаров по продажам (формат apteka.sales), как на странице ABC_XYZ_analysis"""
+    a, b, _ = parse_split(split)
+    abc = abc_classes(product_shares(sales_df), a, b)
+    xyz = xyz_variability(period_sums(sales_df, grain, holidays), grain, holidays)
+    return {"abc_classes": abc, "xyz_variability": xyz,
+            "abc_xyz": pd.merge(abc, xyz, how='inner', on=NAME_COLUMN)}
+
+
+def save(df: pd.DataFrame, out: str, name: str, fmt: str) -> str:
+    """Атомарно сохраняет таблицу в out/<name><расширение формата>"""
+    path = os.path.join(out, name + EXPORT_FORMATS[fmt][1])
+    os.replace(export_frame(df, fmt, folder=out, index=False), path)
+    return path
+
+
+def read_table(path: str) -> pd.DataFrame:
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def run_rfm(args):
+    if args.memory_budget:
+        df = rfm_from_datasets(RFM_DATASETS, args.ndays, args.memory_budget * 2 ** 20, datasets_folder=args.datasets,
+                               spill_folder=args.spill_folder)
+        sketches = build_sketches(df, RFM_FEATURES)
+    else:
+        tables = {name: read_dataset(fname, columns, datasets_folder=args.datasets)
+                  for name, (fname, columns) in RFM_DATASETS.items()}
+        df, sketches = rfm_partitioned(tables['items'], tables['orders'], tables['customers'], args.ndays,
+                                       args.workers)
+
+    settings = load_settings(args.segments)
+    boundaries = {key: tuple(getattr(args, key) or settings.get('boundaries', {}).get(key, ())) for key in RFM_KEYS}
+    if args.auto_bounds:
+        # Незаданные границы подбираются по скетчам квантилей признаков
+        for key, col in zip(RFM_KEYS, RFM_FEATURES):
+            if len(boundaries[key]) != 2:
+                boundaries[key] = suggest_boundaries(sketches[col], args.auto_bounds,
+                                                     integer=pd.api.types.is_integer_dtype(df[col]),
+                                                     log=col == 'order_sum')
+                print(f'{key}: {boundaries[key]}')
+    missing = [key for key, value in boundaries.items() if len(value) != 2]
+    if missing:
+        raise SystemExit(f"не заданы границы сегментов: {', '.join(missing)} (--R/--F/--M, --auto-bounds или "
+                         f"'boundaries' в {args.segments})")
+    table, summary = segment_rfm(df, boundaries, {key: settings[key] for key in RFM_KEYS})
+    return [save(table, args.out, 'rfm_segments', args.format),
+            save(summary, args.out, 'rfm_summary', args.format)]
+
+
+def run_abc(args):
+    holidays = load_settings(args.xyz_settings).get('holidays', []) if os.path.exists(args.xyz_settings) else []
+    results = abc_xyz(read_table(args.sales), args.split, args.grain, holidays)
+    return [save(df, args.out, name, args.format) for name, df in results.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', default='data/output/', help='папка для результатов')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='parquet')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rfm = commands.add_parser('rfm', help='RFM-сегментация клиентов')
+    rfm.add_argument('--datasets', default=DATASETS_FOLDER)
+    rfm.add_argument('--ndays', type=int, default=365)
+    for key in RFM_KEYS:
+        rfm.add_argument(f'--{key}', type=float, nargs=2, metavar=('LOW', 'HIGH'), help=f'границы сегментов {key}')
+    rfm.add_argument('--auto-bounds', choices=BREAK_METHODS, help='подобрать незаданные границы по квантилям '
+                                                                  'или естественным разрывам')
+    rfm.add_argument('--segments', default=SEGMENTS_PATH, help='названия сегментов (и, при наличии, границы)')
+    rfm.add_argument('--workers', type=int, default=1, help='число процессов для агрегации частей клиентов (без --memory-budget)')
+    rfm.add_argument('--memory-budget', type=int, metavar='MB',
+                     help='читать таблицы частями с промежуточными данными на диске (helpers/rfm_stream.py)')
+    rfm.add_argument('--spill-folder', help='папка для промежуточных данных --memory-budget')
+    rfm.set_defaults(run=run_rfm)
+
+    abc = commands.add_parser('abc', help='ABC- и XYZ-классификация товаров')
+    abc.add_argument('--sales', required=True, help='продажи в формате apteka.sales (Parquet или CSV)')
+    abc.add_argument('--split', default='80-15-5')
+    abc.add_argument('--grain', choices=['day', 'week', 'month'], default='month')
+    abc.add_argument('--xyz-settings', default=XYZ_SETTINGS_PATH)
+    abc.set_defaults(run=run_abc)
+
+    args = parser.parse_args(argv)
+    if args.command == 'rfm' and args.memory_budget and args.workers > 1:
+        # Расчёт частями с диска выполняется в одном процессе: workers разделили бы бюджет памяти
+        parser.error('--workers нельзя использовать вместе с --memory-budget')
+    os.makedirs(args.out, exist_ok=True)
+    for path in args.run(args):
+        print(f'saved: {path}')
+
+
+if __name__ == '__main__':
+    main()
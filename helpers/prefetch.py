@@ -0,0 +1,80 @@
+"""
+Параллельная предзагрузка независимых данных страницы.
+
+В начале скрипта страницы все независимые загрузки (load_dataset, select) запускаются
+в общем для процесса пуле потоков, а разделы страницы забирают готовые результаты
+через Prefetch.result. Время загрузки страницы приближается ко времени самой долгой
+загрузки, а не к их сумме.
+
+Задачи вызывают те же кэшируемые функции, что и разделы страницы, поэтому семантика
+кэшей не меняется: повторный вызов функции с теми же аргументами (например, из фрагмента)
+берёт результат из кэша, а пока задача выполняется - ждёт её на блокировке ключа кэша Streamlit.
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Потоков на процесс (для всех сессий): не больше, чем соединений в пуле БД (см. helpers/db.py)
+PREFETCH_WORKERS = int(os.environ.get("DASHBOARD_PREFETCH_WORKERS", 4))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return _pool
+
+
+def _run(ctx, func, args, kwargs):
+    # Контекст сессии нужен кэшируемым функциям Streamlit, вызванным из потока пула
+    if ctx is None:
+        return func(*args, **kwargs)
+    thread = threading.current_thread()
+    saved = dict(vars(thread))
+    add_script_run_ctx(thread, ctx)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Поток пула выполняет задачи и других сессий: снимаем с него контекст этой сессии,
+        # иначе следующие задачи выполнялись бы в нём, а завершённая сессия не освобождалась
+        for name in set(vars(thread)) - set(saved):
+            delattr(thread, name)
+        for name, value in saved.items():
+            if getattr(thread, name, None) is not value:
+                setattr(thread, name, value)
+
+
+class Prefetch:
+    """
+    Задачи, запущенные в начале страницы.
+    Args:
+        tasks (dict): {имя: (функция, аргументы...)}
+    """
+
+    def __init__(self, tasks: dict, pool: ThreadPoolExecutor = None):
+        pool = pool or get_pool()
+        ctx = get_script_run_ctx(suppress_warning=True)
+        # Копия контекста: замеры этапов (helpers/metrics.py) попадают в прогон страницы
+        self.futures = {name: pool.submit(contextvars.copy_context().run, _run, ctx, func, args, {})
+                        for name, (func, *args) in tasks.items()}
+
+    def result(self, name: str, timeout=None):
+        """Результат задачи; ошибка задачи выбрасывается здесь, в разделе, которому нужен результат"""
+        return self.futures[name].result(timeout)
+
+    def errors(self) -> dict:
+        """Ошибки завершившихся задач: {имя: исключение}"""
+        return {name: future.exception() for name, future in self.futures.items()
+                if future.done() and future.exception() is not None}
+
+
+def prefetch(tasks: dict) -> Prefetch:
+    """Запускает независимые загрузки страницы в пуле потоков"""
+    return Prefetch(tasks)
@@ -0,0 +1,389 @@
+"""
+Расчёт RFM-признаков без зависимостей от Streamlit.
+
+Все вычисления выполняются над numpy-массивами кодов ключей: идентификаторы
+заказов и клиентов не материализуются в строки, а входные DataFrame не изменяются.
+"""
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# Статусы невыполненных заказов, которые не учитываются в анализе
+EXCLUDED_STATUSES = ('canceled', 'created', 'unavailable')
+
+RFM_COLUMNS = ["customer_unique_id", "days_since_last_order", "orders_count", "order_sum"]
+
+
+def _codes(values: pd.Series):
+    """
+    Кодирует значения ключа целыми числами.
+    Returns:
+        tuple: (коды значений, pd.Index уникальных ключей); пропуски кодируются -1
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques)
+
+
+def _lookup(values: pd.Series, keys: pd.Index) -> np.ndarray:
+    """Позиции значений values в уникальном индексе keys (-1, если значения нет)"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        positions = keys.get_indexer(values.cat.categories)
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, positions[codes], -1)
+    return keys.get_indexer(values)
+
+
+def order_days(timestamps: pd.Series) -> np.ndarray:
+    """Номер дня заказа (дни от 1970-01-01), для пропусков - минимальное int64"""
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps, errors='coerce')
+    return timestamps.to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def order_sums(items_df: pd.DataFrame):
+    """
+    Сумма каждого заказа: price * order_item_id, просуммированная по order_id.
+    Returns:
+        tuple: (суммы заказов float64, pd.Index идентификаторов заказов)
+    """
+    codes, keys = _codes(items_df['order_id'])
+    values = items_df['price'].to_numpy(np.float64) * items_df['order_item_id'].to_numpy(np.float64)
+    valid = codes >= 0
+    sums = np.bincount(codes[valid], weights=values[valid], minlength=len(keys))
+    return sums, keys
+
+
+def customer_codes(orders_df: pd.DataFrame, customers_df: pd.DataFrame):
+    """
+    Сопоставляет заказам код уникального клиента (customer_unique_id).
+    Returns:
+        tuple: (коды клиентов для каждого заказа, -1 если клиент не найден; pd.Index customer_unique_id)
+    """
+    cid_codes, cid_keys = _codes(customers_df['customer_id'])
+    uid_codes, uid_keys = _codes(customers_df['customer_unique_id'])
+    uid_by_cid = np.full(len(cid_keys), -1, dtype=np.int64)
+    valid = cid_codes >= 0
+    uid_by_cid[cid_codes[valid]] = uid_codes[valid]
+
+    positions = _lookup(orders_df['customer_id'], cid_keys)
+    return np.where(positions >= 0, uid_by_cid[positions], -1), uid_keys
+
+
+def completed_orders(orders_df: pd.DataFrame) -> np.ndarray:
+    """Маска выполненных заказов с известной датой покупки"""
+    mask = ~orders_df['order_status'].isin(EXCLUDED_STATUSES).to_numpy()
+    return mask & orders_df['order_purchase_timestamp'].notna().to_numpy()
+
+
+def aggregate_rfm(items_df: pd.DataFrame, orders_df: pd.DataFrame, customers_df: pd.DataFrame, ndays: int,
+                  reference_day=None) -> pd.DataFrame:
+    """
+    Формирует агрегированную по клиентам таблицу для RFM-анализа.
+    Args:
+        items_df (pd.DataFrame): Позиции заказов (order_id, order_item_id, price)
+        orders_df (pd.DataFrame): Заказы (order_id, customer_id, order_status, order_purchase_timestamp)
+        customers_df (pd.DataFrame): Клиенты (customer_id, customer_unique_id)
+        ndays (int): Глубина анализа в днях от даты последнего заказа
+        reference_day (int): "Сегодняшний" день (дни от 1970-01-01); по умолчанию - день последнего заказа
+    Returns:
+        pd.DataFrame: customer_unique_id, days_since_last_order, orders_count, order_sum
+    """
+    completed = completed_orders(orders_df)
+    days = order_days(orders_df['order_purchase_timestamp'])
+    if reference_day is None:
+        reference_day = days[completed].max() if completed.any() else 0
+    days_delta = reference_day - days
+    in_window = completed & (days_delta <= ndays)
+
+    # Предагрегируем позиции до уровня заказа и подставляем суммы по коду заказа
+    sums, order_keys = order_sums(items_df)
+    order_pos = _lookup(orders_df['order_id'], order_keys)
+    order_sum = np.where(order_pos >= 0, sums[order_pos], 0.0)
+
+    uid, uid_keys = customer_codes(orders_df, customers_df)
+    selected = in_window & (uid >= 0)
+    return _reduce_by_customer(uid[selected], days_delta[selected], order_sum[selected], uid_keys)
+
+
+def _reduce_by_customer(uid: np.ndarray, days_delta: np.ndarray, order_sum: np.ndarray, uid_keys: pd.Index,
+                        orders_count: np.ndarray = None) -> pd.DataFrame:
+    """Сворачивает заказы (или их предагрегаты) в строку на клиента"""
+    n = len(uid_keys)
+    counts = np.bincount(uid, weights=orders_count, minlength=n)
+    totals = np.bincount(uid, weights=order_sum, minlength=n)
+    last = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(last, uid, days_delta)
+    return _customer_frame(counts, totals, last, uid_keys)
+
+
+def _customer_frame(counts: np.ndarray, totals: np.ndarray, last: np.ndarray, uid_keys: pd.Index) -> pd.DataFrame:
+    """Таблица RFM-признаков по накопленным для каждого кода клиента значениям (клиенты без заказов отбрасываются)"""
+    present = np.flatnonzero(counts > 0)
+    if not uid_keys.is_monotonic_increasing:
+        present = present[uid_keys[present].argsort()]
+    return pd.DataFrame({
+        # Категории общие с исходным индексом клиентов: не копируем и не перепроверяем строки
+        "customer_unique_id": pd.Categorical.from_codes(present, categories=uid_keys),
+        "days_since_last_order": last[present].astype(np.int32),
+        "orders_count": counts[present].astype(np.int32),
+        "order_sum": totals[present],
+    })
+
+
+def _group_daily(uid: np.ndarray, day: np.ndarray, order_sum: np.ndarray, uid_keys: pd.Index,
+                 orders_count: np.ndarray = None) -> pd.DataFrame:
+    """Сворачивает заказы (или строки дневных агрегатов) до строки на пару (клиент, день), упорядочивая по дню"""
+    if not uid_keys.is_monotonic_increasing:
+        # Упорядочиваем категории клиентов, чтобы итоговые таблицы не требовали сортировки строк
+        order = uid_keys.argsort()
+        remap = np.empty(len(order), dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        uid, uid_keys = remap[uid], uid_keys[order]
+
+    n = max(len(uid_keys), 1)
+    first_day = day.min() if len(day) else 0
+    keys, inverse = np.unique((day - first_day) * n + uid, return_inverse=True)
+    return pd.DataFrame({
+        "customer_unique_id": pd.Categorical.from_codes(keys % n, categories=uid_keys),
+        "order_day": (keys // n + first_day).astype(np.int32),
+        "orders_count": np.bincount(inverse, weights=orders_count, minlength=len(keys)).astype(np.int32),
+        "order_sum": np.bincount(inverse, weights=order_sum, minlength=len(keys)),
+    })
+
+
+def build_daily_aggregates(items_df: pd.DataFrame, orders_df: pd.DataFrame,
+                           customers_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Строит таблицу дневных агрегатов: число и сумма выполненных заказов клиента за каждый день.
+    По ней RFM-признаки для любого периода считаются без обращения к исходным заказам (см. rfm_from_daily).
+    Returns:
+        pd.DataFrame: customer_unique_id, order_day (дни от 1970-01-01), orders_count, order_sum;
+            строки упорядочены по order_day, в attrs['watermark'] - время последнего учтённого заказа
+    """
+    completed = completed_orders(orders_df)
+    days = order_days(orders_df['order_purchase_timestamp'])
+    sums, order_keys = order_sums(items_df)
+    order_pos = _lookup(orders_df['order_id'], order_keys)
+    order_sum = np.where(order_pos >= 0, sums[order_pos], 0.0)
+    uid, uid_keys = customer_codes(orders_df, customers_df)
+
+    selected = completed & (uid >= 0)
+    daily = _group_daily(uid[selected], days[selected], order_sum[selected], uid_keys)
+    watermark = pd.to_datetime(orders_df['order_purchase_timestamp'], errors='coerce').max()
+    # Храним строкой, чтобы attrs сохранялись в метаданных Parquet
+    daily.attrs['watermark'] = watermark.isoformat() if pd.notna(watermark) else None
+    return daily
+
+
+def append_daily_aggregates(daily: pd.DataFrame, items_df: pd.DataFrame, orders_df: pd.DataFrame,
+                            customers_df: pd.DataFrame, start_row=None) -> pd.DataFrame:
+    """
+    Дополняет таблицу дневных агрегатов новыми заказами: строками orders_df, начиная с start_row,
+    а если start_row не задан - заказами, сделанными после attrs['watermark'].
+    Из исходных заказов обрабатываются только новые, а из готовой таблицы пересчитываются
+    только строки за дни, начиная с первого нового заказа.
+    Подходит только для источников, в которые заказы дописываются: изменения уже учтённых заказов
+    (статусы, суммы, замена датасета) не отслеживаются - это проверяет load_daily_aggregates.
+    """
+    watermark = daily.attrs.get('watermark')
+    if start_row is not None:
+        is_new = np.arange(len(orders_df)) >= start_row
+    else:
+        timestamps = pd.to_datetime(orders_df['order_purchase_timestamp'], errors='coerce')
+        is_new = (timestamps > pd.Timestamp(watermark)).to_numpy() if watermark else timestamps.notna().to_numpy()
+    if not is_new.any():
+        return daily
+
+    new_daily = build_daily_aggregates(items_df, orders_df[is_new], customers_df)
+    # Новые строки могут быть и раньше watermark (заказы, дописанные с опозданием)
+    new_watermark = max(filter(None, (watermark, new_daily.attrs['watermark'])), default=None,
+                        key=pd.Timestamp)
+    if len(new_daily) == 0:
+        result = daily.copy(deep=False)
+        result.attrs['watermark'] = new_watermark
+        return result
+
+    # Оставляем только клиентов из новых заказов и ищем их в упорядоченном справочнике
+    # бинарным поиском, чтобы не хешировать весь справочник клиентов заново
+    new_customers = new_daily['customer_unique_id'].cat.remove_unused_categories()
+    old_keys = daily['customer_unique_id'].cat.categories
+    new_keys = new_customers.cat.categories
+    old_uid = daily['customer_unique_id'].cat.codes.to_numpy().astype(np.int64)
+    positions = old_keys.searchsorted(new_keys)
+    found = positions < len(old_keys)
+    found[found] = old_keys[positions[found]] == new_keys[found]
+    if found.all():
+        keys = old_keys
+    else:
+        # Вставляем новых клиентов на их места, коды старых сдвигаются на число вставленных перед ними
+        insert_at = positions[~found]
+        keys = pd.Index(np.insert(old_keys.to_numpy(), insert_at, new_keys[~found].to_numpy()))
+        old_uid = old_uid + np.searchsorted(insert_at, old_uid, side='right')
+        positions = positions + np.searchsorted(insert_at, positions, side='right')
+        positions[~found] = insert_at + np.arange(len(insert_at))
+    new_uid = positions[new_customers.cat.codes.to_numpy()]
+
+    # Строки до первого нового дня не меняются, остальные сворачиваем вместе с новыми
+    old_day = daily['order_day'].to_numpy()
+    split = np.searchsorted(old_day, new_daily['order_day'].iloc[0], side='left')
+    tail = _group_daily(
+        np.concatenate([old_uid[split:], new_uid]),
+        np.concatenate([old_day[split:], new_daily['order_day'].to_numpy()]).astype(np.int64),
+        np.concatenate([daily['order_sum'].to_numpy()[split:], new_daily['order_sum'].to_numpy()]),
+        keys,
+        orders_count=np.concatenate([daily['orders_count'].to_numpy()[split:], new_daily['orders_count'].to_numpy()]),
+    )
+    result = pd.DataFrame({
+        "customer_unique_id": pd.Categorical.from_codes(
+            np.concatenate([old_uid[:split], tail['customer_unique_id'].cat.codes.to_numpy()]), categories=keys),
+        "order_day": np.concatenate([old_day[:split], tail['order_day'].to_numpy()]),
+        "orders_count": np.concatenate([daily['orders_count'].to_numpy()[:split], tail['orders_count'].to_numpy()]),
+        "order_sum": np.concatenate([daily['order_sum'].to_numpy()[:split], tail['order_sum'].to_numpy()]),
+    })
+    result.attrs['watermark'] = new_watermark
+    return result
+
+
+def rfm_from_daily(daily: pd.DataFrame, ndays: int) -> pd.DataFrame:
+    """
+    RFM-признаки за последние ndays дней по таблице дневных агрегатов.
+    Период - это хвост упорядоченной по дням таблицы: он выбирается бинарным поиском
+    и сворачивается одним проходом bincount, без обращения к исходным заказам.
+    """
+    day = daily['order_day'].to_numpy()
+    uid_keys = daily['customer_unique_id'].cat.categories
+    if len(day) == 0:
+        return _reduce_by_customer(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                                   np.empty(0), uid_keys)
+    reference_day = int(day[-1])
+    start = np.searchsorted(day, reference_day - ndays, side='left')
+    return _reduce_by_customer(
+        daily['customer_unique_id'].cat.codes.to_numpy()[start:],
+        reference_day - day[start:].astype(np.int64),
+        daily['order_sum'].to_numpy()[start:],
+        uid_keys,
+        orders_count=daily['orders_count'].to_numpy()[start:],
+    )
+
+
+def read_only(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    DataFrame с теми же данными, массивы которого защищены от записи.
+    Нужен для таблиц, общих для всех сессий: случайное изменение значений вызовет ошибку,
+    а не испортит данные другим пользователям. Данные не копируются.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            codes.flags.writeable = False
+            columns[col] = pd.Categorical.from_codes(codes, dtype=values.dtype, validate=False)
+        else:
+            array = values.to_numpy()
+            array.flags.writeable = False
+            columns[col] = array
+    frozen = pd.DataFrame(columns, index=df.index, copy=False)
+    frozen.attrs.update(df.attrs)
+    return frozen
+
+
+def source_fingerprint(*frames: pd.DataFrame) -> str:
+    """
+    Версия исходных таблиц: по attrs['source'] (путь, mtime и размер файла, см. dataset_store.read_dataset),
+    а для таблиц без него - по хешу содержимого.
+    """
+    parts = []
+    for df in frames:
+        source = df.attrs.get('source')
+        if source is None:
+            content = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            source = 'frame:' + hashlib.sha256(content.tobytes() + repr(list(df.columns)).encode()).hexdigest()
+        parts.append(f'{source}|{",".join(map(str, df.columns))}')
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+# Число строк с идентификаторами, по которым строится отпечаток начала таблицы
+FINGERPRINT_SAMPLE = 4096
+
+
+def prefix_fingerprint(df: pd.DataFrame, n_rows: int) -> str:
+    """
+    Отпечаток первых n_rows строк таблицы. Числовые колонки, даты и категории с небольшим числом значений
+    (статус заказа) хешируются целиком, колонки идентификаторов - по равномерной выборке строк:
+    хеш всех идентификаторов стоит дороже, чем пересчёт дневных агрегатов.
+    """
+    head = df.iloc[:n_rows]
+    digest = hashlib.sha256(repr((list(df.columns), n_rows)).encode())
+    sample = np.unique(np.append(np.linspace(0, n_rows - 1, min(n_rows, FINGERPRINT_SAMPLE), dtype=np.int64),
+                                 n_rows - 1)) if n_rows else np.empty(0, dtype=np.int64)
+    for col in head.columns:
+        values = head[col]
+        if isinstance(values.dtype, pd.CategoricalDtype) and len(values.cat.categories) > FINGERPRINT_SAMPLE \
+                or pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            values = pd.Series(np.asarray(values.iloc[sample], dtype=object))
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _table_rows(*frames: pd.DataFrame) -> str:
+    return ','.join(str(len(df)) for df in frames)
+
+
+def _only_appended(daily: pd.DataFrame, items_df: pd.DataFrame, orders_df: pd.DataFrame,
+                   customers_df: pd.DataFrame):
+    """
+    Число уже учтённых заказов, если с построения таблицы в исходные таблицы только дописывались строки:
+    начало каждой таблицы не изменилось, а новые позиции и клиенты относятся к новым заказам.
+    Иначе None - таблицу нужно построить заново.
+    """
+    try:
+        rows = [int(n) for n in daily.attrs['rows'].split(',')]
+    except (KeyError, ValueError, AttributeError):
+        return None
+    frames = (items_df, orders_df, customers_df)
+    if len(rows) != len(frames) or any(len(df) < n for df, n in zip(frames, rows)):
+        return None
+    if daily.attrs.get('prefix') != ':'.join(prefix_fingerprint(df, n) for df, n in zip(frames, rows)):
+        return None
+    n_items, n_orders, n_customers = rows
+    new_orders = orders_df.iloc[n_orders:]
+    # Позиции и клиенты, дописанные к уже учтённым заказам, меняют их суммы и клиентов
+    for new_rows, key in ((items_df.iloc[n_items:], 'order_id'), (customers_df.iloc[n_customers:], 'customer_id')):
+        if len(new_rows) and not pd.Index(np.asarray(new_rows[key], dtype=object)).isin(
+                np.asarray(new_orders[key], dtype=object)).all():
+            return None
+    return n_orders
+
+
+def load_daily_aggregates(path: str, items_df: pd.DataFrame, orders_df: pd.DataFrame,
+                          customers_df: pd.DataFrame, source=None) -> pd.DataFrame:
+    """
+    Читает сохранённую таблицу дневных агрегатов. Если исходные таблицы не менялись (attrs['source'],
+    см. source_fingerprint), она возвращается как есть; если в них только дописаны строки
+    (attrs['rows'] и attrs['prefix'], см. _only_appended) - дополняется новыми заказами;
+    иначе, как и при отсутствии файла, строится с нуля. Изменённая таблица записывается обратно.
+    """
+    source = source or source_fingerprint(items_df, orders_df, customers_df)
+    daily = None
+    if os.path.exists(path):
+        saved = pd.read_parquet(path)
+        if saved.attrs.get('source') == source:
+            return saved
+        start_row = _only_appended(saved, items_df, orders_df, customers_df)
+        if start_row is not None:
+            daily = append_daily_aggregates(saved, items_df, orders_df, customers_df, start_row=start_row)
+    if daily is None:
+        daily = build_daily_aggregates(items_df, orders_df, customers_df)
+    frames = (items_df, orders_df, customers_df)
+    daily.attrs.update(source=source, rows=_table_rows(*frames),
+                       prefix=':'.join(prefix_fingerprint(df, len(df)) for df in frames))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    daily.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return daily
@@ -0,0 +1,116 @@
+"""
+Графики подбора границ RFM-сегментов.
+
+Гистограмма строится одним трейсом с массивами цветов и ширин столбцов, а совместные
+распределения признаков внутри сегментов - одним проходом np.histogram2d на сегмент
+и выводятся Plotly-тепловыми картами вместо matplotlib-фигур.
+"""
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+SEGMENT_COLORS = ('green', 'gray', 'red')
+
+
+def segment_codes(values: np.ndarray, boundaries) -> np.ndarray:
+    """
+    Номер сегмента для каждого значения: 0 - меньше первой границы,
+    1 - между границами, 2 - не меньше второй границы (как pd.cut с right=False)
+    """
+    # Для двух границ сравнения быстрее searchsorted: код - число границ, не больших значения
+    codes = np.zeros(len(values), dtype=np.int8)
+    for boundary in boundaries:
+        codes += values >= boundary
+    return codes
+
+
+def histogram_bins(values: np.ndarray, exp_bins=False) -> np.ndarray:
+    """Границы столбцов гистограммы; для exp_bins - равные интервалы в логарифмической шкале"""
+    n_bins = 4 * int(values.max() ** (1.0 / 3))
+    if exp_bins:
+        return np.exp(np.histogram_bin_edges(np.log(values), n_bins))
+    return np.histogram_bin_edges(values, bins=n_bins)
+
+
+def histogram_figure(values: np.ndarray, boundaries, text: str, exp_bins=False) -> go.Figure:
+    """Гистограмма значений признака, раскрашенная по сегментам, одним трейсом"""
+    hist_values, bin_edges = np.histogram(values, bins=histogram_bins(values, exp_bins))
+    left, right = bin_edges[:-1], bin_edges[1:]
+    colors = np.array(SEGMENT_COLORS)[segment_codes(left, boundaries)]
+    hovertext = [f"{text}: {lo:.0f} - {hi:.0f}<br>Число клиентов: {count}"
+                 for lo, hi, count in zip(left, right, hist_values)]
+
+    fig = go.Figure(go.Bar(
+        x=(left + right) / 2,  # Центры бинов
+        y=hist_values,
+        width=(right - left) * 0.9,  # Ширина столбцов
+        marker_color=colors,
+        hoverinfo="text",
+        hovertext=hovertext,
+    ))
+    fig.update_layout(
+        xaxis_title=text,
+        yaxis_title="Число клиентов",
+        showlegend=False,
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=200
+    )
+    return fig
+
+
+def _joint_edges(values: np.ndarray, log=False, bins=30, discrete=False) -> np.ndarray:
+    """Границы ячеек по одной оси совместного распределения"""
+    low, high = values.min(), values.max()
+    if discrete and high - low < 60:
+        return np.arange(low - 0.5, high + 1.5)
+    if log:
+        low = max(low, values[values > 0].min() if (values > 0).any() else 1)
+        return np.geomspace(low, max(high, low * 1.01), bins + 1)
+    return np.linspace(low, max(high, low + 1), bins + 1)
+
+
+def joint_figure(x_values: np.ndarray, y_values: np.ndarray, codes: np.ndarray, labels, x_title: str,
+                 y_title: str, log_y=False) -> go.Figure:
+    """
+    Совместные и маргинальные распределения двух признаков для каждого сегмента.
+    Для сегмента выполняется один np.histogram2d, маргинальные распределения - его суммы по осям.
+    """
+    fig = make_subplots(rows=2, cols=6, row_heights=[0.25, 0.75], column_widths=[0.26, 0.07] * 3,
+                        horizontal_spacing=0.01, vertical_spacing=0.02,
+                        subplot_titles=list(labels) + [''] * 6,
+                        specs=[[{}, None] * 3, [{}, {}] * 3])
+    x_edges = _joint_edges(x_values, discrete=True)
+    y_edges = _joint_edges(y_values, log=log_y)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = np.sqrt(y_edges[:-1] * y_edges[1:]) if log_y else (y_edges[:-1] + y_edges[1:]) / 2
+
+    for n, (label, color) in enumerate(zip(labels, SEGMENT_COLORS)):
+        col = 2 * n + 1
+        mask = codes == n
+        if not mask.any():
+            continue
+        counts, _, _ = np.histogram2d(x_values[mask], y_values[mask], bins=(x_edges, y_edges))
+        fig.add_trace(go.Heatmap(x=x_centers, y=y_centers, z=np.where(counts.T > 0, counts.T, np.nan),
+                                 colorscale=[[0, 'white'], [1, color]], showscale=False,
+                                 hovertemplate=f"{x_title}: %{{x}}<br>{y_title}: %{{y:.0f}}<br>"
+                                               "Число клиентов: %{z}<extra></extra>"),
+                      row=2, col=col)
+        fig.add_trace(go.Bar(x=x_centers, y=counts.sum(axis=1), marker_color=color, hoverinfo="skip"),
+                      row=1, col=col)
+        fig.add_trace(go.Bar(y=y_centers, x=counts.sum(axis=0), orientation='h', marker_color=color,
+                             hoverinfo="skip"),
+                      row=2, col=col + 1)
+        # Оси нумеруются по строкам без пустых ячеек: маргинали сверху - x1..x3, тепловые карты - x4, x6, x8
+        heatmap_axis = 4 + 2 * n
+        fig.update_xaxes(title_text=x_title, row=2, col=col)
+        fig.update_xaxes(matches=f"x{heatmap_axis}", row=1, col=col)
+        fig.update_yaxes(matches=f"y{heatmap_axis}", row=2, col=col + 1)
+        if log_y:
+            fig.update_yaxes(type="log", row=2, col=col)
+            fig.update_yaxes(type="log", row=2, col=col + 1)
+            fig.update_yaxes(type="log", row=1, col=col)
+        fig.update_yaxes(showticklabels=False, row=2, col=col + 1)
+        fig.update_xaxes(showticklabels=False, row=1, col=col)
+    fig.update_yaxes(title_text=y_title, row=2, col=1)
+    fig.update_layout(showlegend=False, bargap=0, height=380, margin=dict(l=0, r=0, t=30, b=0))
+    return fig
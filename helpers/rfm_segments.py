@@ -0,0 +1,105 @@
+"""
+Сегментация клиентов по R, F и M в виде целочисленных кодов.
+
+Каждому клиенту соответствует номер ячейки куба R×F×M (0..26). Один np.bincount по номерам ячеек
+даёт число клиентов и сумму покупок в каждой ячейке, а индекс клиентов, упорядоченных по ячейке,
+позволяет получить клиентов любой ячейки срезом без прохода по всей таблице.
+"""
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from helpers.rfm_plots import segment_codes
+
+RFM_KEYS = ("R", "F", "M")
+# Признаки, по которым строятся сегменты R, F и M
+RFM_FEATURES = ('days_since_last_order', 'orders_count', 'order_sum')
+N_CELLS = 27
+
+
+def rfm_codes(df: pd.DataFrame, columns, boundaries: dict) -> np.ndarray:
+    """
+    Коды сегментов R, F, M для каждого клиента.
+    Args:
+        df (pd.DataFrame): RFM-признаки клиентов
+        columns: Колонки признаков R, F, M
+        boundaries (dict): Границы сегментов {"R": (b1, b2), "F": ..., "M": ...}
+    Returns:
+        np.ndarray: Массив int8 формы (3, число клиентов)
+    """
+    return np.stack([segment_codes(df[col].to_numpy(), boundaries[key]) for key, col in zip(RFM_KEYS, columns)])
+
+
+class SegmentCube:
+    """
+    Число клиентов и сумма покупок в каждой из 27 ячеек R×F×M.
+    Args:
+        codes (np.ndarray): Коды сегментов (см. rfm_codes)
+        values (np.ndarray): Сумма покупок клиента
+    """
+
+    def __init__(self, codes: np.ndarray, values: np.ndarray):
+        self.codes = codes
+        self.cell = (codes[0] * 9 + codes[1] * 3 + codes[2]).astype(np.int8)
+        # Куб общий для всех сессий с теми же границами: коды защищены от записи
+        self.codes.flags.writeable = False
+        self.cell.flags.writeable = False
+        self.counts = np.bincount(self.cell, minlength=N_CELLS)
+        self.sums = np.bincount(self.cell, weights=values, minlength=N_CELLS)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @cached_property
+    def order(self) -> np.ndarray:
+        """Клиенты, упорядоченные по ячейке: клиенты ячейки c - order[offsets[c]:offsets[c + 1]]"""
+        return np.argsort(self.cell, kind='stable').astype(np.int32)
+
+    @property
+    def total(self) -> int:
+        return len(self.cell)
+
+    @staticmethod
+    def cell_number(r: int, f: int, m: int) -> int:
+        return r * 9 + f * 3 + m
+
+    def positions(self, cell: int) -> np.ndarray:
+        """Номера строк клиентов ячейки"""
+        return self.order[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def cell_stats(self, cell: int) -> dict:
+        count = int(self.counts[cell])
+        return {"count": count, "sum": float(self.sums[cell]), "mean": self.sums[cell] / count if count else 0.0}
+
+    def pivot(self, segments: dict) -> pd.DataFrame:
+        """Сводная таблица: строки - (R, F), колонки - M, в ячейке число и доля клиентов"""
+        shares = self.counts / max(self.total, 1)
+        text = [f"{count} \n\r {share:.2%}" for count, share in zip(self.counts, shares)]
+        index = pd.MultiIndex.from_product([segments["R"], segments["F"]], names=["R", "F"])
+        return pd.DataFrame(np.reshape(text, (9, 3)), index=index, columns=pd.Index(segments["M"], name="M"))
+
+    def summary(self, segments: dict) -> pd.DataFrame:
+        """Число клиентов, доля, сумма и средняя сумма покупок по каждой из 27 ячеек"""
+        r, f, m = np.unravel_index(np.arange(N_CELLS), (3, 3, 3))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(self.counts > 0, self.sums / self.counts, 0.0)
+        return pd.DataFrame({
+            "R": pd.Categorical.from_codes(r, segments["R"]),
+            "F": pd.Categorical.from_codes(f, segments["F"]),
+            "M": pd.Categorical.from_codes(m, segments["M"]),
+            "count": self.counts,
+            "share": self.counts / max(self.total, 1),
+            "order_sum": self.sums,
+            "mean_order_sum": mean,
+        })
+
+    def labels(self, segments: dict) -> dict:
+        """Категориальные колонки R, F, M с названиями сегментов (без повторного разбиения значений)"""
+        return {key: pd.Categorical.from_codes(self.codes[n], segments[key])
+                for n, key in enumerate(RFM_KEYS)}
+
+
+def segment_table(df: pd.DataFrame, cube: SegmentCube, segments: dict) -> pd.DataFrame:
+    """Таблица клиентов с колонками R, F, M; колонки df не копируются, добавляются только коды int8"""
+    labeled = pd.DataFrame({**{col: df[col] for col in df.columns}, **cube.labels(segments)}, copy=False)
+    labeled.attrs.update(df.attrs)
+    return labeled
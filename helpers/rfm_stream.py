@@ -0,0 +1,346 @@
+"""
+Расчёт RFM-признаков для истории заказов, которая не помещается в память.
+
+Клиенты, заказы и позиции заказов читаются частями (строками CSV или группами строк Parquet).
+В памяти целиком держится только упорядоченный список customer_unique_id - категории итоговой таблицы.
+Расчёт идёт в три прохода:
+
+1. Части таблиц проецируются на нужные колонки и сбрасываются на диск по хешу ключа соединения:
+   клиенты - (customer_id, customer_unique_id), выполненные заказы - (customer_id, номер строки)
+   и (order_id, номер строки), позиции - (order_id, price * order_item_id). День каждого заказа
+   пишется в файл записей фиксированной ширины по номеру строки; там же по ходу чтения находится день отсчёта.
+2. Каждая часть по хешу соединяется в памяти отдельно: клиенты с заказами дают код клиента заказа,
+   позиции с заказами - сумму заказа; оба значения записываются в файл записей по номерам строк.
+   Часть, которая больше бюджета, делится заново.
+3. Файл записей читается по порядку и сворачивается в строки клиентов.
+
+Порядок сложения вещественных сумм тот же, что у rfm_core.aggregate_rfm (позиции заказа - в порядке
+строк позиций, заказы клиента - в порядке строк заказов), поэтому результат совпадает побитово.
+Пиковая память определяется бюджетом memory_budget и числом клиентов, а не объёмом заказов;
+колоночные копии читаются группами строк, поэтому к бюджету добавляется разбор одной группы (см. dataset_store).
+
+    python -m helpers.pipeline rfm --ndays 365 --memory-budget 256
+"""
+import contextlib
+import functools
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from helpers import metrics
+from helpers.dataset_store import COLUMNAR_FOLDER, DATASETS_FOLDER, dataset_rows, iter_dataset
+from helpers.rfm_core import _codes, _customer_frame, _lookup, completed_orders, order_days
+
+# Колонки датасетов, которые нужны для RFM-анализа
+RFM_DATASETS = {
+    'customers': ('olist_customers_dataset.csv', ['customer_id', 'customer_unique_id']),
+    'orders': ('olist_orders_dataset.csv', ['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp']),
+    'items': ('olist_order_items_dataset.csv', ['order_id', 'order_item_id', 'price']),
+}
+
+DEFAULT_MEMORY_BUDGET = 512 * 2 ** 20
+# Оценка памяти на строку части в pandas и Arrow (идентификаторы Olist - 32 символа)
+ROW_BYTES = 160
+MIN_BATCH_ROWS = 10_000
+# Число одновременно открытых файлов частей и глубина повторного деления больших частей
+MAX_PARTS = 256
+MAX_DEPTH = 3
+# Оценка числа строк CSV (gzip) по размеру файла, если колоночной копии нет
+CSV_BYTES_PER_ROW = 40
+
+_RECORD = np.dtype([('uid', '<i8'), ('day', '<i8'), ('sum', '<f8')])
+# Промежуточные таблицы: ключ соединения и значение
+_SPILL_VALUES = {
+    'customers': pa.string(),   # customer_id -> customer_unique_id
+    'orders_by_customer': pa.int64(),   # customer_id -> номер строки заказа
+    'orders': pa.int64(),   # order_id -> номер строки заказа
+    'items': pa.float64(),   # order_id -> price * order_item_id
+}
+
+
+def batch_rows(memory_budget: int) -> int:
+    """Строк в читаемой части: четверть бюджета"""
+    return max(MIN_BATCH_ROWS, memory_budget // (4 * ROW_BYTES))
+
+
+def partition_rows(memory_budget: int) -> int:
+    """Строк (обеих таблиц вместе) в части по хешу, которая соединяется в памяти: половина бюджета"""
+    return max(MIN_BATCH_ROWS, memory_budget // (2 * ROW_BYTES))
+
+
+def _hash_key(depth: int) -> str:
+    # hash_array принимает ключ из 16 символов; на каждом уровне деления свой, чтобы часть не попала в одну подчасть
+    return f'rfm-stream-{depth:05d}'
+
+
+def _part_path(folder: str, name: str, tag: str) -> str:
+    return os.path.join(folder, f'{name}-{tag}.parquet')
+
+
+def _compact_codes(values: pd.Series):
+    """Коды и уникальные значения, встречающиеся в values (срез category-колонки несёт все категории таблицы)"""
+    codes, keys = _codes(values)
+    if len(keys) > len(codes):
+        used, codes = np.unique(codes, return_inverse=True)
+        if len(used) and used[0] < 0:
+            used, codes = used[1:], codes - 1
+        keys = keys[used]
+    return codes, keys
+
+
+class _PartitionWriter:
+    """Файлы частей одной промежуточной таблицы: строки каждой части дописываются в порядке поступления"""
+
+    def __init__(self, folder: str, name: str, n_parts: int, tag: str = ''):
+        self.schema = pa.schema([('key', pa.string()), ('value', _SPILL_VALUES[name])])
+        self.n_parts = n_parts
+        self.paths = [_part_path(folder, name, f'{tag}{part}') for part in range(n_parts)]
+        self._writers = {}
+
+    def write(self, key: pd.Series, values, depth: int = 0):
+        """Раскладывает строки (ключ, значение) по частям; строки без ключа отбрасываются"""
+        codes, keys = _compact_codes(key)
+        key_part = pd.util.hash_array(keys.to_numpy(object), hash_key=_hash_key(depth)) % self.n_parts
+        part = np.where(codes >= 0, key_part[np.maximum(codes, 0)].astype(np.int64), -1)
+        # Устойчивая сортировка сохраняет порядок строк внутри части
+        order = np.argsort(part, kind='stable')
+        bounds = np.searchsorted(part[order], np.arange(self.n_parts + 1))
+        dictionary = pa.array(keys.to_numpy(object), pa.string())
+        values = pa.array(values).cast(self.schema.field('value').type)
+        for p in range(self.n_parts):
+            rows = order[bounds[p]:bounds[p + 1]]
+            if not len(rows):
+                continue
+            table = pa.Table.from_arrays([dictionary.take(pa.array(codes[rows])), values.take(pa.array(rows))],
+                                         schema=self.schema)
+            if p not in self._writers:
+                self._writers[p] = pq.ParquetWriter(self.paths[p], self.schema, compression='snappy',
+                                                    write_statistics=False)
+            self._writers[p].write_table(table)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def _num_rows(path: str) -> int:
+    return pq.ParquetFile(path).metadata.num_rows if os.path.exists(path) else 0
+
+
+def _read_part(path: str, batch: int = None):
+    """Части файла по batch строк (None - весь файл одной частью); строковые колонки - category"""
+    if not os.path.exists(path):
+        return
+    schema = pq.read_schema(path)
+    parquet_file = pq.ParquetFile(path, read_dictionary=[field.name for field in schema if field.type == pa.string()])
+    if batch is None:
+        yield parquet_file.read().to_pandas()
+        return
+    for record_batch in parquet_file.iter_batches(batch_size=batch):
+        yield record_batch.to_pandas()
+
+
+def _join_partition(folder: str, names: tuple, tag: str, join, memory_budget: int, depth: int = 1):
+    """
+    Соединяет части tag двух промежуточных таблиц функцией join(left, right).
+    Часть больше бюджета делится по хешу ключа заново.
+    """
+    paths = [_part_path(folder, name, tag) for name in names]
+    rows = sum(_num_rows(path) for path in paths)
+    if rows > partition_rows(memory_budget) and depth <= MAX_DEPTH:
+        # Часть больше бюджета (например, из-за неточной оценки числа строк CSV) - делим её заново
+        n_parts = min(MAX_PARTS, math.ceil(rows / partition_rows(memory_budget)))
+        for name, path in zip(names, paths):
+            writer = _PartitionWriter(folder, name, n_parts, tag=f'{tag}.')
+            for chunk in _read_part(path, batch_rows(memory_budget)):
+                writer.write(chunk['key'], chunk['value'], depth)
+            writer.close()
+            if os.path.exists(path):
+                os.remove(path)
+        for part in range(n_parts):
+            _join_partition(folder, names, f'{tag}.{part}', join, memory_budget, depth + 1)
+        return
+
+    left, right = (next(_read_part(path), None) for path in paths)
+    if left is not None and right is not None:
+        join(left, right)
+
+
+class _UniqueKeys:
+    """Упорядоченное множество строковых ключей, накапливаемое по частям в Arrow"""
+
+    def __init__(self, limit_rows: int):
+        self.limit_rows = limit_rows
+        self._arrays = []
+        self._rows = 0
+
+    def add(self, values: pd.Series):
+        _, keys = _compact_codes(values)
+        self._arrays.append(pa.array(keys.to_numpy(object), pa.string()))
+        self._rows += len(keys)
+        if self._rows > self.limit_rows:
+            self._compact()
+            # Уникальных ключей больше порога: поднимаем его, чтобы не сжимать после каждой части
+            self.limit_rows = max(self.limit_rows, 2 * self._rows)
+
+    def _compact(self):
+        unique = pc.unique(pa.concat_arrays(self._arrays)) if self._arrays else pa.array([], pa.string())
+        self._arrays, self._rows = [unique], len(unique)
+
+    def index(self) -> pd.Index:
+        self._compact()
+        unique = self._arrays[0]
+        return pd.Index(unique.take(pc.sort_indices(unique)).to_numpy(zero_copy_only=False))
+
+
+def aggregate_rfm_chunked(items_chunks, orders_chunks, customers_chunks, ndays: int,
+                          memory_budget: int = DEFAULT_MEMORY_BUDGET, reference_day=None, expected_rows=None,
+                          spill_folder=None) -> pd.DataFrame:
+    """
+    То же, что rfm_core.aggregate_rfm, по частям таблиц с промежуточными данными на диске.
+    Args:
+        items_chunks: Части позиций заказов (итерируемое DataFrame: order_id, order_item_id, price)
+        orders_chunks: Части заказов (order_id, customer_id, order_status, order_purchase_timestamp)
+        customers_chunks: Части клиентов (customer_id, customer_unique_id)
+        ndays (int): Глубина анализа в днях от даты последнего заказа
+        memory_budget (int): Бюджет памяти на части таблиц, байт
+        reference_day (int): "Сегодняшний" день (дни от 1970-01-01); по умолчанию - день последнего заказа
+        expected_rows (int): Ожидаемое число строк в самом большом соединении (для выбора числа частей)
+        spill_folder (str): Папка для промежуточных файлов (по умолчанию - системная временная)
+    Returns:
+        pd.DataFrame: customer_unique_id, days_since_last_order, orders_count, order_sum
+    """
+    n_parts = min(MAX_PARTS, max(1, math.ceil((expected_rows or 0) / partition_rows(memory_budget))))
+
+    with tempfile.TemporaryDirectory(prefix='rfm-stream-', dir=spill_folder) as folder:
+        writers = {name: _PartitionWriter(folder, name, n_parts) for name in _SPILL_VALUES}
+        records_path = os.path.join(folder, 'records.bin')
+        unique_customers = _UniqueKeys(batch_rows(memory_budget))
+        max_day = None
+        n_orders = 0
+
+        with metrics.stage('rfm_stream.spill', parts=n_parts):
+            for customers in customers_chunks:
+                unique_customers.add(customers['customer_unique_id'])
+                writers['customers'].write(customers['customer_id'], customers['customer_unique_id'])
+
+            with open(records_path, 'wb') as records_file:
+                for orders in orders_chunks:
+                    completed = completed_orders(orders)
+                    days = order_days(orders['order_purchase_timestamp'])
+                    if completed.any():
+                        chunk_max = int(days[completed].max())
+                        max_day = chunk_max if max_day is None else max(max_day, chunk_max)
+                    chunk = np.zeros(len(orders), dtype=_RECORD)
+                    # Код клиента выполненного заказа запишет соединение с клиентами
+                    chunk['uid'] = -1
+                    chunk['day'] = days
+                    records_file.write(chunk.tobytes())
+
+                    rows = n_orders + np.flatnonzero(completed)
+                    writers['orders_by_customer'].write(orders['customer_id'][completed], rows)
+                    writers['orders'].write(orders['order_id'][completed], rows)
+                    n_orders += len(orders)
+
+            for items in items_chunks:
+                values = items['price'].to_numpy(np.float64) * items['order_item_id'].to_numpy(np.float64)
+                writers['items'].write(items['order_id'], values)
+            for writer in writers.values():
+                writer.close()
+
+        uid_keys = unique_customers.index()
+        del unique_customers
+        if reference_day is None:
+            reference_day = max_day if max_day is not None else 0
+        with _open_records(records_path, n_orders) as records:
+            with metrics.stage('rfm_stream.join', parts=n_parts):
+                for part in range(n_parts):
+                    _join_partition(folder, ('customers', 'orders_by_customer'), str(part),
+                                    functools.partial(_join_customers, records, uid_keys), memory_budget)
+                    _join_partition(folder, ('items', 'orders'), str(part),
+                                    functools.partial(_join_items, records), memory_budget)
+
+            with metrics.stage('rfm_stream.reduce'):
+                n = len(uid_keys)
+                counts = np.zeros(n, dtype=np.int64)
+                totals = np.zeros(n, dtype=np.float64)
+                last = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+                step = batch_rows(memory_budget)
+                # Записи складываются по порядку строк заказов - как bincount над всей таблицей в rfm_core
+                for start in range(0, n_orders, step):
+                    chunk = np.array(records[start:start + step])
+                    uid = chunk['uid']
+                    days_delta = reference_day - chunk['day']
+                    selected = (uid >= 0) & (days_delta <= ndays)
+                    uid, days_delta = uid[selected], days_delta[selected]
+                    counts += np.bincount(uid, minlength=n)
+                    np.add.at(totals, uid, chunk['sum'][selected])
+                    np.minimum.at(last, uid, days_delta)
+        return _customer_frame(counts, totals, last, uid_keys)
+
+
+@contextlib.contextmanager
+def _open_records(path: str, n_orders: int):
+    """
+    Файл записей заказов, отображённый в память. Отображение закрывается при выходе -
+    до удаления временной папки; ссылки на массив после выхода недействительны.
+    """
+    if not n_orders:
+        yield np.zeros(0, dtype=_RECORD)
+        return
+    records = np.memmap(path, dtype=_RECORD, mode='r+', shape=(n_orders,))
+    try:
+        yield records
+    finally:
+        records._mmap.close()
+
+
+def _join_customers(records: np.ndarray, uid_keys: pd.Index, customers: pd.DataFrame, orders: pd.DataFrame):
+    """Записывает коды клиентов заказов части в records по номерам строк заказов"""
+    # При повторах customer_id действует последняя строка клиентов, как в rfm_core.customer_codes
+    codes, cid_keys = _codes(customers['key'])
+    uid_by_cid = np.full(len(cid_keys), -1, dtype=np.int64)
+    valid = codes >= 0
+    uid_by_cid[codes[valid]] = _lookup(customers['value'], uid_keys)[valid]
+    positions = _lookup(orders['key'], cid_keys)
+    records['uid'][orders['value'].to_numpy()] = np.where(positions >= 0, uid_by_cid[positions], -1)
+
+
+def _join_items(records: np.ndarray, items: pd.DataFrame, orders: pd.DataFrame):
+    """Записывает суммы заказов части в records по номерам строк заказов"""
+    codes, order_keys = _codes(items['key'])
+    valid = codes >= 0
+    sums = np.bincount(codes[valid], weights=items['value'].to_numpy()[valid], minlength=len(order_keys))
+    positions = _lookup(orders['key'], order_keys)
+    records['sum'][orders['value'].to_numpy()] = np.where(positions >= 0, sums[positions], 0.0)
+
+
+def _expected_rows(fname: str, datasets_folder: str, columnar_folder: str) -> int:
+    rows = dataset_rows(fname, datasets_folder, columnar_folder)
+    if rows is None:
+        rows = os.path.getsize(os.path.join(datasets_folder, fname)) // CSV_BYTES_PER_ROW
+    return rows
+
+
+def rfm_from_datasets(datasets: dict, ndays: int, memory_budget: int = DEFAULT_MEMORY_BUDGET, reference_day=None,
+                      datasets_folder=DATASETS_FOLDER, columnar_folder=COLUMNAR_FOLDER,
+                      spill_folder=None) -> pd.DataFrame:
+    """
+    RFM-признаки по датасетам Olist без загрузки таблиц в память целиком.
+    Args:
+        datasets (dict): {'customers' | 'orders' | 'items': (имя файла, колонки)}, как RFM_DATASETS
+    """
+    batch = batch_rows(memory_budget)
+    chunks = {name: iter_dataset(fname, columns, batch, datasets_folder, columnar_folder)
+              for name, (fname, columns) in datasets.items()}
+    rows = {name: _expected_rows(fname, datasets_folder, columnar_folder) for name, (fname, _) in datasets.items()}
+    expected_rows = max(rows['customers'], rows['items']) + rows['orders']
+    return aggregate_rfm_chunked(chunks['items'], chunks['orders'], chunks['customers'], ndays, memory_budget,
+                                 reference_day, expected_rows, spill_folder)
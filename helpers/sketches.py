@@ -0,0 +1,173 @@
+"""
+Приближённые квантили и подбор границ RFM-сегментов по потоку значений.
+
+KLLSketch строится за один проход по данным (пачками) и занимает O(k log n) памяти.
+Скетчи разных частей данных или разных загрузок объединяются через merge, а квантили
+объединённого скетча имеют ту же гарантию точности, что и у построенного по всем данным.
+"""
+import numpy as np
+import pandas as pd
+
+# Число элементов, хранимых на верхнем уровне скетча: ошибка ранга порядка 1.7 / k
+DEFAULT_K = 200
+# Размер пачки при построении скетча по массиву
+CHUNK_SIZE = 65_536
+
+BREAK_METHODS = ("quantile", "kmeans")
+
+
+class KLLSketch:
+    """
+    Скетч квантилей KLL (Karnin, Lang, Liberty, 2016).
+    Уровень h хранит элементы с весом 2**h; переполненный уровень сортируется,
+    и каждый второй его элемент переносится на следующий уровень.
+    Args:
+        k (int): Ёмкость верхнего уровня
+        seed (int): Зерно генератора, выбирающего чётные или нечётные элементы при сжатии
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # Нечётный элемент остаётся на уровне, чтобы сумма весов сохранялась
+                keep = items[:1] if len(items) % 2 else items[:0]
+                pairs = items[len(keep):]
+                promoted = pairs[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        """Добавляет значения (пропуски пропускаются)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        for start in range(0, len(values), CHUNK_SIZE):
+            chunk = values[start:start + CHUNK_SIZE]
+            self.n += len(chunk)
+            self.min = min(self.min, chunk.min())
+            self.max = max(self.max, chunk.max())
+            self.levels[0] = np.concatenate([self.levels[0], chunk])
+            self._compress()
+        return self
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Объединяет скетч с другим скетчем (например, построенным по другой части данных)"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def weighted_items(self):
+        """Хранимые элементы по возрастанию и их веса"""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2.0 ** level) for level, values in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        """Приближённые квантили уровня q (число или массив от 0 до 1)"""
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        items, weights = self.weighted_items()
+        ranks = np.cumsum(weights) / weights.sum()
+        result = items[np.minimum(np.searchsorted(ranks, q, side="left"), len(items) - 1)]
+        # Крайние квантили известны точно
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+
+    def to_dict(self) -> dict:
+        """Представление для сохранения в JSON"""
+        return {"k": self.k, "n": self.n, "min": float(self.min), "max": float(self.max),
+                "levels": [values.tolist() for values in self.levels]}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "KLLSketch":
+        sketch = cls(state["k"])
+        sketch.n, sketch.min, sketch.max = state["n"], state["min"], state["max"]
+        sketch.levels = [np.asarray(values, dtype=np.float64) for values in state["levels"]]
+        return sketch
+
+
+def build_sketches(df: pd.DataFrame, columns, k=DEFAULT_K, seed=0) -> dict:
+    """Скетчи квантилей для колонок DataFrame за один проход по каждой колонке"""
+    return {col: KLLSketch(k, seed).update(df[col].to_numpy()) for col in columns}
+
+
+def merge_sketches(parts) -> dict:
+    """Объединяет словари скетчей {колонка: KLLSketch}, построенные по частям данных"""
+    merged = {}
+    for sketches in parts:
+        for col, sketch in sketches.items():
+            merged.setdefault(col, KLLSketch(sketch.k)).merge(sketch)
+    return merged
+
+
+def quantile_breaks(sketch: KLLSketch, n_classes=3) -> np.ndarray:
+    """Границы, делящие значения на n_classes групп равной численности"""
+    return sketch.quantile(np.arange(1, n_classes) / n_classes)
+
+
+def kmeans_breaks(sketch: KLLSketch, n_classes=3, log=False, n_iter=100) -> np.ndarray:
+    """
+    Естественные разрывы (в духе Дженкса): одномерный k-means по взвешенным элементам скетча,
+    границы - середины между центрами соседних групп.
+    Args:
+        log (bool): Искать разрывы в логарифмической шкале (для сумм с тяжёлым хвостом)
+    """
+    items, weights = sketch.weighted_items()
+    if len(items) == 0:
+        return np.full(n_classes - 1, np.nan)
+    points = np.log1p(np.maximum(items, 0)) if log else items
+    # Начальные центры - квантили, итерации Ллойда сходятся за несколько шагов
+    ranks = np.cumsum(weights) / weights.sum()
+    centers = points[np.minimum(np.searchsorted(ranks, (np.arange(n_classes) + 0.5) / n_classes), len(points) - 1)]
+    for _ in range(n_iter):
+        breaks = (centers[1:] + centers[:-1]) / 2
+        labels = np.searchsorted(breaks, points, side="right")
+        sums = np.bincount(labels, weights=weights * points, minlength=n_classes)
+        totals = np.bincount(labels, weights=weights, minlength=n_classes)
+        updated = np.where(totals > 0, sums / np.maximum(totals, 1e-12), centers)
+        if np.allclose(updated, centers):
+            break
+        centers = np.sort(updated)
+    breaks = (centers[1:] + centers[:-1]) / 2
+    return np.expm1(breaks) if log else breaks
+
+
+def suggest_boundaries(sketch: KLLSketch, method="quantile", integer=False, log=False) -> tuple:
+    """
+    Границы трёх сегментов для слайдеров make_segmentation и пакетного расчёта.
+    Для целочисленных признаков границы округляются вверх и не совпадают друг с другом.
+    Returns:
+        tuple: (нижняя граница, верхняя граница)
+    """
+    breaks = kmeans_breaks(sketch, log=log) if method == "kmeans" else quantile_breaks(sketch)
+    low, high = (float(value) for value in breaks)
+    if integer:
+        # Сегмент начинается со значения, не меньшего границы; нижний сегмент не должен быть пустым,
+        # даже если большинство значений совпадает (например, один заказ у большинства клиентов)
+        low = max(int(np.ceil(low)), int(sketch.min) + 1)
+        high = max(int(np.ceil(high)), low + 1)
+    return low, high
@@ -2,11 +2,15 @@ import streamlit as st
 import pandas as pd
 from helpers.funtions import  get_grid
 
-from helpers.funtions import (read_template, load_lottiefile)
-from helpers.ABC_functions import select, print_abc_results, print_xyz_results
+from helpers import metrics
+from helpers.funtions import (read_template, load_lottiefile, metrics_panel)
+from helpers.ABC_functions import get_result_cache, prefetch_queries, print_abc_results, print_xyz_results
 from streamlit_lottie import st_lottie
 
 st.set_page_config(layout="wide")
+metrics.begin_run("ABC_XYZ_analysis")
+# Все запросы страницы выполняются параллельно, пока выводятся шаблоны
+queries = prefetch_queries()
 
 col1, col2 = st.columns([1, 4])
 with col1:
@@ -21,7 +25,7 @@ st.markdown(read_template("ABC/002.md"))
 with st.expander("Описание и пример исходных данных"):
     st.markdown(read_template("ABC/003 table_desc.md"))
     st.markdown("Пример данных:")
-    st.table(select("SELECT dr_dat, dr_ndrugs, dr_kol, dr_croz, dr_czak, dr_sdisc FROM apteka.sales LIMIT 5"))
+    st.table(queries.result("sample"))
 with st.expander("Подключение в PostgreSQL"):
     st.markdown(read_template("ABC/004 sql engine.md"))
 with st.expander("SQL код, группирующий товары по уникальному наименованию товарной позиции и выполняющий агрегации"):
@@ -39,7 +43,7 @@ with st.expander("SQL код для анализа вариативности с
     st.markdown(read_template("ABC/009 xyz_sql.md"))
 xyz = print_xyz_results()
 
-get_grid(pd.merge(abc.data, xyz.data, how='inner', on = "Наименование товарной позиции"), **{
+get_grid(pd.merge(abc.data, xyz.data, how='inner', on = "Наименование товарной позиции"), key="abc_xyz_grid", **{
         "columnDefs": [
             {"field": "Наименование товарной позиции"},
             {"field": "По числу проданных позиций"},
@@ -52,4 +56,4 @@ get_grid(pd.merge(abc.data, xyz.data, how='inner', on = "Наименовани
         ]
     })
 
-
+metrics_panel(get_result_cache())